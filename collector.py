@@ -1,26 +1,32 @@
-import spoty.plugins.collector.collector_plugin as col
-import spoty.plugins.collector.collector_cache as cache
 from spoty.plugins.collector.collector_classes import *
-import spoty.utils
-from spoty import spotify_api
-from spoty import csv_playlist
-from spoty.commands.spotify_like_commands import like_import
+from spoty.plugins.collector.collector_settings import settings, settings_file_name, listened_file_name, \
+    mirrors_file_name
 import click
-import re
-import os.path
-from datetime import datetime, timedelta
+import sys
 from typing import List
-from spoty import utils
 
-settings = col.settings
+# heavy modules (spotify api, numpy, multiprocessing) are imported by the commands that need them
 
 
 @click.group("collector")
-def collector():
+@click.option('--requests-stats', is_flag=True,
+              help='Print Spotify requests statistics by endpoints when the command is finished.')
+@click.pass_context
+def collector(ctx, requests_stats):
     """
 Plugin for collecting music in spotify.
     """
-    pass
+    if requests_stats:
+        def print_requests_stats():
+            import spoty.plugins.collector.collector_spotify as spotify
+            spotify.print_metrics()
+
+        ctx.call_on_close(print_requests_stats)
+
+    # playlists downloaded by previous commands of the daemon are revalidated by snapshot id
+    col = sys.modules.get('spoty.plugins.collector.collector_plugin')
+    if col is not None:
+        col.begin_fetch_scope()
 
 
 @collector.command("config")
@@ -28,10 +34,10 @@ def config():
     """
 Prints configuration parameters.
     """
-    click.echo(f'Settings file name: {col.settings_file_name}')
+    click.echo(f'Settings file name: {settings_file_name}')
     click.echo(f'--------- SETTINGS: ----------')
-    click.echo(f'LISTENED_FILE_NAME: {col.listened_file_name}')
-    click.echo(f'MIRRORS_FILE_NAME: {col.mirrors_file_name}')
+    click.echo(f'LISTENED_FILE_NAME: {listened_file_name}')
+    click.echo(f'MIRRORS_FILE_NAME: {mirrors_file_name}')
 
 
 @collector.command("sub")
@@ -57,7 +63,9 @@ If NONE is specified as the group name, then the name pattern will not be used.
 
 If the name of the mirror is not specified, then the name of each playlist that we subscribe to will be used as the name. If a name is specified, then all listed playlists will use the same mirror name and as a result, they will be merged into one playlist.
     """
-    playlist_ids = spoty.utils.tuple_to_list(playlist_ids)
+    import spoty.plugins.collector.collector_plugin as col
+
+    playlist_ids = list(playlist_ids)
     new_subs, new_mirrors = col.subscribe(playlist_ids, mirror_name, group, from_cache, False)
     mirrors = col.read_mirrors()
     all_subs = col.mirrors_dict_by_sub_playlist_ids(mirrors)
@@ -84,7 +92,9 @@ def unsubscribe(playlist_ids, group, filter_names, do_not_remove, confirm):
 Unsubscribe from the specified playlists.
 PLAYLIST_IDS - IDs or URIs of subscribed playlists or mirror playlists
     """
-    playlist_ids = spoty.utils.tuple_to_list(playlist_ids)
+    import spoty.plugins.collector.collector_plugin as col
+
+    playlist_ids = list(playlist_ids)
 
     mirrors = col.read_mirrors()
     all_subs = col.mirrors_dict_by_sub_playlist_ids(mirrors)
@@ -114,7 +124,9 @@ def list_mirrors(playlist_ids, group, filter_names):
     """
 Display a list of mirrors and subscribed playlists.
     """
-    playlist_ids = spoty.utils.tuple_to_list(playlist_ids)
+    import spoty.plugins.collector.collector_plugin as col
+
+    playlist_ids = list(playlist_ids)
 
     if group is None and filter_names is None and len(playlist_ids) == 0:
         mirrors = col.read_mirrors()
@@ -139,10 +151,12 @@ Display a list of mirrors and subscribed playlists.
               help='Do not remove mirror playlists.')
 @click.option('--do-not-update-cached', '-C', is_flag=True,
               help='Do not update cached playlists.')
+@click.option('--full', '-f', is_flag=True,
+              help='Read subscribed playlists of all mirrors, even if they have not changed since the last update.')
 @click.option('--confirm', '-y', is_flag=True,
               help='Do not ask for delete mirror playlist confirmation.')
 @click.argument("playlist_ids", nargs=-1)
-def update(group, do_not_remove, confirm, playlist_ids, do_not_update_cached):
+def update(group, do_not_remove, confirm, playlist_ids, do_not_update_cached, full):
     """
 Update mirrors.
 
@@ -151,9 +165,13 @@ When executed, the following will happen:
 - A mirror playlist will be created in your library for each subscription if not already created.
 - New tracks from subscribed playlists will be added to exist mirror playlists. Tracks that you have already listened to will not be added to the mirrored playlist.
 - All tracks with likes will be added to listened list and removed from mirror playlists.
+
+Subscribed playlists are not read again for mirrors whose subscribed playlists, mirror playlist and listened list have not changed since the last update. Liked tracks are moved from such mirrors anyway.
     """
-    playlist_ids = spoty.utils.tuple_to_list(playlist_ids)
-    col.update(not do_not_remove, confirm, playlist_ids, group, not do_not_update_cached)
+    import spoty.plugins.collector.collector_plugin as col
+
+    playlist_ids = list(playlist_ids)
+    col.update(not do_not_remove, confirm, playlist_ids, group, not do_not_update_cached, full)
 
 
 @collector.command("del")
@@ -165,7 +183,9 @@ def delete(playlist_ids, confirm):
 Delete playlists.
 All specified playlists will be processed as listened and deleted.
     """
-    playlist_ids = spoty.utils.tuple_to_list(playlist_ids)
+    import spoty.plugins.collector.collector_plugin as col
+
+    playlist_ids = list(playlist_ids)
     deleted = col.delete(playlist_ids, confirm)
     click.echo(f'{len(deleted)} playlists deleted.')
 
@@ -194,7 +214,9 @@ When executed, the following will happen:
 - All empty playlists will be deleted.
 You can skip any of this step by options.
     """
-    playlist_ids = spoty.utils.tuple_to_list(playlist_ids)
+    import spoty.plugins.collector.collector_plugin as col
+
+    playlist_ids = list(playlist_ids)
 
     all_tags_list, all_added_to_listened, all_removed_liked, all_removed_listened, all_removed_duplicates = \
         col.process_listened_playlists(playlist_ids, not no_remove_if_empty, not no_remove_liked,
@@ -221,7 +243,9 @@ def optimize_listened():
     """
 Delete duplicates in listened list.
     """
-    good, duplicates = col.clean_listened()
+    import spoty.plugins.collector.collector_listened as lis
+
+    good, duplicates = lis.clean_listened()
     total_count = len(good) + len(duplicates)
     if len(duplicates) > 0:
         click.echo(f'{len(duplicates)} duplicated tracks removed (listened tracks remain: {len(good)}).')
@@ -235,7 +259,9 @@ def all_listened_like(ctx):
     """
 Read listened tracks list and like all tracks in spotify user library.
     """
-    ctx.invoke(like_import, file_names=[col.listened_file_name])
+    from spoty.commands.spotify_like_commands import like_import
+
+    ctx.invoke(like_import, file_names=[listened_file_name])
 
 
 @collector.command("all-listened-unlike")
@@ -244,7 +270,9 @@ def all_listened_unlike(ctx):
     """
 Read listened tracks list and unlike all tracks in spotify user library.
     """
-    ctx.invoke(like_import, file_names=[col.listened_file_name], unlike=True)
+    from spoty.commands.spotify_like_commands import like_import
+
+    ctx.invoke(like_import, file_names=[listened_file_name], unlike=True)
 
 
 @collector.command("optimize-mirrors-list")
@@ -252,9 +280,78 @@ def optimize_mirrors_list():
     """
 Sort mirrors in the mirrors file and check for subscribed playlist id duplicates.
     """
+    import spoty.plugins.collector.collector_plugin as col
+
     col.sort_mirrors()
 
 
+# keys of cache-find-best parameter sets: [key] = [argument name, type]
+FIND_BEST_SET_KEYS = {
+    'min-not-listened': ['min_not_listened', int], 'mnl': ['min_not_listened', int],
+    'min-listened': ['min_listened', int], 'ml': ['min_listened', int],
+    'min-ref-percentage': ['min_ref_percentage', int], 'mrp': ['min_ref_percentage', int],
+    'min-ref-tracks': ['min_ref_tracks', int], 'mrt': ['min_ref_tracks', int],
+    'listened-accuracy': ['listened_accuracy', int], 'la': ['listened_accuracy', int],
+    'fav_weight': ['fav_weight', float], 'fw': ['fav_weight', float],
+    'ref_weight': ['ref_weight', float], 'rw': ['ref_weight', float],
+    'prob_weight': ['prob_weight', float], 'pw': ['prob_weight', float],
+    'sorting': ['sorting', str], 's': ['sorting', str],
+    'reverse-sorting': ['reverse_sorting', bool],
+    'filter-names': ['filter_names', str], 'fn': ['filter_names', str],
+    'ref': ['ref', str], 'r': ['ref', str],
+    'ref-id': ['ref_id', list], 'rid': ['ref_id', list],
+}
+
+FIND_BEST_SORTINGS = ['fav-number', 'fav-percentage', 'ref-number', 'ref-percentage', 'list-number',
+                      'list-percentage', 'track-number', 'fav-points', 'ref-points', 'prob-points', 'points']
+
+
+def parse_find_best_set(value: str) -> dict:
+    import shlex
+
+    try:
+        items = shlex.split(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+    args = {}
+    for item in items:
+        key, sep, arg = item.partition('=')
+        key = key.lstrip('-').lower()
+        if sep == "" or key not in FIND_BEST_SET_KEYS:
+            raise click.BadParameter(f'unknown key "{key}"')
+        name, arg_type = FIND_BEST_SET_KEYS[key]
+        try:
+            if arg_type == bool:
+                args[name] = arg.lower() in ['1', 'true', 'yes', 'y']
+            elif arg_type == list:
+                args[name] = [id for id in arg.split(',') if id != ""]
+            else:
+                args[name] = arg_type(arg)
+        except ValueError:
+            raise click.BadParameter(f'invalid value "{arg}" of "{key}"')
+        if name == 'sorting':
+            if arg.lower() not in FIND_BEST_SORTINGS:
+                raise click.BadParameter(f'invalid value "{arg}" of "{key}", '
+                                         f'choose from {", ".join(FIND_BEST_SORTINGS)}')
+            args[name] = arg.lower()
+    return args
+
+
+def get_ref_playlist_ids(lib: UserLibrary, ref: str, ref_ids: List[str]) -> List[str]:
+    import re
+
+    ref_playlist_ids = list(ref_ids)
+    if ref:
+        for playlist in lib.all_playlists:
+            if re.findall(ref, playlist['name']):
+                ref_playlist_ids.append(playlist['id'])
+        if len(ref_playlist_ids) == 0:
+            click.echo(f'No playlists were found in the user library that matched the regular expression filter.')
+            exit()
+    return ref_playlist_ids
+
+
 def print_playlist_infos(infos: List[PlaylistInfo], limit: int = None):
     if len(infos) == 0:
         click.echo(f'No playlists found matching the query.')
@@ -313,6 +410,7 @@ Find public playlists by specified search query and cache them (save to csv file
 Example:
 spoty plug collector cache-add "jazz"
     """
+    import spoty.plugins.collector.collector_cache as cache
 
     downloaded, exist, overwritten, all_was_cached = \
         cache.cache_add_by_name(search_query, limit, False, overwrite, False, expired_min, not no_catalog)
@@ -337,8 +435,9 @@ def cache_add_id(playlist_ids, overwrite, expired_min, no_catalog):
     """
 Cache playlist with specified id (save to csv files on disk).
     """
+    import spoty.plugins.collector.collector_cache as cache
 
-    playlist_ids = spoty.utils.tuple_to_list(playlist_ids)
+    playlist_ids = list(playlist_ids)
     downloaded, exist, overwritten, all_was_cached = \
         cache.cache_add_by_ids(playlist_ids, False, overwrite, False, expired_min, not no_catalog)
 
@@ -356,8 +455,10 @@ def playlist_info(playlist_ids):
 Print info about specified playlists.
 Provide playlist IDs or  URIs as argument.
     """
+    import spoty.plugins.collector.collector_plugin as col
+
     lib = col.get_user_library()
-    ref_playlist_ids = spoty.utils.tuple_to_list(playlist_ids)
+    ref_playlist_ids = list(playlist_ids)
     infos = col.playlist_info(lib, ref_playlist_ids)
     print_playlist_infos(infos)
 
@@ -404,11 +505,30 @@ Provide playlist IDs or  URIs as argument.
               help='Regular expression to take reference playlists from the library.')
 @click.option('--ref-id', '--rid', type=str, multiple=True,
               help='IDs or URIs to take reference playlists from the library.')
+@click.option('--sweep', type=str, multiple=True,
+              help='Parameter set, for example "fw=2 la=1000 ref=\'^= RAP\'". Can be used several times. '
+                   'Cached playlists are read once and a separate result is printed for each set. '
+                   'Options not specified in the set are taken from the command line.')
+@click.option('--sweep-file', type=click.Path(exists=True, dir_okay=False),
+              help='File with parameter sets, one set per line (see --sweep).')
+@click.option('--time-budget', '--tb', type=float,
+              help='Stop the search after the given number of seconds. Cached playlists are read in random order '
+                   'and the current best playlists are printed while the search is running.')
+@click.option('--worker', '--w', type=str, multiple=True,
+              help='Address (host:port) of a cache scan worker (see cache-scan-worker). Can be used several times. '
+                   'Each worker scans its partition of the cache and the results are merged.')
+@click.option('--local-workers', type=int, default=0, show_default=True,
+              help='Start the given number of cache scan workers on this host and split the cache between them.')
+@click.option('--memory-limit', type=float,
+              help='Memory limit of the search in MB (0 - unlimited, SCAN_MEMORY_LIMIT_MB in the settings by default). '
+                   'Fewer processes are used, only the best playlists are kept and the peak memory of each stage '
+                   'is printed.')
 @click.option('--confirm', '-y', is_flag=True,
               help='Do not ask for any confirmations.')
 def find_best_in_cache(filter_names, min_not_listened, limit, min_listened, min_ref_percentage, min_ref_tracks,
                        sorting, reverse_sorting, listened_accuracy, fav_weight, ref_weight, prob_weight,
-                       subscribe_count, subscribe_group, ref, ref_id, confirm):
+                       subscribe_count, subscribe_group, ref, ref_id, sweep, sweep_file, time_budget, worker,
+                       local_workers, memory_limit, confirm):
     """
 Searches through cached playlists and finds the best ones.
 
@@ -429,24 +549,216 @@ spoty plug collector cache-find-best --fn "female" --sub 10 --ref "^= RAP|^#SYNC
 
 To speed up the library search, you can temporarily cache your library using the command: --library-cache-make
 
+\b
+To compare several parameter sets, use --sweep or --sweep-file. The cache is scanned only once for all sets.
+Keys of a set are the option names without dashes: ml, mnl, mrp, mrt, la, fw, rw, pw, s, reverse-sorting, fn, r or ref, rid (comma separated).
+spoty plug collector cache-find-best --sweep "fw=1 pw=0" --sweep "fw=2 pw=1 la=1000" --sweep "ref='^= RAP'"
+
+\b
+To get the results in a fixed time on a large cache, use --time-budget. Only a random part of the cache may be scanned.
+spoty plug collector cache-find-best --time-budget 30
+
+\b
+To scan a cache split between several hosts, run cache-scan-worker on each host and pass their addresses.
+spoty plug collector cache-find-best --w host1:8765 --w host2:8765
+
+\b
+To search a large cache on a host with little memory, use --memory-limit.
+spoty plug collector cache-find-best --memory-limit 500
+
     """
-    ref_playlist_ids = spoty.utils.tuple_to_list(ref_id)
+    import spoty.plugins.collector.collector_plugin as col
+    import spoty.plugins.collector.collector_cache as cache
 
     lib = col.get_user_library()
 
-    if ref:
-        for playlist in lib.all_playlists:
-            if re.findall(ref, playlist['name']):
-                ref_playlist_ids.append(playlist['id'])
-        if len(ref_playlist_ids) == 0:
-            click.echo(f'No playlists were found in the user library that matched the regular expression filter.')
+    if sweep or sweep_file:
+        if subscribe_count > 0:
+            click.echo('--subscribe-count cannot be used with parameter sets.')
             exit()
 
-    infos, tracks_total, unique_tracks = cache.cache_find_best(lib, ref_playlist_ids, min_not_listened,
-                                                               min_listened,
-                                                               min_ref_percentage, min_ref_tracks, sorting,
-                                                               reverse_sorting, filter_names, listened_accuracy,
-                                                               fav_weight, ref_weight, prob_weight)
+        sets = list(sweep)
+        if sweep_file:
+            with open(sweep_file, 'r', encoding='utf-8-sig') as file:
+                for line in file:
+                    line = line.strip()
+                    if line != "" and not line.startswith('#'):
+                        sets.append(line)
+
+        defaults = {
+            'min_not_listened': min_not_listened, 'min_listened': min_listened,
+            'min_ref_percentage': min_ref_percentage, 'min_ref_tracks': min_ref_tracks,
+            'sorting': sorting, 'reverse_sorting': reverse_sorting, 'filter_names': filter_names,
+            'listened_accuracy': listened_accuracy, 'fav_weight': fav_weight, 'ref_weight': ref_weight,
+            'prob_weight': prob_weight, 'ref': ref, 'ref_id': list(ref_id),
+        }
+        params_list = []
+        ref_tracks_cache = {}
+        for value in sets:
+            try:
+                args = dict(defaults)
+                args.update(parse_find_best_set(value))
+            except click.BadParameter as e:
+                click.echo(f'Invalid parameter set "{value}": {e.message}')
+                exit()
+            ref_playlist_ids = get_ref_playlist_ids(lib, args.pop('ref'), args.pop('ref_id'))
+            params_list.append(cache.create_find_best_params(lib, ref_playlist_ids, **args,
+                                                             ref_tracks_cache=ref_tracks_cache))
+
+        results = find_best_batch(params_list, worker, local_workers, time_budget, memory_limit, limit)
+        for i, (value, infos) in enumerate(zip(sets, results)):
+            click.echo(f'\n########## Parameter set {i + 1} / {len(sets)}: {value} ##########')
+            print_playlist_infos(infos, limit)
+        return
+
+    ref_playlist_ids = get_ref_playlist_ids(lib, ref, list(ref_id))
+
+    params = cache.create_find_best_params(lib, ref_playlist_ids, min_not_listened, min_listened, min_ref_percentage,
+                                           min_ref_tracks, sorting, reverse_sorting, filter_names, listened_accuracy,
+                                           fav_weight, ref_weight, prob_weight)
+    infos = find_best_batch([params], worker, local_workers, time_budget, memory_limit,
+                            max(limit, subscribe_count))[0]
+    print_playlist_infos(infos, limit)
+
+    if subscribe_count > 0 and len(infos) > 0:
+        if not confirm and not click.confirm(
+                f'Are you sure you want to add top {subscribe_count} playlists to the library?',
+                abort=True):
+            click.echo("\nAborted")
+            exit()
+        click.echo("\n")
+        cache.sub_top_playlists_from_cache(infos, subscribe_count, subscribe_group)
+
+
+# retain_count - the number of the best playlists needed, the others are not kept when the memory is limited
+def find_best_batch(params_list: List[FindBestTracksParams], workers: List[str], local_workers: int,
+                    time_budget: float, memory_limit: float = None,
+                    retain_count: int = None) -> List[List[PlaylistInfo]]:
+    import spoty.plugins.collector.collector_cache as cache
+
+    if len(workers) > 0 or local_workers > 0:
+        import spoty.plugins.collector.collector_distributed as distributed
+
+        # the workers return only the playlists needed, so the top size is the number of kept playlists
+        if len(workers) > 0:
+            return distributed.find_best_distributed(params_list, list(workers), retain_count, time_budget,
+                                                     memory_limit)[0]
+        return distributed.find_best_with_local_workers(params_list, local_workers, retain_count, time_budget,
+                                                        memory_limit)[0]
+    return cache.cache_find_best_batch(params_list, time_budget, None, memory_limit, retain_count)[0]
+
+
+@collector.command("cache-scan-worker")
+@click.option('--host', type=str, default='127.0.0.1', show_default=True,
+              help='Address to listen on. Use 0.0.0.0 to accept requests from other hosts.')
+@click.option('--port', type=int, default=settings.COLLECTOR.SCAN_WORKER_PORT, show_default=True,
+              help='Port to listen on.')
+@click.option('--partition', '--p', type=str, default='1/1', show_default=True,
+              help='Partition of the cache scanned by this worker as "index/count". '
+                   'Playlists are split between partitions by the hash of their ids.')
+def run_cache_scan_worker(host, port, partition):
+    """
+\b
+Run a cache scan worker for cache-find-best --worker.
+The worker scans cached playlists of its partition and sends the best of them to the coordinator.
+Each host can keep only the playlists of its partition in its cache folder.
+Requests are signed with SCAN_WORKER_KEY from the settings, it must be the same on the coordinator and all workers.
+
+\b
+Example (two hosts):
+spoty plug collector cache-scan-worker --host 0.0.0.0 --p 1/2
+spoty plug collector cache-scan-worker --host 0.0.0.0 --p 2/2
+    """
+    import spoty.plugins.collector.collector_distributed as distributed
+
+    try:
+        partition = distributed.parse_partition(partition)
+    except click.BadParameter as e:
+        click.echo(f'Invalid partition "{partition}": {e.message}')
+        exit()
+    key = distributed.get_worker_key()
+    if key is None:
+        click.echo('Set SCAN_WORKER_KEY in the settings to accept requests of the coordinator.')
+        exit()
+    distributed.serve(host, port, partition, key)
+
+
+@collector.command("cache-find-similar")
+@click.option('--ref', '--r', type=str,
+              help='Regular expression to take reference playlists from the library.')
+@click.option('--ref-id', '--rid', type=str, multiple=True,
+              help='IDs or URIs to take reference playlists from the library.')
+@click.option('--candidates', '--c', type=int, default=1000, show_default=True,
+              help='The number of the most similar cached playlists to score.')
+@click.option('--min-similarity', '--ms', type=float, default=0, show_default=True,
+              help='Skip the playlist if its estimated similarity (0-1) to all reference playlists is less than the given value.')
+@click.option('--min-listened', '--ml', type=int, default=0, show_default=True,
+              help='Skip the playlist if the number of listened tracks is less than the given value.')
+@click.option('--min-not-listened', '--mnl', type=int, default=1, show_default=True,
+              help='Skip the playlist if the number of not listened tracks is less than the given value.')
+@click.option('--min-ref-percentage', '--mrp', type=int, default=0, show_default=True,
+              help='Skip the playlist if the number reference percentage is less than the given value.')
+@click.option('--min-ref-tracks', '--mrt', type=int, default=1, show_default=True,
+              help='Skip the playlist if the number reference tracks is less than the given value.')
+@click.option('--listened-accuracy', '--la', type=int, default=100, show_default=True,
+              help='The number of fav-points will decrease if the number of listened tracks is lower than the specified.')
+@click.option('--fav_weight', '--fw', type=float, default=1, show_default=True,
+              help='The weight of fav_points, which affects the final points score.')
+@click.option('--ref_weight', '--rw', type=float, default=1, show_default=True,
+              help='The weight of ref_points, which affects the final points score.')
+@click.option('--prob_weight', '--pw', type=float, default=1, show_default=True,
+              help='The weight of prob_points, which affects the final points score.')
+@click.option('--limit', type=int, default=1000, show_default=True,
+              help='Limit the number of printed playlists.')
+@click.option('--sorting', '--s', default="points",
+              type=click.Choice(
+                  ['fav-number', 'fav-percentage',
+                   'ref-number', 'ref-percentage',
+                   'list-number', 'list-percentage',
+                   'track-number',
+                   'fav-points', 'ref-points', 'prob-points', 'points'],
+                  case_sensitive=False),
+              help='Sort resulting list by selected value.')
+@click.option('--reverse-sorting', '-r', is_flag=True,
+              help='Reverse sorting.')
+@click.option('--filter-names', '--fn',
+              help='Get only playlists whose names matches this regex filter')
+@click.option('--subscribe-count', '--sub', type=int, default=0, show_default=True,
+              help='Add playlists to library. Specify how many top playlists to add.')
+@click.option('--subscribe-group', '--group', '--g', type=str, default=settings.COLLECTOR.DEFAULT_MIRROR_GROUP,
+              show_default=True,
+              help='Group playlists under a given name for convenience. Used in conjunction with --subscribe-count.')
+@click.option('--confirm', '-y', is_flag=True,
+              help='Do not ask for any confirmations.')
+def find_similar_in_cache(ref, ref_id, candidates, min_similarity, min_listened, min_not_listened, min_ref_percentage,
+                          min_ref_tracks, listened_accuracy, fav_weight, ref_weight, prob_weight, limit, sorting,
+                          reverse_sorting, filter_names, subscribe_count, subscribe_group, confirm):
+    """
+Finds cached playlists similar to the reference playlists.
+
+\b
+Unlike cache-find-best, not all cached playlists are read. Playlists with many tracks in common with any of the reference playlists are found using the similarity index of the cache (MinHash signatures of the playlists), and only these candidates are scored the same way as in cache-find-best.
+The index is updated automatically when the cache changes.
+
+\b
+Example:
+spoty plug collector cache-find-similar --ref "^= RAP|^#SYNC RAP" --c 2000 --sub 10
+    """
+    import spoty.plugins.collector.collector_plugin as col
+    import spoty.plugins.collector.collector_cache as cache
+
+    if not ref and len(ref_id) == 0:
+        click.echo('Specify reference playlists using --ref or --ref-id.')
+        exit()
+
+    lib = col.get_user_library()
+    ref_playlist_ids = get_ref_playlist_ids(lib, ref, list(ref_id))
+
+    infos, tracks_total, unique_tracks = cache.cache_find_similar(lib, ref_playlist_ids, candidates, min_similarity,
+                                                                  min_not_listened, min_listened, min_ref_percentage,
+                                                                  min_ref_tracks, sorting, reverse_sorting,
+                                                                  filter_names, listened_accuracy, fav_weight,
+                                                                  ref_weight, prob_weight)
     print_playlist_infos(infos, limit)
 
     if subscribe_count > 0 and len(infos) > 0:
@@ -459,19 +771,134 @@ To speed up the library search, you can temporarily cache your library using the
         cache.sub_top_playlists_from_cache(infos, subscribe_count, subscribe_group)
 
 
+@collector.command("profile-save")
+@click.option('--ref', '--r', type=str,
+              help='Regular expression to take reference playlists from the library.')
+@click.option('--ref-id', '--rid', type=str, multiple=True,
+              help='IDs or URIs to take reference playlists from the library.')
+@click.option('--min-listened', '--ml', type=int, default=0, show_default=True,
+              help='Skip the playlist if the number of listened tracks is less than the given value.')
+@click.option('--min-not-listened', '--mnl', type=int, default=1, show_default=True,
+              help='Skip the playlist if the number of not listened tracks is less than the given value.')
+@click.option('--min-ref-percentage', '--mrp', type=int, default=0, show_default=True,
+              help='Skip the playlist if the number reference percentage is less than the given value.')
+@click.option('--min-ref-tracks', '--mrt', type=int, default=1, show_default=True,
+              help='Skip the playlist if the number reference tracks is less than the given value.')
+@click.option('--listened-accuracy', '--la', type=int, default=100, show_default=True,
+              help='The number of fav-points will decrease if the number of listened tracks is lower than the specified.')
+@click.option('--fav_weight', '--fw', type=float, default=1, show_default=True,
+              help='The weight of fav_points, which affects the final points score.')
+@click.option('--ref_weight', '--rw', type=float, default=1, show_default=True,
+              help='The weight of ref_points, which affects the final points score.')
+@click.option('--prob_weight', '--pw', type=float, default=1, show_default=True,
+              help='The weight of prob_points, which affects the final points score.')
+@click.option('--sorting', '--s', default="points",
+              type=click.Choice(
+                  ['fav-number', 'fav-percentage',
+                   'ref-number', 'ref-percentage',
+                   'list-number', 'list-percentage',
+                   'track-number',
+                   'fav-points', 'ref-points', 'prob-points', 'points'],
+                  case_sensitive=False),
+              help='Sort resulting list by selected value.')
+@click.option('--reverse-sorting', '-r', is_flag=True,
+              help='Reverse sorting.')
+@click.option('--filter-names', '--fn',
+              help='Get only playlists whose names matches this regex filter')
+@click.argument("name")
+def save_profile(name, ref, ref_id, min_listened, min_not_listened, min_ref_percentage, min_ref_tracks,
+                 listened_accuracy, fav_weight, ref_weight, prob_weight, sorting, reverse_sorting, filter_names):
+    """
+\b
+Save the library of the current Spotify user and the search parameters as a profile with the given name.
+Profiles of several users are searched in the cache at once by the cache-find-best-profiles command.
+The profile keeps the library as it is now. Save the profile again to update it.
+
+\b
+Example:
+spoty plug collector profile-save alice --ref "^= RAP" --fw 2
+    """
+    import spoty.plugins.collector.collector_plugin as col
+    import spoty.plugins.collector.collector_cache as cache
+
+    lib = col.get_user_library()
+    ref_playlist_ids = get_ref_playlist_ids(lib, ref, list(ref_id))
+    params = cache.create_find_best_params(lib, ref_playlist_ids, min_not_listened, min_listened, min_ref_percentage,
+                                           min_ref_tracks, sorting, reverse_sorting, filter_names, listened_accuracy,
+                                           fav_weight, ref_weight, prob_weight)
+    cache.write_profile(name, params)
+    click.echo(f'Profile "{name}" saved: {len(lib.listened_tracks.track_ids)} listened tracks, '
+               f'{len(lib.fav_tracks.track_ids)} fav tracks, {len(ref_playlist_ids)} reference playlists.')
+
+
+@collector.command("cache-find-best-profiles")
+@click.option('--limit', type=int, default=1000, show_default=True,
+              help='Limit the number of printed playlists for each profile.')
+@click.option('--time-budget', '--tb', type=float,
+              help='Stop the search after the given number of seconds (see cache-find-best).')
+@click.option('--results-dir', type=click.Path(file_okay=False),
+              help='Write the best playlists of each profile to a separate file in this folder '
+                   '(points, playlist id and name, the best first).')
+@click.argument("names", nargs=-1)
+def find_best_in_cache_for_profiles(limit, time_budget, results_dir, names):
+    """
+\b
+Searches through cached playlists and finds the best ones for each of the saved profiles (see profile-save).
+Each cached playlist is read once and compared with the libraries of all profiles.
+All profiles are used if no names are specified.
+
+\b
+Example:
+spoty plug collector cache-find-best-profiles alice bob --results-dir ./results
+    """
+    import spoty.plugins.collector.collector_cache as cache
+
+    names = list(names) if len(names) > 0 else cache.get_profile_names()
+    if len(names) == 0:
+        click.echo('No profiles found. Use profile-save to create them.')
+        exit()
+
+    results, tracks_total, unique_tracks = cache.cache_find_best_profiles(names, time_budget)
+    for name, infos in zip(names, results):
+        click.echo(f'\n########## Profile: {name} ##########')
+        print_playlist_infos(infos, limit)
+
+    if results_dir:
+        cache.write_profile_results(results_dir, names, results, limit)
+        click.echo(f'\nResults of {len(names)} profiles written to "{results_dir}"')
+
+
 @collector.command("stats")
 @click.option('--no-cache', '-c', is_flag=True,
               help='Do not read cache (it might be long).')
-def stats(no_cache):
+@click.option('--exact', '-e', is_flag=True,
+              help='Read all cached playlists to count tracks exactly (it might be long).')
+def stats(no_cache, exact):
     """
-Cached playlists statistics
+\b
+Cached playlists statistics.
+Numbers of cached playlists and tracks are kept in the cache catalog and read instantly.
+Numbers of unique cached tracks are estimated from sketches kept in the cache folders, use --exact to count them exactly.
     """
+    import spoty.plugins.collector.collector_plugin as col
+    import spoty.plugins.collector.collector_cache as cache
+
     lib = col.get_user_library(None, None, False)
-    params = FindBestTracksParams(lib)
     if not no_cache:
-        cached_playlists, cached_tracks, unique_cached_tracks = cache.get_cached_playlists_info(params, False, True)
-        lib_cached_playlists, lib_cached_tracks, lib_unique_cached_tracks = cache.get_cached_playlists_info(params,
-                                                                                                            True, True)
+        if exact:
+            params = FindBestTracksParams(lib)
+            cached_playlists, cached_tracks, unique_cached_tracks = cache.get_cached_playlists_info(params, False, True)
+            lib_cached_playlists, lib_cached_tracks, lib_unique_cached_tracks = \
+                cache.get_cached_playlists_info(params, True, True)
+            cached_playlists_count = len(cached_playlists)
+            lib_cached_playlists_count = len(lib_cached_playlists)
+            unique_cached_tracks_count = str(len(unique_cached_tracks))
+            lib_unique_cached_tracks_count = str(len(lib_unique_cached_tracks))
+        else:
+            cached_playlists_count, cached_tracks = cache.get_cache_totals(False)
+            lib_cached_playlists_count, lib_cached_tracks = cache.get_cache_totals(True)
+            unique_cached_tracks_count = f'~{cache.get_unique_cached_tracks_estimate(False)}'
+            lib_unique_cached_tracks_count = f'~{cache.get_unique_cached_tracks_estimate(True)}'
     click.echo("\n======================================================================\n")
     click.echo("--------------- SPOTIFY LIBRARY -----------------")
     click.echo(f'Playlists in library                     : {len(lib.all_playlists)}')
@@ -482,12 +909,12 @@ Cached playlists statistics
     click.echo(f'Mirrors                                  : {len(lib.mirrors)}')
     if not no_cache:
         click.echo("-------------------- CACHE ----------------------")
-        click.echo(f'Cached playlists                         : {len(cached_playlists)}')
+        click.echo(f'Cached playlists                         : {cached_playlists_count}')
         click.echo(f'Tracks in cached playlists               : {cached_tracks}')
-        click.echo(f'Unique tracks in cached playlists        : {len(unique_cached_tracks)}')
-        click.echo(f'Cached library playlists                 : {len(lib_cached_playlists)}')
+        click.echo(f'Unique tracks in cached playlists        : {unique_cached_tracks_count}')
+        click.echo(f'Cached library playlists                 : {lib_cached_playlists_count}')
         click.echo(f'Tracks in cached library playlists       : {lib_cached_tracks}')
-        click.echo(f'Unique tracks in cached library playlists: {len(lib_unique_cached_tracks)}')
+        click.echo(f'Unique tracks in cached library playlists: {lib_unique_cached_tracks_count}')
 
 
 @collector.command("library-cache-make")
@@ -499,6 +926,8 @@ Cache user library to reduce the number of requests to spotify.
 Note that further read requests will be made from the cache. To continue queries against the real library, clear the cache.
 Use --cache-library-delete to delete cache.
     """
+    import spoty.plugins.collector.collector_cache as cache
+
     new, old, all_old = cache.cache_user_library(only_new)
 
     click.echo("\n======================================================================\n")
@@ -513,6 +942,8 @@ def library_cache_delete():
 Delete cached library and continue to make requests to the library.
 Use --cache-library to cache playlists.
     """
+    import spoty.plugins.collector.collector_cache as cache
+
     cache.cache_library_delete()
     click.echo(f'Cached library deleted')
 
@@ -522,13 +953,132 @@ def optimize_cache():
     """
 Rescan cache and split large cache folders to the smallest folders for better performance.
     """
+    import spoty.plugins.collector.collector_cache as cache
+
     cache.cache_optimize_multi()
     click.echo(f'Cache optimized')
 
 
 @collector.command("cache-rescan")
-def rescan_cache():
+@click.option('--full', '-f', is_flag=True,
+              help='Rescan all cache folders, not only changed ones.')
+def rescan_cache(full):
     """
 Rescan cache folder
     """
-    cache.rescan_cache_catalog()
+    import spoty.plugins.collector.collector_cache as cache
+
+    cache.rescan_cache_catalog(not full)
+
+
+@collector.command("cache-dedupe")
+@click.option('--min-similarity', '--ms', type=float, default=settings.COLLECTOR.DUPLICATE_SIMILARITY,
+              show_default=True,
+              help='Playlists with estimated similarity (0-1) not less than the given value are duplicates.')
+@click.option('--confirm', '-y', is_flag=True,
+              help='Do not ask for any confirmations.')
+def dedupe_cache(min_similarity, confirm):
+    """
+\b
+Delete exact and near duplicates of cached playlists.
+Playlists with the same or almost the same tracks are grouped into clusters (listed in clusters.txt in the cache folder).
+The playlist with the most tracks is kept from each cluster, other playlists are deleted.
+When searching the cache, duplicates are skipped even if they are not deleted (SKIP_DUPLICATE_PLAYLISTS setting).
+    """
+    import spoty.plugins.collector.collector_cache as cache
+
+    cache.cache_dedupe(min_similarity, confirm)
+
+
+@collector.command("cache-evict")
+@click.option('--max-playlists', '--mp', type=int, default=settings.COLLECTOR.CACHE_MAX_PLAYLISTS, show_default=True,
+              help='Maximum number of cached playlists (0 - unlimited).')
+@click.option('--max-size-mb', '--ms', type=int, default=settings.COLLECTOR.CACHE_MAX_SIZE_MB, show_default=True,
+              help='Maximum size of cached playlists in megabytes (0 - unlimited).')
+@click.option('--max-age-days', '--ma', type=int, default=settings.COLLECTOR.CACHE_MAX_AGE_DAYS, show_default=True,
+              help='Evict playlists not refreshed and not found by cache-find-best for the given number of days '
+                   '(0 - unlimited).')
+@click.option('--confirm', '-y', is_flag=True,
+              help='Do not ask for any confirmations.')
+def evict_cache(max_playlists, max_size_mb, max_age_days, confirm):
+    """
+\b
+Delete cached playlists that exceed the cache limits.
+The limits are set in the settings (CACHE_MAX_*) and are applied automatically after playlists are added to the cache.
+Playlists that were never in the top results of cache-find-best and have the lowest points are evicted first,
+then playlists that were never scored and were refreshed the longest time ago,
+then playlists that were in the top results the longest time ago.
+    """
+    import spoty.plugins.collector.collector_cache as cache
+
+    if cache.cache_evict(max_playlists, max_size_mb, max_age_days, confirm) == 0:
+        click.echo('The cache does not exceed the limits.')
+
+
+@collector.command("watch")
+@click.option('--group', '--g',
+              help='Mirror group name (all if not specified).')
+@click.option('--do-not-remove', '-R', is_flag=True,
+              help='Do not remove empty mirror playlists.')
+@click.option('--requests-per-hour', type=int, default=settings.COLLECTOR.WATCH_REQUESTS_PER_HOUR, show_default=True,
+              help='Maximum number of Spotify requests per hour for all tasks.')
+def run_watch(group, do_not_remove, requests_per_hour):
+    """
+\b
+Run mirrors update, liked tracks processing and cache refresh on schedule until interrupted.
+Intervals of the tasks are specified in the settings (WATCH_*_INTERVAL_MIN, 0 disables the task).
+The work is split into small parts that fit the requests budget, so the requests are spread over time.
+When Spotify responds with "Too many requests", all tasks are paused.
+The tasks make requests with background priority, so commands executed at the same time are not slowed down.
+    """
+    import spoty.plugins.collector.collector_watch as watch
+    import spoty.plugins.collector.collector_spotify as spotify
+
+    tasks = watch.create_watch_tasks(group, not do_not_remove)
+    if len(tasks) == 0:
+        click.echo('All watch tasks are disabled in the settings.')
+        return
+
+    scheduler = watch.WatchScheduler(tasks, requests_per_hour, requests_counter=spotify.get_requests_count)
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        click.echo('Stopped.')
+
+
+@collector.command("daemon")
+def run_daemon():
+    """
+\b
+Run collector daemon.
+The daemon keeps the user library, the listened list and the cache catalog in memory and executes commands sent by "daemon-run".
+Changed files are reloaded automatically.
+Commands that can be executed by the daemon: cache-find-best, info, stats, list, update.
+Confirmations are not possible, so use -y where needed.
+    """
+    import spoty.plugins.collector.collector_daemon as daemon
+
+    daemon.serve(collector)
+
+
+@collector.command("daemon-run", context_settings=dict(ignore_unknown_options=True, allow_interspersed_args=False))
+@click.argument("args", nargs=-1, type=click.UNPROCESSED)
+def daemon_run(args):
+    """
+\b
+Execute collector command by the running daemon (see "daemon --help").
+
+\b
+Example:
+spoty plug collector daemon-run cache-find-best --fn "female" --limit 10
+    """
+    import spoty.plugins.collector.collector_daemon as daemon
+
+    if not daemon.is_running():
+        click.echo('Collector daemon is not running. Start it with "daemon" command.', err=True)
+        exit(1)
+
+    output, exit_code = daemon.send_command(list(args))
+    click.echo(output, nl=False)
+    if exit_code != 0:
+        exit(exit_code)
@@ -0,0 +1,255 @@
+from spoty.plugins.collector.collector_settings import settings
+
+import click
+import contextlib
+import io
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+STARTUP_TIME_BUDGET_MS = settings.COLLECTOR.STARTUP_TIME_BUDGET_MS
+
+# modules that must not be imported by "collector --help"
+STARTUP_FORBIDDEN_MODULES = [
+    'numpy',
+    'multiprocessing',
+    'spoty.spotify_api',
+    'spoty.plugins.collector.collector_plugin',
+    'spoty.plugins.collector.collector_cache',
+]
+
+# files of the offline benchmarks are written to a temporary folder instead of the plugin folder
+OFFLINE_FILE_SETTINGS = {
+    'MIRRORS_FILE_NAME': 'mirrors.txt',
+    'MIRRORS_LOG_FILE_NAME': 'mirrors_log.txt',
+    'MIRRORS_STATE_FILE_NAME': 'mirrors_state.txt',
+    'LISTENED_FILE_NAME': 'listened.csv',
+    'LIBRARY_SNAPSHOT_FILE_NAME': 'library_snapshot.pickle',
+}
+
+# spoty itself is imported before the measurement, the budget is for the collector plugin only
+STARTUP_SCRIPT = '''
+import sys, time, io, contextlib
+import spoty
+before = set(sys.modules)
+start = time.perf_counter()
+import spoty.plugins.collector.collector as collector
+with contextlib.redirect_stdout(io.StringIO()):
+    collector.collector.main(['--help'], prog_name='collector', standalone_mode=False)
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(','.join(sorted(set(sys.modules) - before)))
+'''
+
+
+@click.group("benchmark")
+def benchmark():
+    """
+Collector performance benchmarks.
+    """
+    pass
+
+
+@benchmark.command("startup")
+@click.option('--runs', type=int, default=5, show_default=True,
+              help='Number of runs. The fastest run is compared with the budget.')
+@click.option('--budget-ms', type=int, default=STARTUP_TIME_BUDGET_MS, show_default=True,
+              help='Maximum allowed time to import collector and print "collector --help".')
+def startup(runs, budget_ms):
+    """
+Measure "collector --help" startup time in a fresh interpreter and fail if it exceeds the budget
+or if heavy modules are imported.
+    """
+    elapsed_ms, loaded_modules = measure_startup(runs)
+
+    click.echo(f'Startup time: {elapsed_ms:.1f} ms (budget: {budget_ms} ms)')
+
+    failed = False
+    forbidden = [m for m in STARTUP_FORBIDDEN_MODULES if m in loaded_modules]
+    if len(forbidden) > 0:
+        click.echo(f'Heavy modules imported at startup: {", ".join(forbidden)}', err=True)
+        failed = True
+    if elapsed_ms > budget_ms:
+        click.echo(f'Startup time budget exceeded by {elapsed_ms - budget_ms:.1f} ms', err=True)
+        failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+def measure_startup(runs=5):
+    best = None
+    loaded_modules = set()
+    for i in range(max(1, runs)):
+        res = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], capture_output=True, text=True, check=True)
+        lines = res.stdout.strip().split('\n')
+        elapsed_ms = float(lines[-2]) * 1000
+        loaded_modules |= set(lines[-1].split(','))
+        if best is None or elapsed_ms < best:
+            best = elapsed_ms
+    return best, loaded_modules
+
+
+
+@benchmark.command("watch")
+@click.option('--hours', type=float, default=24, show_default=True,
+              help='Simulated time.')
+@click.option('--mirrors', type=int, default=2000, show_default=True,
+              help='Number of simulated mirrors.')
+@click.option('--cached', type=int, default=20000, show_default=True,
+              help='Number of simulated cached playlists.')
+@click.option('--requests-per-hour', type=int, default=3000, show_default=True,
+              help='Requests budget.')
+@click.option('--rate-limit-probability', type=float, default=0.01, show_default=True,
+              help='Probability that a task run is rate limited.')
+@click.option('--seed', type=int, default=1, show_default=True,
+              help='Random seed.')
+def watch(hours, mirrors, cached, requests_per_hour, rate_limit_probability, seed):
+    """
+Simulate watch scheduler with a fake clock and fake tasks and print how the requests are spread over time.
+    """
+    import spoty.plugins.collector.collector_watch as w
+
+    random.seed(seed)
+    clock = w.FakeClock()
+    requests_by_hours = {}
+
+    def fake_task(items_count, item_requests):
+        cursor = [0]
+
+        def run(max_requests):
+            if random.random() < rate_limit_probability:
+                raise w.RateLimitedError(random.choice([None, 5, 60]))
+            count = min(items_count - cursor[0], max(1, max_requests // item_requests))
+            cursor[0] += count
+            requests = count * item_requests
+            hour = int(clock.now() // 3600)
+            requests_by_hours[hour] = requests_by_hours.get(hour, 0) + requests
+            if cursor[0] >= items_count:
+                cursor[0] = 0
+                return requests, True
+            return requests, False
+
+        return run
+
+    tasks = [
+        w.FuncWatchTask('Mirrors update', w.WATCH_UPDATE_INTERVAL_MIN, fake_task(mirrors, 1), 1),
+        w.FuncWatchTask('Liked tracks processing', w.WATCH_LIKED_INTERVAL_MIN, fake_task(mirrors, 3), 3),
+        w.FuncWatchTask('Cache refresh', w.WATCH_CACHE_INTERVAL_MIN, fake_task(cached, 2), 2),
+    ]
+    scheduler = w.WatchScheduler(tasks, requests_per_hour, clock)
+
+    start = time.perf_counter()
+    cycles = 0
+    pauses = 0
+    end_time = hours * 3600
+    while clock.now() < end_time:
+        scheduler.run_pending()
+        if scheduler.paused_until > clock.now():
+            pauses += 1
+        clock.sleep(scheduler.get_sleep_time())
+        cycles += 1
+    elapsed = time.perf_counter() - start
+
+    hourly = [requests_by_hours.get(h, 0) for h in range(int(hours))]
+    click.echo(f'Simulated {hours} hours in {elapsed:.2f} sec ({cycles} cycles, {pauses} rate limit pauses)')
+    for name, requests in scheduler.requests_by_tasks.items():
+        click.echo(f'{name}: {requests} requests')
+    if len(hourly) > 0:
+        click.echo(f'Requests per hour: min {min(hourly)}, max {max(hourly)}, budget {requests_per_hour}')
+
+
+
+@benchmark.command("update")
+@click.option('--mirrors', type=int, default=1000, show_default=True,
+              help='Number of mirrors (one subscribed playlist per mirror).')
+@click.option('--tracks', type=int, default=100, show_default=True,
+              help='Number of tracks in each subscribed playlist.')
+@click.option('--liked-percentage', type=int, default=5, show_default=True,
+              help='Percentage of liked tracks.')
+@click.option('--latency-ms', type=float, default=0, show_default=True,
+              help='Latency of each fake request.')
+@click.option('--page-size', type=int, default=100, show_default=True,
+              help='Maximum number of items in one page of fake responses.')
+@click.option('--rate-limit-every', type=int, default=0, show_default=True,
+              help='Respond "Too many requests" to every n-th request (0 - never).')
+@click.option('--retry-after', type=float, default=0.01, show_default=True,
+              help='Retry-After of "Too many requests" responses.')
+@click.option('--requests-per-sec', type=float, default=0, show_default=True,
+              help='Rate limiter of the collector (0 - unlimited).')
+@click.option('--seed', type=int, default=1, show_default=True,
+              help='Random seed.')
+def update(**kwargs):
+    """
+Measure mirrors update with a fake in-process Spotify. No network access is needed.
+Prints time and number of requests of the first update, the update without changes and the full update.
+    """
+    args = [sys.executable, '-m', 'spoty.plugins.collector.collector_benchmark', 'update-offline']
+    for name, value in kwargs.items():
+        args.extend([f'--{name.replace("_", "-")}', str(value)])
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        env = dict(os.environ)
+        for name, file_name in OFFLINE_FILE_SETTINGS.items():
+            env[f'COLLECTOR_COLLECTOR__{name}'] = os.path.join(temp_dir, file_name)
+        res = subprocess.run(args, env=env)
+    if res.returncode != 0:
+        sys.exit(res.returncode)
+
+
+@benchmark.command("update-offline", hidden=True)
+@click.option('--mirrors', type=int)
+@click.option('--tracks', type=int)
+@click.option('--liked-percentage', type=int)
+@click.option('--latency-ms', type=float)
+@click.option('--page-size', type=int)
+@click.option('--rate-limit-every', type=int)
+@click.option('--retry-after', type=float)
+@click.option('--requests-per-sec', type=float)
+@click.option('--seed', type=int)
+def update_offline(mirrors, tracks, liked_percentage, latency_ms, page_size, rate_limit_every, retry_after,
+                   requests_per_sec, seed):
+    from spoty.plugins.collector.collector_settings import mirrors_file_name
+    import spoty.plugins.collector.collector_client as client
+    import spoty.plugins.collector.collector_spotify as spotify
+    import spoty.plugins.collector.collector_plugin as col
+    from spoty.plugins.collector.collector_mirrors import format_mirror_line
+
+    if not mirrors_file_name.startswith(tempfile.gettempdir()):
+        click.echo('Offline benchmark must be started by "update" command.', err=True)
+        sys.exit(1)
+
+    rnd = random.Random(seed)
+    fake = client.FakeSpotify(latency_ms, page_size, rate_limit_every, retry_after, seed=seed)
+    pool = fake.add_tracks(max(tracks, mirrors * tracks // 2))
+    fake.liked_track_ids = set(rnd.sample(pool, len(pool) * liked_percentage // 100))
+    with open(mirrors_file_name, 'w', encoding='utf-8-sig') as file:
+        for i in range(mirrors):
+            sub_id = fake.add_playlist(f'Source {i + 1}', rnd.sample(pool, tracks), 'other_user')
+            file.write(format_mirror_line(sub_id, False, col.default_mirror_group, f'{col.mirror_playlist_prefix}{i + 1}'))
+
+    spotify.use_client(client.create_client(fake))
+    if requests_per_sec > 0:
+        spotify.scheduler = spotify.RequestScheduler(requests_per_sec, requests_per_sec, spotify.SPOTIFY_MAX_RETRIES)
+    else:
+        spotify.scheduler = spotify.RequestScheduler(float('inf'), 1, spotify.SPOTIFY_MAX_RETRIES)
+
+    click.echo(f'{mirrors} mirrors, {tracks} tracks per playlist, {len(pool)} tracks total')
+    click.echo('stage : sec : requests : retries')
+    for stage, full_update in [('first update', False), ('update without changes', False), ('full update', True)]:
+        requests_before = fake.requests_count
+        retries_before = sum(m.retries for m in spotify.scheduler.metrics.values())
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            col.begin_fetch_scope()
+            col.update(True, True, None, None, True, full_update)
+        elapsed = time.perf_counter() - start
+        retries = sum(m.retries for m in spotify.scheduler.metrics.values()) - retries_before
+        click.echo(f'{stage} : {elapsed:.2f} : {fake.requests_count - requests_before} : {retries}')
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -1,51 +1,116 @@
 import spoty.plugins.collector.collector_plugin as col
 from spoty.plugins.collector.collector_classes import *
+from spoty.plugins.collector.collector_settings import settings, cache_dir, library_cache_dir, \
+    profiles_dir
+from spoty.plugins.collector.collector_sketch import HyperLogLog, get_minhash
+from spoty.plugins.collector.collector_index import PlaylistNamesIndex, PlaylistSimilarityIndex, \
+    SIMILARITY_INDEX_VERSION
+from spoty.plugins.collector.collector_features import PlaylistFeaturesCache, LibraryState, get_collection_key, \
+    FEATURES_VERSION
+from spoty.plugins.collector.collector_memory import MemoryMonitor, SpilledList
 
-from datetime import datetime
-from spoty import plugins_path
 from spoty import spotify_api
 from spoty import csv_playlist
 from spoty import utils
-from dynaconf import Dynaconf
 import os.path
+import base64
 import click
-import re
-from datetime import datetime, timedelta
 from typing import List
-from multiprocessing import Process, Lock, Queue, Value, Array
-import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty
+import contextlib
+import heapq
+import itertools
+import threading
 import time
 import sys
 
-current_directory = os.path.dirname(os.path.realpath(__file__))
-settings_file_name = os.path.join(current_directory, 'settings.toml')
-
-settings = Dynaconf(
-    envvar_prefix="COLLECTOR",
-    settings_files=[settings_file_name],
-)
-
 THREADS_COUNT = settings.COLLECTOR.THREADS_COUNT
+CACHE_FRESH_MIN = settings.COLLECTOR.CACHE_FRESH_MIN
+DUPLICATE_SIMILARITY = settings.COLLECTOR.DUPLICATE_SIMILARITY
+SKIP_DUPLICATE_PLAYLISTS = settings.COLLECTOR.SKIP_DUPLICATE_PLAYLISTS
+# 0 - unlimited
+CACHE_MAX_PLAYLISTS = settings.COLLECTOR.CACHE_MAX_PLAYLISTS
+CACHE_MAX_SIZE_MB = settings.COLLECTOR.CACHE_MAX_SIZE_MB
+CACHE_MAX_AGE_DAYS = settings.COLLECTOR.CACHE_MAX_AGE_DAYS
+
+# playlists printed in this number of the best results of cache-find-best are kept in the cache longer
+EVICTION_TOP_COUNT = 100
+
+# increase when FindBestTracksParams, UserLibrary or TracksCollection fields change
+PROFILE_VERSION = 1
+
+# indexes, features and stats of the cache are not written by scan workers sharing the cache folder
+write_cache_state = True
+
+# 0 - unlimited
+SCAN_MEMORY_LIMIT_MB = settings.COLLECTOR.SCAN_MEMORY_LIMIT_MB
+
+# approximate memory of a scan process above the memory shared with the main process
+WORKER_MEMORY_MB = 100
+# approximate memory of the loaded features cache relative to its file size
+FEATURES_MEMORY_FACTOR = 3
+# playlists sent by a scan process at once when the results are streamed
+SCAN_CHUNK_SIZE = 100
+
+# current best playlists are printed with this interval when the scan has a time budget
+PROGRESS_PRINT_SEC = 5
+PROGRESS_TOP_COUNT = 10
+# scan processes which did not finish after the time budget and this time are stopped
+DEADLINE_GRACE_SEC = 5
 
-cache_dir = os.path.join(current_directory, 'cache')
-cache_dir = os.path.abspath(cache_dir)
 cache_catalog_file_name = os.path.join(cache_dir, "cache.txt")
-
-library_cache_dir = os.path.join(current_directory, 'library_cache')
-library_cache_dir = os.path.abspath(library_cache_dir)
 library_cache_catalog_file_name = os.path.join(library_cache_dir, "cache.txt")
 
+cache_dirs_file_name = os.path.join(cache_dir, "dirs.txt")
+library_cache_dirs_file_name = os.path.join(library_cache_dir, "dirs.txt")
+
+cache_sketches_file_name = os.path.join(cache_dir, "sketches.txt")
+library_cache_sketches_file_name = os.path.join(library_cache_dir, "sketches.txt")
+
+cache_names_index_file_name = os.path.join(cache_dir, "names.idx")
+library_cache_names_index_file_name = os.path.join(library_cache_dir, "names.idx")
+
+cache_features_file_name = os.path.join(cache_dir, "features.dat")
+library_cache_features_file_name = os.path.join(library_cache_dir, "features.dat")
+
+cache_similarity_index_file_name = os.path.join(cache_dir, "minhash.idx")
+library_cache_similarity_index_file_name = os.path.join(library_cache_dir, "minhash.idx")
+
+# minhash signatures of playlists cached since the similarity index was updated
+cache_minhash_file_name = os.path.join(cache_dir, "minhash.txt")
+library_cache_minhash_file_name = os.path.join(library_cache_dir, "minhash.txt")
+
+cache_clusters_file_name = os.path.join(cache_dir, "clusters.txt")
+library_cache_clusters_file_name = os.path.join(library_cache_dir, "clusters.txt")
+
+# best points and last time in the top results of cached playlists, used to choose playlists to evict
+cache_stats_file_name = os.path.join(cache_dir, "stats.txt")
+
 mirror_playlist_prefix = settings.COLLECTOR.MIRROR_PLAYLISTS_PREFIX
 
-if not os.path.isdir(cache_dir):
-    os.makedirs(cache_dir)
-if not os.path.isdir(library_cache_dir):
-    os.makedirs(library_cache_dir)
+
+def ensure_cache_dirs():
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    if not os.path.isdir(library_cache_dir):
+        os.makedirs(library_cache_dir)
 
 
 # [id][0 = playlist_name, 1 - file_name]
 def get_cached_playlists_dict(use_library_dir=False) -> dict[str, [str, str]]:
     read_dir = library_cache_dir if use_library_dir else cache_dir
+    catalog = get_cache_catalog(use_library_dir)
+    res = {}
+    for id, data in catalog.items():
+        res[id] = [get_catalog_playlist_name(data[1]), os.path.join(read_dir, data[1] + '.csv')]
+    return res
+
+
+# [id][0 = playlist_name, 1 - file_name]
+def scan_cached_playlists_dict(use_library_dir=False) -> dict[str, [str, str]]:
+    read_dir = library_cache_dir if use_library_dir else cache_dir
 
     click.echo("\nReading cache playlists directory")
     csvs_in_path = csv_playlist.find_csvs_in_path(read_dir)
@@ -73,9 +138,9 @@ def get_expired_and_new_playlists(expired_min, overwrite_exist, playlist_ids, us
         dir = cache_dir
 
     if read_catalog:
-        cached_playlists = read_cache_catalog(use_library_dir)
+        cached_playlists = get_cache_catalog(use_library_dir)
     else:
-        cached_playlists = get_cached_playlists_dict(use_library_dir)
+        cached_playlists = scan_cached_playlists_dict(use_library_dir)
 
     to_download_playlists = []
     exist_playlists = []
@@ -113,12 +178,17 @@ def get_expired_and_new_playlists(expired_min, overwrite_exist, playlist_ids, us
 
 def cache_add_by_ids(playlist_ids, use_library_dir=False, overwrite_exist=False, write_empty=False, expired_min=0,
                      read_catalog=True):
+    ensure_cache_dirs()
     read_dir = library_cache_dir if use_library_dir else cache_dir
 
     cached_playlists, exist_playlists, to_download_playlists, to_overwrite_playlists \
         = get_expired_and_new_playlists(expired_min, overwrite_exist, playlist_ids, use_library_dir, read_catalog)
 
     downloaded_file_names = []
+    files_count_changes = {}
+    tracks_count_changes = {}
+    sketches_changes = {}
+    minhashes = []
 
     if use_library_dir:
         dir = library_cache_dir
@@ -149,6 +219,14 @@ def cache_add_by_ids(playlist_ids, use_library_dir=False, overwrite_exist=False,
                 if playlist_id in to_overwrite_playlists:
                     try:
                         os.remove(to_overwrite_playlists[playlist_id])
+                        rel_dir = __get_rel_dir(os.path.relpath(to_overwrite_playlists[playlist_id], dir))
+                        files_count_changes[rel_dir] = files_count_changes.get(rel_dir, 0) - 1
+                        # tracks count of the old file is unknown if the catalog was not read
+                        old_tracks_count = cached_playlists[playlist_id][2] if read_catalog else None
+                        if old_tracks_count is None or tracks_count_changes.get(rel_dir, 0) is None:
+                            tracks_count_changes[rel_dir] = None
+                        else:
+                            tracks_count_changes[rel_dir] = tracks_count_changes.get(rel_dir, 0) - old_tracks_count
                     except:
                         click.echo(f'\nCant delete file: "{file_name}"')
                         pass
@@ -162,7 +240,23 @@ def cache_add_by_ids(playlist_ids, use_library_dir=False, overwrite_exist=False,
                     rel_filename = os.path.relpath(cache_file_name, dir)
                     rel_basename = os.path.splitext(rel_filename)[0]
                     file_date = int(os.path.getmtime(cache_file_name))
-                    cache_catalog_file.write(f"{file_date},{rel_basename}\n")
+                    cache_catalog_file.write(format_cache_catalog_line(file_date, rel_basename, len(tags_list)))
+                    files_count_changes["."] = files_count_changes.get(".", 0) + 1
+                    if tracks_count_changes.get(".", 0) is not None:
+                        tracks_count_changes["."] = tracks_count_changes.get(".", 0) + len(tags_list)
+                    if "." not in sketches_changes:
+                        sketches_changes["."] = HyperLogLog()
+                    sketches_changes["."].add_all(tags['ISRC'] for tags in tags_list if 'ISRC' in tags)
+                    minhashes.append([file_date, rel_basename,
+                                      get_minhash(tags['ISRC'] for tags in tags_list if 'ISRC' in tags)])
+
+    update_cache_dirs_state(files_count_changes, use_library_dir, tracks_count_changes)
+    update_cache_sketches(sketches_changes, use_library_dir)
+    append_cache_minhashes(minhashes, use_library_dir)
+
+    # the user library is not limited
+    if not use_library_dir and len(downloaded_file_names) > 0:
+        cache_evict(confirm=True)
 
     # append_cache_catalog(downloaded_file_names, use_library_dir)
 
@@ -182,13 +276,19 @@ def cache_add_by_name(search_query, limit, use_library_dir=False, overwrite_exis
     return downloaded, exist, overwritten, all_cached
 
 
-def read_cached_playlists(use_library_dir=False):
+# memory_limit_mb - playlists are written to a temporary file while they are read, so that they do not fill the memory
+def read_cached_playlists(use_library_dir=False, memory_limit_mb: float = None):
+    import numpy as np
+    from multiprocessing import Process, Queue, Value
+
+    memory = MemoryMonitor(memory_limit_mb if memory_limit_mb is not None else SCAN_MEMORY_LIMIT_MB)
     read_dir = library_cache_dir if use_library_dir else cache_dir
-    playlists = []
+    playlists = SpilledList() if memory.is_limited() else []
     csvs_in_path = csv_playlist.find_csvs_in_path(read_dir)
+    memory.begin_stage('reading')
     # multi thread
     try:
-        parts = np.array_split(csvs_in_path, THREADS_COUNT)
+        parts = np.array_split(csvs_in_path, memory.get_processes_count(THREADS_COUNT, WORKER_MEMORY_MB))
         threads = []
         counters = []
         results = Queue()
@@ -203,30 +303,34 @@ def read_cached_playlists(use_library_dir=False):
                 threads.append(thread)
                 thread.daemon = True  # This thread dies when main thread exits
                 thread.start()
+                memory.watch(thread.pid)
 
-                # update bar
-                total = sum([x.value for x in counters])
-                added = total - bar.pos
-                if added > 0:
-                    bar.update(added)
+            # results are combined while they are read, so that workers do not keep them
+            finished = 0
+            while finished < len(parts):
+                try:
+                    res, done = results.get(timeout=0.1)
+                    playlists.extend(res)
+                    if done:
+                        finished += 1
+                except Empty:
+                    pass
 
-            # waiting for complete
-            while not bar.finished:
-                time.sleep(0.1)
+                # update bar
                 total = sum([x.value for x in counters])
                 added = total - bar.pos
                 if added > 0:
                     bar.update(added)
 
-            # combine results
-            for i in range(len(parts)):
-                res = results.get()
-                playlists.extend(res)
-
     except (KeyboardInterrupt, SystemExit):  # aborted by user
         click.echo()
         click.echo('Aborted.')
         sys.exit()
+    finally:
+        memory.end_stage()
+
+    if memory.is_limited():
+        memory.print_stages()
     return playlists
 
 
@@ -245,155 +349,523 @@ def __read_csvs_thread(filenames, counter, result):
         pl['tracks'] = tags
         res.append(pl)
 
-        if (i + 1) % 100 == 0:
-            counter.value += 10
+        if (i + 1) % SCAN_CHUNK_SIZE == 0:
+            counter.value += SCAN_CHUNK_SIZE
+            result.put([res, False])
+            res = []
         if i + 1 == len(filenames):
-            counter.value += (i % 100) + 1
-    result.put(res)
+            counter.value += (i % SCAN_CHUNK_SIZE) + 1
+    result.put([res, True])
 
 
 def cache_find_best(lib: UserLibrary, ref_playlist_ids: List[str], min_not_listened=0, min_listened=0,
                     min_ref_percentage=0, min_ref_tracks=1, sorting="points", reverse_sorting=False,
-                    filter_names=None, listened_accuracy=100, fav_weight=1, ref_weight=1, prob_weight=1):
+                    filter_names=None, listened_accuracy=100, fav_weight=1, ref_weight=1, prob_weight=1,
+                    time_budget: float = None):
+    params = create_find_best_params(lib, ref_playlist_ids, min_not_listened, min_listened, min_ref_percentage,
+                                     min_ref_tracks, sorting, reverse_sorting, filter_names, listened_accuracy,
+                                     fav_weight, ref_weight, prob_weight)
+    results, total_tracks_count, unique_tracks = cache_find_best_batch([params], time_budget)
+    return results[0], total_tracks_count, unique_tracks
+
+
+# retain_count - only this number of the best playlists of each params is kept when the memory is limited
+def cache_find_best_batch(params_list: List[FindBestTracksParams], time_budget: float = None,
+                          playlist_ids: List[str] = None, memory_limit_mb: float = None,
+                          retain_count: int = None) -> (List[List[PlaylistInfo]], int, int):
+    # cached playlists are read and compared with the library once, then each params is applied to the counts
+    results, total_tracks_count, unique_tracks = get_cached_playlists_info_batch(params_list,
+                                                                                 playlist_ids=playlist_ids,
+                                                                                 time_budget=time_budget,
+                                                                                 memory_limit_mb=memory_limit_mb,
+                                                                                 retain_count=retain_count)
+    results = [sort_playlist_infos(infos, params.sorting, params.reverse_sorting)
+               for infos, params in zip(results, params_list)]
+    update_cache_stats(results)
+    return results, total_tracks_count, unique_tracks
+
+
+def cache_find_similar(lib: UserLibrary, ref_playlist_ids: List[str], candidates_limit=1000, min_similarity=0.0,
+                       min_not_listened=0, min_listened=0, min_ref_percentage=0, min_ref_tracks=1, sorting="points",
+                       reverse_sorting=False, filter_names=None, listened_accuracy=100, fav_weight=1, ref_weight=1,
+                       prob_weight=1):
+    params = create_find_best_params(lib, ref_playlist_ids, min_not_listened, min_listened, min_ref_percentage,
+                                     min_ref_tracks, sorting, reverse_sorting, filter_names, listened_accuracy,
+                                     fav_weight, ref_weight, prob_weight)
+
+    # each reference playlist is searched separately, a big reference set is not similar to any single playlist
+    signatures = []
+    for isrcs in params.ref_tracks.playlists_by_isrc.values():
+        signatures.append(get_minhash(isrcs))
+    if len(signatures) == 0:
+        signatures.append(get_minhash(params.ref_tracks.track_isrcs))
+    signatures = [signature for signature in signatures if signature is not None]
+    if len(signatures) == 0:
+        click.echo('Reference playlists have no tracks.')
+        exit()
+
+    index = get_cache_similarity_index()
+    found = index.search(signatures, candidates_limit)
+    ids = [id for id, similarity in found if similarity >= min_similarity]
+    click.echo(f'{len(ids)} similar playlists found in the cache')
+    if len(ids) == 0:
+        return [], 0, {}
+
+    # candidates are scored exactly
+    results, total_tracks_count, unique_tracks = get_cached_playlists_info_batch([params], playlist_ids=ids)
+    return sort_playlist_infos(results[0], sorting, reverse_sorting), total_tracks_count, unique_tracks
+
+
+# ref_tracks_cache - [tuple of ref playlist ids] = ref tracks, params with the same reference playlists share them
+def create_find_best_params(lib: UserLibrary, ref_playlist_ids: List[str], min_not_listened=0, min_listened=0,
+                            min_ref_percentage=0, min_ref_tracks=1, sorting="points", reverse_sorting=False,
+                            filter_names=None, listened_accuracy=100, fav_weight=1, ref_weight=1, prob_weight=1,
+                            ref_tracks_cache: dict = None) -> FindBestTracksParams:
     playlist_ids = []
-    for ref_playlist_ids in ref_playlist_ids:
-        playlist_id = spotify_api.parse_playlist_id(ref_playlist_ids)
+    for ref_playlist_id in ref_playlist_ids:
+        playlist_id = spotify_api.parse_playlist_id(ref_playlist_id)
         playlist_ids.append(playlist_id)
     ref_playlist_ids = playlist_ids
 
     params = FindBestTracksParams(lib)
-    ref_tags, ref_playlist_ids = get_tracks_from_playlists(ref_playlist_ids)
-    params.ref_tracks.add_tracks(ref_tags)
+    key = tuple(sorted(ref_playlist_ids))
+    if ref_tracks_cache is not None and key in ref_tracks_cache:
+        params.ref_tracks = ref_tracks_cache[key]
+    else:
+        ref_tags, ref_playlist_ids = get_tracks_from_playlists(ref_playlist_ids)
+        params.ref_tracks.add_tracks(ref_tags)
+        if ref_tracks_cache is not None:
+            ref_tracks_cache[key] = params.ref_tracks
     params.min_not_listened = min_not_listened
     params.min_listened = min_listened
     params.min_ref_percentage = min_ref_percentage
     params.min_ref_tracks = min_ref_tracks
     params.sorting = sorting
+    params.reverse_sorting = reverse_sorting
     params.filter_names = filter_names
     params.listened_accuracy = listened_accuracy
     params.fav_weight = fav_weight
     params.ref_weight = ref_weight
     params.prob_weight = prob_weight
-    infos, total_tracks_count, unique_tracks = get_cached_playlists_info(params)
+    return params
+
+
+# profile - library, reference tracks and search parameters of a user, saved to search the cache for several users
+def get_profile_file_name(name: str):
+    return os.path.join(profiles_dir, utils.slugify_file_pah(name) + '.pickle')
+
+
+def get_profile_names() -> List[str]:
+    if not os.path.isdir(profiles_dir):
+        return []
+    return sorted(os.path.splitext(file_name)[0] for file_name in os.listdir(profiles_dir)
+                  if file_name.endswith('.pickle'))
+
+
+def write_profile(name: str, params: FindBestTracksParams):
+    import pickle
+
+    if not os.path.isdir(profiles_dir):
+        os.makedirs(profiles_dir)
+    file_name = get_profile_file_name(name)
+    temp_file_name = file_name + ".tmp"
+    with open(temp_file_name, 'wb') as file:
+        pickle.dump(PROFILE_VERSION, file, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(params, file, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_file_name, file_name)
+
+
+def read_profile(name: str) -> FindBestTracksParams:
+    import pickle
+
+    file_name = get_profile_file_name(name)
+    if not os.path.isfile(file_name):
+        return None
+    try:
+        with open(file_name, 'rb') as file:
+            if pickle.load(file) != PROFILE_VERSION:
+                return None
+            return pickle.load(file)
+    except Exception:
+        return None
+
+
+# cached playlists are read once and compared with the libraries of all profiles
+def cache_find_best_profiles(names: List[str], time_budget: float = None) -> (List[List[PlaylistInfo]], int, int):
+    params_list = []
+    for name in names:
+        params = read_profile(name)
+        if params is None:
+            click.echo(f'Profile "{name}" not found or saved by a previous version. Save it again.')
+            exit()
+        params_list.append(params)
+    return cache_find_best_batch(params_list, time_budget)
+
+
+# line format: points,playlist_id,playlist_name, the best playlists first
+def write_profile_results(results_dir: str, names: List[str], results: List[List[PlaylistInfo]], limit: int = None):
+    if not os.path.isdir(results_dir):
+        os.makedirs(results_dir)
+    for name, infos in zip(names, results):
+        if limit is not None:
+            infos = infos[-limit:] if limit > 0 else []
+        file_name = os.path.join(results_dir, utils.slugify_file_pah(name) + '.txt')
+        with open(file_name, 'w', encoding='utf-8-sig') as file:
+            for info in reversed(infos):
+                file.write(f'{info.points:.2f},{info.playlist_id},{info.playlist_name}\n')
+
+
+def sort_playlist_infos(infos: List[PlaylistInfo], sorting: str, reverse_sorting=False) -> List[PlaylistInfo]:
+    key = get_sorting_key(sorting)
+    if key is not None:
+        infos = sorted(infos, reverse=reverse_sorting, key=key)
+    return infos
+
+
+def get_sorting_key(sorting: str):
     if sorting == "fav-number":
-        infos = sorted(infos, reverse=reverse_sorting, key=lambda x: x.fav_tracks_count)
+        return lambda x: x.fav_tracks_count
     elif sorting == "fav-percentage":
-        infos = sorted(infos, reverse=reverse_sorting, key=lambda x: x.fav_percentage)
+        return lambda x: x.fav_percentage
     elif sorting == "ref-number":
-        infos = sorted(infos, reverse=reverse_sorting, key=lambda x: x.ref_tracks_count)
+        return lambda x: x.ref_tracks_count
     elif sorting == "ref-percentage":
-        infos = sorted(infos, reverse=reverse_sorting, key=lambda x: x.ref_percentage)
+        return lambda x: x.ref_percentage
     elif sorting == "list-number":
-        infos = sorted(infos, reverse=reverse_sorting, key=lambda x: x.listened_tracks_count)
+        return lambda x: x.listened_tracks_count
     elif sorting == "list-percentage":
-        infos = sorted(infos, reverse=reverse_sorting, key=lambda x: x.listened_percentage)
+        return lambda x: x.listened_percentage
     elif sorting == "track-number":
-        infos = sorted(infos, reverse=reverse_sorting, key=lambda x: x.tracks_count)
+        return lambda x: x.tracks_count
     elif sorting == "fav-points":
-        infos = sorted(infos, reverse=reverse_sorting, key=lambda x: x.fav_points)
+        return lambda x: x.fav_points
     elif sorting == "ref-points":
-        infos = sorted(infos, reverse=reverse_sorting, key=lambda x: x.ref_points)
+        return lambda x: x.ref_points
     elif sorting == "prob-points":
-        infos = sorted(infos, reverse=reverse_sorting, key=lambda x: x.prob_points)
+        return lambda x: x.prob_points
     elif sorting == "points":
-        infos = sorted(infos, reverse=reverse_sorting, key=lambda x: x.points)
-    return infos, total_tracks_count, unique_tracks
+        return lambda x: x.points
+    return None
 
 
 def get_cached_playlists_info(params: FindBestTracksParams, use_library_dir=False, include_unique_tracks=False) -> [
     List[PlaylistInfo], int, int]:
+    results, total_tracks_count, unique_tracks = get_cached_playlists_info_batch([params], use_library_dir,
+                                                                                 include_unique_tracks)
+    return results[0], total_tracks_count, unique_tracks
+
+
+# playlist_ids - only these cached playlists are scanned if specified
+# time_budget - seconds, playlists are read in random order and the scan is stopped when the time is over
+# memory_limit_mb - the number of scan processes is limited and the results are streamed from them,
+# only retain_count best playlists of each params are kept if specified
+def get_cached_playlists_info_batch(params_list: List[FindBestTracksParams], use_library_dir=False,
+                                    include_unique_tracks=False, playlist_ids: List[str] = None,
+                                    time_budget: float = None, memory_limit_mb: float = None,
+                                    retain_count: int = None) -> [List[List[PlaylistInfo]], int, int]:
+    memory = MemoryMonitor(memory_limit_mb if memory_limit_mb is not None else SCAN_MEMORY_LIMIT_MB)
+    # the memory sampling is stopped even if the scan is aborted
+    try:
+        return __get_cached_playlists_info_batch(params_list, use_library_dir, include_unique_tracks, playlist_ids,
+                                                 time_budget, memory, retain_count)
+    finally:
+        memory.end_stage()
+
+
+def __get_cached_playlists_info_batch(params_list: List[FindBestTracksParams], use_library_dir, include_unique_tracks,
+                                      playlist_ids: List[str], time_budget: float, memory: MemoryMonitor,
+                                      retain_count: int) -> [List[List[PlaylistInfo]], int, int]:
+    import numpy as np
+    import random
+    from multiprocessing import Process, Queue, Value
+
+    started = time.time()
+    deadline = started + time_budget if time_budget is not None else None
+    streaming = deadline is not None or memory.is_limited()
+
     read_dir = library_cache_dir if use_library_dir else cache_dir
-    click.echo("Reading cache playlists directory")
-    csvs_in_path = csv_playlist.find_csvs_in_path(read_dir)
+    memory.begin_stage('catalog')
+    catalog = get_cache_catalog(use_library_dir)
+    ids = list(catalog.keys())
+    if playlist_ids is not None:
+        ids = [id for id in playlist_ids if id in catalog]
 
-    infos = []
+    results = [[] for params in params_list]
     unique_tracks = {}
     total_tracks_count = 0
 
-    if len(csvs_in_path) == 0:
-        return infos, total_tracks_count, unique_tracks
-
-    if params.filter_names is not None:
-        filtered_csvs = []
-        with click.progressbar(length=len(csvs_in_path), label=f'Filtering cached playlists') as bar:
-            for i, file_name in enumerate(csvs_in_path):
-                id, name = csv_playlist.get_csv_playlist_id_and_name(file_name)
-                if id is not None and name is not None:
-                    if re.search(params.filter_names.upper(), name.upper()):
-                        filtered_csvs.append(file_name)
-                else:
-                    click.echo("Invalid cached playlist file name: " + file_name)
-                if i % 1000 == 0:
-                    bar.update(1000)
-        click.echo(f'{len(filtered_csvs)}/{len(csvs_in_path)} playlists matches the regex filter')
-        csvs_in_path = filtered_csvs
-        if len(csvs_in_path) == 0:
+    if len(ids) == 0:
+        return results, total_tracks_count, unique_tracks
+
+    # only playlists matching the name filter of at least one params are read
+    filtered_ids = [None] * len(params_list)
+    for i, params in enumerate(params_list):
+        if params.filter_names is not None:
+            filtered_ids[i] = set(get_cached_playlist_ids_by_name(params.filter_names, use_library_dir))
+            click.echo(f'{len(filtered_ids[i])}/{len(ids)} playlists matches the regex filter'
+                       + (f' "{params.filter_names}"' if len(params_list) > 1 else ''))
+
+    if all(filter_ids is not None for filter_ids in filtered_ids):
+        filter_ids = set().union(*filtered_ids)
+        ids = [id for id in ids if id in filter_ids]
+        if len(ids) == 0:
             exit()
 
-    if len(csvs_in_path) == 0:
-        return infos, total_tracks_count, unique_tracks
+    # only one playlist of each cluster of duplicates is scored
+    # with the time budget, new playlists are not indexed and only already found duplicates are skipped
+    if SKIP_DUPLICATE_PLAYLISTS and not include_unique_tracks:
+        memory.begin_stage('duplicates')
+        duplicates = get_cache_duplicates(use_library_dir, None, time_budget is None, time_budget is not None)
+        if duplicates is None:
+            click.echo('Duplicates are not skipped, run cache-find-best without the time budget to find them.')
+        elif len(duplicates) > 0:
+            count = len(ids)
+            ids_set = set(ids)
+            ids = [id for id in ids if duplicates.get(id) not in ids_set]
+            if count != len(ids):
+                click.echo(f'{count - len(ids)} duplicate playlists are skipped')
+
+    # each playlist is read once and compared with the libraries of all params
+    libs = col.get_libraries(params_list)
+    ref_collections = col.get_ref_collections(params_list)
+
+    # counts of playlists not changed since the last search are taken from the features cache
+    # unique tracks are not kept in the cache, so all playlists are read for them
+    # the features cache is kept for one library only, so it is not used for several libraries
+    features = None
+    ref_keys = []
+    counted = {}
+
+    # with the memory limit, only the best playlists of each params are kept in heaps
+    retained = None
+    if retain_count is not None and memory.is_limited():
+        retained = [[] for params in params_list]
+        sorting_keys = [get_sorting_key(params.sorting) for params in params_list]
+        sequence = itertools.count()
+
+    def retain(i, info):
+        key = sorting_keys[i]
+        value = 0 if key is None else -key(info) if params_list[i].reverse_sorting else key(info)
+        item = (value, next(sequence), info)
+        if len(retained[i]) < retain_count:
+            heapq.heappush(retained[i], item)
+        elif item > retained[i][0]:
+            heapq.heapreplace(retained[i], item)
+
+    def get_results():
+        if retained is None:
+            return results
+        return [[item[2] for item in heap] for heap in retained]
+
+    # each params is applied to the counts of its library
+    def add_counts(id, tags_count, counts_list, ref_counts):
+        counted[id] = tags_count
+        infos = col.get_playlist_infos_by_libraries(params_list, libs, counts_list, ref_collections, ref_counts)
+        for i, (params, filter_ids, info) in enumerate(zip(params_list, filtered_ids, infos)):
+            if filter_ids is not None and id not in filter_ids:
+                continue
+            if __is_playlist_info_matched(params, info):
+                if retained is None:
+                    results[i].append(info)
+                else:
+                    retain(i, info)
+
+    features_full = [False]
+
+    def add_result(r):
+        unique_tracks.update(r[1])
+        # the features cache stops growing when the memory is almost over
+        if features is not None and not features_full[0] and memory.is_over_limit(0.8):
+            features_full[0] = True
+            click.echo('\nMemory limit is almost reached. Features of other playlists will not be cached.')
+        for file_name, tags_count, counts_list, ref_counts, isrcs, artists in r[0]:
+            id = ids_by_file_names[str(file_name)]
+            add_counts(id, tags_count, counts_list, ref_counts)
+            if features is not None and not features_full[0]:
+                playlist_ref_counts = {}
+                for key, ref_count in zip(ref_keys, ref_counts):
+                    if key is not None:
+                        playlist_ref_counts[key] = ref_count
+                features.put(id, catalog[id][0], catalog[id][1], tags_count, counts_list[0],
+                             playlist_ref_counts, isrcs, artists)
+
+    # the features cache is not loaded if it does not fit in the memory limit
+    features_file_name = library_cache_features_file_name if use_library_dir else cache_features_file_name
+    features_fit = not memory.is_limited() or not os.path.isfile(features_file_name) \
+        or os.path.getsize(features_file_name) * FEATURES_MEMORY_FACTOR / 1024 / 1024 < memory.limit_mb / 2
+    if not features_fit and not include_unique_tracks:
+        click.echo('The features cache is too large for the memory limit, it is not used.')
+
+    if not include_unique_tracks and len(libs) == 1 and features_fit:
+        memory.begin_stage('features cache')
+        features = get_cache_features(use_library_dir)
+        features.retain(catalog)
+        features.update_library(LibraryState(libs[0]))
+        ref_keys = [get_collection_key(ref_tracks) for ref_tracks in ref_collections]
+        features.use_ref_keys(ref_keys)
+        for id in ids:
+            data = features.get(id, catalog[id][0], catalog[id][1], ref_keys)
+            if data is not None:
+                add_counts(id, data[2], [data[3]],
+                           [data[4][key] if key is not None else [0, {}] for key in ref_keys])
+        if len(counted) > 0:
+            click.echo(f'{len(counted)}/{len(ids)} playlists are taken from the features cache')
+
+    ids_by_file_names = {}
+    for id in ids:
+        if id not in counted:
+            ids_by_file_names[os.path.join(read_dir, catalog[id][1] + '.csv')] = id
+    csvs_in_path = list(ids_by_file_names.keys())
+    if deadline is not None:
+        # any part of the cache scanned before the time is over is a random sample of the whole cache
+        random.shuffle(csvs_in_path)
 
     # multi thread
+    memory.begin_stage('scan')
     try:
-        parts = np.array_split(csvs_in_path, THREADS_COUNT)
-        threads = []
-        counters = []
-        results = Queue()
-
-        with click.progressbar(length=len(csvs_in_path),
-                               label=f'Collecting info for {len(csvs_in_path)} cached playlists') as bar:
-            # start threads
-            for i, part in enumerate(parts):
-                counter = Value('i', 0)
-                counters.append(counter)
-                playlists_part = list(part)
+        if len(csvs_in_path) > 0 and streaming:
+            # results are sent in parts and combined while the cache is scanned, so that workers do not keep them
+            parts = np.array_split(csvs_in_path, memory.get_processes_count(THREADS_COUNT, WORKER_MEMORY_MB))
+            queue = Queue()
+            threads = []
+            for part in parts:
                 thread = Process(target=__get_playlist_info_thread,
-                                 args=(playlists_part, params, counter, results, include_unique_tracks))
+                                 args=(list(part), libs, ref_collections, Value('i', 0), queue,
+                                       include_unique_tracks, features is not None, deadline, True))
                 threads.append(thread)
                 thread.daemon = True  # This thread dies when main thread exits
                 thread.start()
+                memory.watch(thread.pid)
+
+            # with the time budget, current best playlists are printed instead of the progress bar
+            with click.progressbar(length=len(csvs_in_path),
+                                   label=f'Collecting info for {len(csvs_in_path)} cached playlists') \
+                    if deadline is None else contextlib.nullcontext() as bar:
+                finished = 0
+                printed = time.time()
+                while finished < len(parts):
+                    try:
+                        r = queue.get(timeout=0.1)
+                        add_result(r)
+                        if bar is not None:
+                            bar.update(len(r[0]))
+                        if r[2]:
+                            finished += 1
+                    except Empty:
+                        # a process was killed without sending its last results
+                        if not any(thread.is_alive() for thread in threads):
+                            click.echo('\nScan processes stopped unexpectedly. The results are not complete.')
+                            break
+                    if deadline is not None and time.time() > deadline + DEADLINE_GRACE_SEC:
+                        click.echo('\nScan processes did not stop in time. The results are not complete.')
+                        for thread in threads:
+                            thread.terminate()
+                        break
+                    if deadline is not None and time.time() - printed >= PROGRESS_PRINT_SEC and finished < len(parts):
+                        printed = time.time()
+                        print_best_playlist_infos(params_list, get_results(), len(counted) / len(ids),
+                                                  printed - started)
+
+        elif len(csvs_in_path) > 0:
+            parts = np.array_split(csvs_in_path, THREADS_COUNT)
+            threads = []
+            counters = []
+            queue = Queue()
+
+            with click.progressbar(length=len(csvs_in_path),
+                                   label=f'Collecting info for {len(csvs_in_path)} cached playlists') as bar:
+                # start threads
+                for i, part in enumerate(parts):
+                    counter = Value('i', 0)
+                    counters.append(counter)
+                    playlists_part = list(part)
+                    thread = Process(target=__get_playlist_info_thread,
+                                     args=(playlists_part, libs, ref_collections, counter, queue,
+                                           include_unique_tracks, features is not None, None, False))
+                    threads.append(thread)
+                    thread.daemon = True  # This thread dies when main thread exits
+                    thread.start()
+
+                    # update bar
+                    total = sum([x.value for x in counters])
+                    added = total - bar.pos
+                    if added > 0:
+                        bar.update(added)
+
+                # waiting for complete
+                while not bar.finished:
+                    time.sleep(0.1)
+                    total = sum([x.value for x in counters])
+                    added = total - bar.pos
+                    if added > 0:
+                        bar.update(added)
 
-                # update bar
-                total = sum([x.value for x in counters])
-                added = total - bar.pos
-                if added > 0:
-                    bar.update(added)
-
-            # waiting for complete
-            while not bar.finished:
-                time.sleep(0.1)
-                total = sum([x.value for x in counters])
-                added = total - bar.pos
-                if added > 0:
-                    bar.update(added)
-
-        # combine results
-        with click.progressbar(parts, label=f'Processing the results') as bar:
-            for i in bar:
-                try:
-                    r = results.get()
-                    res = r[0]
-                    total_tracks_count += r[1]
-                    unique_tracks |= r[2]
-                    infos.extend(res)
-                except:
-                    click.echo("\nFailed to combine results.")
+            # combine results
+            with click.progressbar(parts, label=f'Processing the results') as bar:
+                for i in bar:
+                    try:
+                        add_result(queue.get())
+                    except:
+                        click.echo("\nFailed to combine results.")
 
     except (KeyboardInterrupt, SystemExit):  # aborted by user
         click.echo()
         click.echo('Aborted.')
         sys.exit()
 
-    return infos, total_tracks_count, unique_tracks
+    if features is not None:
+        memory.begin_stage('features write')
+        write_cache_features(features, use_library_dir)
+    memory.end_stage()
+
+    if deadline is not None:
+        if len(counted) < len(ids):
+            click.echo(f'Time budget expired: {len(counted)}/{len(ids)} playlists '
+                       f'({len(counted) / len(ids) * 100:.1f}%) scanned in {time.time() - started:.1f} sec.')
+        else:
+            click.echo(f'All {len(ids)} playlists scanned in {time.time() - started:.1f} sec.')
+
+    if memory.is_limited():
+        memory.print_stages()
+
+    total_tracks_count = sum(counted.values())
+    return get_results(), total_tracks_count, unique_tracks
+
+
+def print_best_playlist_infos(params_list: List[FindBestTracksParams], results: List[List[PlaylistInfo]],
+                              covered: float, elapsed: float):
+    click.echo(f'\n---------- {covered * 100:.1f}% of cache scanned ({elapsed:.0f} sec) ----------')
+    for i, (params, infos) in enumerate(zip(params_list, results)):
+        if len(params_list) > 1:
+            click.echo(f'Parameter set {i + 1}:')
+        key = get_sorting_key(params.sorting)
+        if key is None:
+            best = infos[:PROGRESS_TOP_COUNT]
+        elif params.reverse_sorting:
+            best = heapq.nsmallest(PROGRESS_TOP_COUNT, infos, key=key)
+        else:
+            best = heapq.nlargest(PROGRESS_TOP_COUNT, infos, key=key)
+        for n, info in enumerate(best):
+            value = f'{key(info):.1f} : ' if key is not None else ''
+            click.echo(f'  {n + 1}. {value}{info.playlist_name} ({info.playlist_id})')
 
 
-def __get_playlist_info_thread(csv_filenames, params: FindBestTracksParams, counter, result, include_unique_tracks):
-    infos = []
+# deadline - time when the scan is stopped
+# streaming - the results are sent in parts, the last part is marked as finished
+def __get_playlist_info_thread(csv_filenames, libs: List[UserLibrary], ref_collections: List[TracksCollection],
+                               counter, result, include_unique_tracks, include_tracks, deadline=None, streaming=False):
+    res = []
 
     unique_tracks = {}
-    total_tracks_count = 0
 
     for i, file_name in enumerate(csv_filenames):
+        if deadline is not None and time.time() >= deadline:
+            break
+        if streaming and len(res) >= SCAN_CHUNK_SIZE:
+            result.put([res, unique_tracks, False])
+            res = []
+            unique_tracks = {}
+
         playlist_id, playlist_name = csv_playlist.get_csv_playlist_id_and_name(file_name)
         if playlist_name == "":
             playlist_name = "Unknown"
@@ -403,6 +875,7 @@ def __get_playlist_info_thread(csv_filenames, params: FindBestTracksParams, coun
         playlist['name'] = playlist_name
         playlist['isrcs'] = {}
         # playlist['artists'] = {}
+        artists_list = []
         for tag in tags:
             if 'ISRC' in tag and 'ARTIST' in tag and 'TITLE' in tag:
                 artists = str.split(tag['ARTIST'], ';')
@@ -414,33 +887,40 @@ def __get_playlist_info_thread(csv_filenames, params: FindBestTracksParams, coun
                     # playlist['artists'][artist][tag['TITLE']] = None
                 if include_unique_tracks:
                     unique_tracks[tag['ISRC']] = None
+                if include_tracks:
+                    artists_list.extend(artists)
 
-        info = col.__get_playlist_info(params, playlist)
-
-        total_tracks_count += len(tags)
+        counts_list, ref_counts = col.get_playlist_counts_by_libraries(libs, ref_collections, playlist)
 
-        if info is not None:
-            if params.min_not_listened <= 0 or info.tracks_count - info.listened_tracks_count >= params.min_not_listened:
-                if params.min_listened <= 0 or info.listened_tracks_count >= params.min_listened:
-                    if params.min_ref_percentage <= 0 or info.ref_percentage >= params.min_ref_percentage:
-                        if params.min_ref_tracks <= 0 or info.ref_tracks_count >= params.min_ref_tracks \
-                                or params.ref_tracks is None or len(params.ref_tracks.track_isrcs) == 0:
-                            infos.append(info)
+        # isrcs and artists are needed to find the playlist when the library changes
+        isrcs = list(playlist['isrcs'].keys()) if include_tracks else None
+        artists = list(set(artists_list)) if include_tracks else None
+        res.append([str(file_name), len(tags), counts_list, ref_counts, isrcs, artists])
 
         if (i + 1) % 100 == 0:
             counter.value += 100
         if i + 1 == len(csv_filenames):
             counter.value += (i % 100) + 1
-    r = [infos, total_tracks_count, unique_tracks]
+    r = [res, unique_tracks, True]
     result.put(r)
 
 
+def __is_playlist_info_matched(params: FindBestTracksParams, info: PlaylistInfo) -> bool:
+    if params.min_not_listened <= 0 or info.tracks_count - info.listened_tracks_count >= params.min_not_listened:
+        if params.min_listened <= 0 or info.listened_tracks_count >= params.min_listened:
+            if params.min_ref_percentage <= 0 or info.ref_percentage >= params.min_ref_percentage:
+                if params.min_ref_tracks <= 0 or info.ref_tracks_count >= params.min_ref_tracks \
+                        or params.ref_tracks is None or len(params.ref_tracks.track_isrcs) == 0:
+                    return True
+    return False
+
+
 def sub_top_playlists_from_cache(infos: List[PlaylistInfo], count: int, group: str, update=True):
     infos.reverse()
     added_playlists = 0
     small_tracks = 0
     small_added = False
-    sub_ids = []
+    subscriptions = []
     for info in infos:
         if added_playlists >= count:
             break
@@ -448,18 +928,18 @@ def sub_top_playlists_from_cache(infos: List[PlaylistInfo], count: int, group: s
         if not_listened_count < 20:
             if small_tracks < 1000:
                 mirror_name = "MIX"
-                sub_playlist_ids, new_mirror_names = col.subscribe([info.playlist_id], mirror_name, group, True, False)
-                sub_ids.extend(sub_playlist_ids)
+                subscriptions.append(Subscription(info.playlist_id, mirror_name, group, True, False))
                 small_tracks += not_listened_count
                 if not small_added:
                     added_playlists += 1
                     small_added = True
         else:
             mirror_name = info.playlist_name
-            sub_playlist_ids, new_mirror_names = col.subscribe([info.playlist_id], mirror_name, group, True, True)
-            sub_ids.extend(sub_playlist_ids)
+            subscriptions.append(Subscription(info.playlist_id, mirror_name, group, True, True))
             added_playlists += 1
 
+    sub_ids, new_mirror_names = col.subscribe_batch(subscriptions)
+
     if update and len(sub_ids) > 0:
         col.update(False, False, sub_ids)
 
@@ -487,11 +967,54 @@ def cache_library_delete():
 
     if os.path.isfile(library_cache_catalog_file_name):
         os.remove(library_cache_catalog_file_name)
+    if os.path.isfile(library_cache_dirs_file_name):
+        os.remove(library_cache_dirs_file_name)
+    if os.path.isfile(library_cache_sketches_file_name):
+        os.remove(library_cache_sketches_file_name)
+    if os.path.isfile(library_cache_names_index_file_name):
+        os.remove(library_cache_names_index_file_name)
+    if os.path.isfile(library_cache_features_file_name):
+        os.remove(library_cache_features_file_name)
+    if os.path.isfile(library_cache_similarity_index_file_name):
+        os.remove(library_cache_similarity_index_file_name)
+    if os.path.isfile(library_cache_minhash_file_name):
+        os.remove(library_cache_minhash_file_name)
+    if os.path.isfile(library_cache_clusters_file_name):
+        os.remove(library_cache_clusters_file_name)
 
     click.echo(f"{len(csvs_in_path)} playlists removed.")
 
 
+# playlists read from cache: [csv_file_name] = [file_mtime, playlist], the least recently used are removed
+read_playlists = OrderedDict()
+# max number of playlists kept in read_playlists
+READ_PLAYLISTS_LIMIT = 1000
+# playlists are read concurrently, the lock is held only while read_playlists is used
+read_playlists_lock = threading.Lock()
+
+
 def read_cached_playlist(csv_file_name):
+    try:
+        file_date = os.path.getmtime(csv_file_name)
+    except OSError:
+        file_date = None
+
+    with read_playlists_lock:
+        if csv_file_name in read_playlists and read_playlists[csv_file_name][0] == file_date:
+            read_playlists.move_to_end(csv_file_name)
+            return read_playlists[csv_file_name][1]
+
+    pl = __read_cached_playlist(csv_file_name)
+    if file_date is not None:
+        with read_playlists_lock:
+            read_playlists[csv_file_name] = [file_date, pl]
+            read_playlists.move_to_end(csv_file_name)
+            while len(read_playlists) > READ_PLAYLISTS_LIMIT:
+                read_playlists.popitem(last=False)
+    return pl
+
+
+def __read_cached_playlist(csv_file_name):
     playlist_id, playlist_name = csv_playlist.get_csv_playlist_id_and_name(csv_file_name)
     if playlist_name == "":
         playlist_name = "Unknown"
@@ -563,6 +1086,9 @@ def cache_optimize():
 
 
 def cache_optimize_multi():
+    import numpy as np
+    from multiprocessing import Process, Value
+
     csvs_in_path = csv_playlist.find_csvs_in_path(cache_dir)
 
     if len(csvs_in_path) == 0:
@@ -636,25 +1162,928 @@ def __cache_optimize_thread(csvs_in_path, part_index, parts_count, counter):
             counter.value += (i % 100) + 1
 
 
-def rescan_cache_catalog():
-    csvs_in_path = csv_playlist.find_csvs_in_path(cache_dir)
-    catalog = {}
-    with click.progressbar(csvs_in_path, label=f'Collecting info for {len(csvs_in_path)} cached playlists') as bar:
-        for file_name in bar:
-            add_to_cache_catalog(catalog, file_name, False)
-    write_cache_catalog(catalog, False)
+def rescan_cache_catalog(incremental=True):
+    rescan_cache_dir_catalog(False, incremental)
+    rescan_cache_dir_catalog(True, incremental)
 
-    csvs_in_path = csv_playlist.find_csvs_in_path(library_cache_dir)
-    catalog = {}
-    with click.progressbar(csvs_in_path,
-                           label=f'Collecting info for {len(csvs_in_path)} library cached playlists') as bar:
+
+def rescan_cache_dir_catalog(use_library_dir=False, incremental=True):
+    # only folders whose modification time or number of files changed since the last scan are listed again,
+    # and the catalog is patched with added, removed and changed files
+    ensure_cache_dirs()
+
+    read_dir = library_cache_dir if use_library_dir else cache_dir
+    catalog_file_name = library_cache_catalog_file_name if use_library_dir else cache_catalog_file_name
+
+    prev_dirs = read_cache_dirs_state(use_library_dir)
+    if not incremental or len(prev_dirs) == 0 or not os.path.isfile(catalog_file_name):
+        incremental = False
+        prev_dirs = {}
+        catalog = {}
+    else:
+        catalog = dict(read_cache_catalog(use_library_dir))
+
+    # create catalog files before scanning, so that creating them does not change the recorded folder time
+    dirs_file_name = library_cache_dirs_file_name if use_library_dir else cache_dirs_file_name
+    sketches_file_name = library_cache_sketches_file_name if use_library_dir else cache_sketches_file_name
+    names_index_file_name = library_cache_names_index_file_name if use_library_dir else cache_names_index_file_name
+    features_file_name = library_cache_features_file_name if use_library_dir else cache_features_file_name
+    similarity_index_file_name = library_cache_similarity_index_file_name if use_library_dir \
+        else cache_similarity_index_file_name
+    minhash_file_name = library_cache_minhash_file_name if use_library_dir else cache_minhash_file_name
+    clusters_file_name = library_cache_clusters_file_name if use_library_dir else cache_clusters_file_name
+    for file_name in [catalog_file_name, dirs_file_name, sketches_file_name, names_index_file_name,
+                      features_file_name, similarity_index_file_name, minhash_file_name, clusters_file_name]:
+        if not os.path.isfile(file_name):
+            open(file_name, "a", encoding='utf-8-sig').close()
+    if not use_library_dir and not os.path.isfile(cache_stats_file_name):
+        open(cache_stats_file_name, "a", encoding='utf-8-sig').close()
+
+    sub_dirs = {}
+    for rel_dir in prev_dirs:
+        parent_dir = __get_parent_dir(rel_dir)
+        if parent_dir is not None:
+            sub_dirs.setdefault(parent_dir, []).append(rel_dir)
+
+    catalog_counts = {}
+    for data in catalog.values():
+        rel_dir = __get_rel_dir(data[1])
+        catalog_counts[rel_dir] = catalog_counts.get(rel_dir, 0) + 1
+
+    dirs = {}
+    listed_dirs = {}
+    with ThreadPoolExecutor(max_workers=THREADS_COUNT) as executor:
+        level = ["."]
+        while len(level) > 0:
+            next_level = []
+            for res in executor.map(lambda d: __scan_cache_dir(read_dir, d, prev_dirs, sub_dirs, catalog_counts),
+                                    level):
+                if res is None:
+                    continue
+                rel_dir, dir_date, files, dir_sub_dirs = res
+                if files is None:
+                    dirs[rel_dir] = [dir_date, prev_dirs[rel_dir][1], prev_dirs[rel_dir][2]]
+                else:
+                    dirs[rel_dir] = [dir_date, len(files), None]
+                    listed_dirs[rel_dir] = files
+                next_level.extend(dir_sub_dirs)
+            level = next_level
+
+    changed_dirs = set(listed_dirs.keys()) | (set(prev_dirs.keys()) - set(dirs.keys()))
+
+    added = {}
+    for files in listed_dirs.values():
+        for id, data in files.items():
+            if id not in catalog or str(catalog[id][0]) != str(data[0]) or catalog[id][1] != data[1]:
+                added[id] = data  # tracks count of added or changed file is unknown until counted
+
+    removed = []
+    for id, data in catalog.items():
+        rel_dir = __get_rel_dir(data[1])
+        if rel_dir in changed_dirs and id not in added:
+            if rel_dir not in listed_dirs or id not in listed_dirs[rel_dir]:
+                removed.append(id)
+
+    # unique tracks sketches of changed folders are rebuilt on demand
+    if incremental:
+        sketch_dirs = set(prev_dirs.keys()) - set(dirs.keys())
+        sketch_dirs.update(__get_rel_dir(data[1]) for data in added.values())
+        sketch_dirs.update(__get_rel_dir(catalog[id][1]) for id in removed)
+        remove_cache_sketches(sketch_dirs, use_library_dir)
+    else:
+        remove_cache_sketches(None, use_library_dir)
+
+    if not incremental or len(removed) > 0:
+        for id in removed:
+            del catalog[id]
+        catalog.update(added)
+        write_cache_catalog(catalog, use_library_dir)
+    elif len(added) > 0:
+        catalog.update(added)
+        with open(catalog_file_name, "a", encoding='utf-8-sig') as cache_catalog_file:
+            for data in added.values():
+                cache_catalog_file.write(format_cache_catalog_line(data[0], data[1], data[2]))
+
+    # tracks counts of scanned folders are summed again from the catalog
+    for rel_dir, tracks_count in __get_tracks_count_by_dirs(catalog, listed_dirs).items():
+        dirs[rel_dir][2] = tracks_count
+
+    write_cache_dirs_state(dirs, use_library_dir)
+
+    label = "Library cache" if use_library_dir else "Cache"
+    click.echo(f'{label} catalog updated: {len(added)} playlists added or changed, {len(removed)} removed '
+               f'({len(listed_dirs)}/{len(dirs)} folders scanned).')
+
+
+# [rel_dir] = sum of tracks counts of playlists in the folder, None if some of them are unknown
+def __get_tracks_count_by_dirs(catalog: dict, rel_dirs) -> dict:
+    tracks_counts = dict.fromkeys(rel_dirs, 0)
+    for data in catalog.values():
+        rel_dir = __get_rel_dir(data[1])
+        if rel_dir in tracks_counts and tracks_counts[rel_dir] is not None:
+            tracks_counts[rel_dir] = None if data[2] is None else tracks_counts[rel_dir] + data[2]
+    return tracks_counts
+
+
+def __get_rel_dir(rel_basename: str):
+    rel_dir = os.path.dirname(rel_basename)
+    return rel_dir if rel_dir != "" else "."
+
+
+def __get_parent_dir(rel_dir: str):
+    if rel_dir == ".":
+        return None
+    return __get_rel_dir(rel_dir)
+
+
+def __scan_cache_dir(read_dir, rel_dir, prev_dirs, sub_dirs, catalog_counts):
+    full_dir = os.path.join(read_dir, rel_dir)
+    try:
+        dir_date = os.stat(full_dir).st_mtime_ns
+    except OSError:
+        return None  # folder removed
+
+    if rel_dir in prev_dirs:
+        prev_date, prev_count = prev_dirs[rel_dir][:2]
+        if prev_date == dir_date and prev_count == catalog_counts.get(rel_dir, 0):
+            return rel_dir, dir_date, None, sub_dirs.get(rel_dir, [])
+
+    files = {}
+    dir_sub_dirs = []
+    with os.scandir(full_dir) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                dir_sub_dirs.append(entry.name if rel_dir == "." else os.path.join(rel_dir, entry.name))
+            elif entry.name.lower().endswith(".csv"):
+                base_name = os.path.splitext(entry.name)[0]
+                rel_basename = base_name if rel_dir == "." else os.path.join(rel_dir, base_name)
+                id = base_name[:22]  # get id from first 22 characters of file name
+                files[id] = [int(entry.stat().st_mtime), rel_basename, None]
+    return rel_dir, dir_date, files, dir_sub_dirs
+
+
+# [rel_dir] = [modification_time_ns, files_count, tracks_count or None if unknown]
+def read_cache_dirs_state(use_library_dir=False) -> dict:
+    file_name = library_cache_dirs_file_name if use_library_dir else cache_dirs_file_name
+    dirs = {}
+
+    if not os.path.isfile(file_name):
+        return dirs
+
+    with open(file_name, encoding='utf-8-sig') as f:
+        for line in f:
+            if len(line) < 2:
+                continue
+            s = line.rstrip("\n").split(',', 2)  # modification_time_ns,files_count[:tracks_count],relative_dir_name
+            counts = s[1].split(':')
+            dirs[s[2]] = [int(s[0]), int(counts[0]), int(counts[1]) if len(counts) > 1 else None]
+    return dirs
+
+
+def write_cache_dirs_state(dirs: dict, use_library_dir=False):
+    file_name = library_cache_dirs_file_name if use_library_dir else cache_dirs_file_name
+    with open(file_name, "w", encoding='utf-8-sig') as f:
+        for rel_dir, data in dirs.items():
+            counts = f"{data[1]}:{data[2]}" if data[2] is not None else f"{data[1]}"
+            f.write(f"{data[0]},{counts},{rel_dir}\n")
+
+
+def update_cache_dirs_state(files_count_changes: dict, use_library_dir=False, tracks_count_changes: dict = None):
+    # called after the cache was changed by this program to avoid rescanning the changed folders
+    # tracks count change is None if it is unknown
+    dirs = read_cache_dirs_state(use_library_dir)
+    if len(dirs) == 0 or len(files_count_changes) == 0:
+        return
+    if tracks_count_changes is None:
+        tracks_count_changes = {}
+
+    read_dir = library_cache_dir if use_library_dir else cache_dir
+    for rel_dir, count_change in files_count_changes.items():
+        if rel_dir not in dirs:
+            continue
+        tracks_count = dirs[rel_dir][2]
+        tracks_count_change = tracks_count_changes.get(rel_dir, 0)
+        if tracks_count is not None:
+            tracks_count = None if tracks_count_change is None else tracks_count + tracks_count_change
+        try:
+            dirs[rel_dir] = [os.stat(os.path.join(read_dir, rel_dir)).st_mtime_ns, dirs[rel_dir][1] + count_change,
+                             tracks_count]
+        except OSError:
+            del dirs[rel_dir]
+    write_cache_dirs_state(dirs, use_library_dir)
+
+
+# [rel_dir] = HyperLogLog of isrcs of tracks in playlists of the folder
+def read_cache_sketches(use_library_dir=False) -> dict[str, HyperLogLog]:
+    file_name = library_cache_sketches_file_name if use_library_dir else cache_sketches_file_name
+    sketches = {}
+
+    if not os.path.isfile(file_name):
+        return sketches
+
+    with open(file_name, encoding='utf-8-sig') as f:
+        for line in f:
+            if len(line) < 2:
+                continue
+            s = line.rstrip("\n").split(',', 1)  # registers,relative_dir_name
+            try:
+                sketches[s[1]] = HyperLogLog.from_string(s[0])
+            except (IndexError, ValueError):
+                pass  # damaged line, the sketch will be built again
+    return sketches
+
+
+def write_cache_sketches(sketches: dict[str, HyperLogLog], use_library_dir=False):
+    file_name = library_cache_sketches_file_name if use_library_dir else cache_sketches_file_name
+    # the file is rewritten in place, so that the cache folder modification time does not change
+    with open(file_name, "w", encoding='utf-8-sig') as f:
+        for rel_dir, sketch in sketches.items():
+            f.write(f"{sketch.to_string()},{rel_dir}\n")
+
+
+def update_cache_sketches(sketches_changes: dict[str, HyperLogLog], use_library_dir=False):
+    # sketches can only grow, tracks of overwritten or deleted playlists stay counted until the folder is rescanned
+    # folders without sketch are skipped, their sketches will be built from all files when needed
+    sketches = read_cache_sketches(use_library_dir)
+    changed = False
+    for rel_dir, sketch in sketches_changes.items():
+        if rel_dir in sketches:
+            sketches[rel_dir].merge(sketch)
+            changed = True
+    if changed:
+        write_cache_sketches(sketches, use_library_dir)
+
+
+def remove_cache_sketches(rel_dirs, use_library_dir=False):
+    # all sketches are removed if rel_dirs is None
+    sketches = read_cache_sketches(use_library_dir)
+    if len(sketches) == 0:
+        return
+    if rel_dirs is None:
+        rel_dirs = list(sketches.keys())
+    removed = [rel_dir for rel_dir in rel_dirs if sketches.pop(rel_dir, None) is not None]
+    if len(removed) > 0:
+        write_cache_sketches(sketches, use_library_dir)
+
+
+def get_cache_totals(use_library_dir=False) -> (int, int):
+    # playlists and tracks counts are kept for each folder in the folders state, so the catalog is not read
+    if not is_cache_catalog_fresh(use_library_dir):
+        get_cache_catalog(use_library_dir)
+
+    dirs = read_cache_dirs_state(use_library_dir)
+    if any(data[2] is None for data in dirs.values()):
+        count_cached_tracks(use_library_dir)
+        dirs = read_cache_dirs_state(use_library_dir)
+
+    playlists_count = sum(data[1] for data in dirs.values())
+    tracks_count = sum(data[2] for data in dirs.values() if data[2] is not None)
+    return playlists_count, tracks_count
+
+
+def count_cached_tracks(use_library_dir=False):
+    # counts tracks of playlists added to the catalog by rescan or by previous versions
+    read_dir = library_cache_dir if use_library_dir else cache_dir
+    catalog = read_cache_catalog(use_library_dir)
+
+    unknown = [data for data in catalog.values() if data[2] is None]
+    if len(unknown) > 0:
+        with ThreadPoolExecutor(max_workers=THREADS_COUNT) as executor:
+            with click.progressbar(length=len(unknown), label=f'Counting tracks in {len(unknown)} cached playlists') \
+                    as bar:
+                file_names = [os.path.join(read_dir, data[1] + '.csv') for data in unknown]
+                for data, tracks_count in zip(unknown, executor.map(__count_csv_tracks, file_names)):
+                    data[2] = tracks_count
+                    bar.update(1)
+        write_cache_catalog(catalog, use_library_dir)
+
+    dirs = read_cache_dirs_state(use_library_dir)
+    for rel_dir, tracks_count in __get_tracks_count_by_dirs(catalog, dirs.keys()).items():
+        dirs[rel_dir][2] = tracks_count
+    write_cache_dirs_state(dirs, use_library_dir)
+
+
+def __count_csv_tracks(file_name: str) -> int:
+    # number of lines without header, it is much faster than parsing csv
+    try:
+        with open(file_name, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return 0
+    lines = data.count(b'\n')
+    if len(data) > 0 and not data.endswith(b'\n'):
+        lines += 1
+    return max(0, lines - 1)
+
+
+def get_unique_cached_tracks_estimate(use_library_dir=False) -> int:
+    read_dir = library_cache_dir if use_library_dir else cache_dir
+    catalog = get_cache_catalog(use_library_dir)
+
+    files_by_dirs = {}
+    for data in catalog.values():
+        files_by_dirs.setdefault(__get_rel_dir(data[1]), []).append(data[1])
+
+    sketches = read_cache_sketches(use_library_dir)
+    changed = False
+    for rel_dir in list(sketches.keys()):
+        if rel_dir not in files_by_dirs:
+            del sketches[rel_dir]
+            changed = True
+
+    # build sketches of folders that have not been read yet or were changed by other programs
+    missing_dirs = [rel_dir for rel_dir in files_by_dirs if rel_dir not in sketches]
+    if len(missing_dirs) > 0:
+        files_count = sum(len(files_by_dirs[rel_dir]) for rel_dir in missing_dirs)
+        with click.progressbar(length=files_count, label=f'Reading {files_count} cached playlists') as bar:
+            for rel_dir in missing_dirs:
+                sketch = HyperLogLog()
+                for rel_basename in files_by_dirs[rel_dir]:
+                    try:
+                        tags_list = csv_playlist.read_tags_from_csv_fast(
+                            os.path.join(read_dir, rel_basename + '.csv'), ['ISRC'], True)
+                    except OSError:
+                        tags_list = []
+                    sketch.add_all(tags['ISRC'] for tags in tags_list if 'ISRC' in tags)
+                    bar.update(1)
+                sketches[rel_dir] = sketch
+        changed = True
+
+    if changed:
+        write_cache_sketches(sketches, use_library_dir)
+
+    total = HyperLogLog()
+    for sketch in sketches.values():
+        total.merge(sketch)
+    return total.count()
+
+
+def is_cache_catalog_fresh(use_library_dir=False):
+    # any file added, removed or renamed in cache folders changes the modification time of the folder
+    read_dir = library_cache_dir if use_library_dir else cache_dir
+    file_name = library_cache_catalog_file_name if use_library_dir else cache_catalog_file_name
+
+    if not os.path.isfile(file_name):
+        return False
+
+    dirs = read_cache_dirs_state(use_library_dir)
+    if len(dirs) == 0:
+        return False
+
+    for rel_dir, data in dirs.items():
+        try:
+            if os.stat(os.path.join(read_dir, rel_dir)).st_mtime_ns != data[0]:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def get_cache_catalog(use_library_dir=False) -> {}:
+    if not is_cache_catalog_fresh(use_library_dir):
+        click.echo("Cache catalog is outdated. Rescanning changed cache folders.")
+        rescan_cache_dir_catalog(use_library_dir)
+    return read_cache_catalog(use_library_dir)
+
+
+def get_catalog_playlist_name(rel_basename: str):
+    base_name = rel_basename.replace("\\", "/").split("/")[-1]
+    name = base_name[23:]  # file name is "id name", id is 22 characters long
+    if name == "":
+        name = "Unknown"
+    return name
+
+
+# [id] = playlist_name
+def get_cached_playlists_names(use_library_dir=False) -> dict[str, str]:
+    catalog = get_cache_catalog(use_library_dir)
+    res = {}
+    for id, data in catalog.items():
+        res[id] = get_catalog_playlist_name(data[1])
+    return res
+
+
+# ids of cached playlists whose names match the regex (names and regex are compared in upper case)
+def get_cached_playlist_ids_by_name(pattern: str, use_library_dir=False) -> List[str]:
+    index = get_cache_names_index(use_library_dir)
+    return index.search(pattern.upper())
+
+
+# indexes of catalogs: [names_index_file_name] = [catalog, index]
+names_indexes = {}
+
+
+def get_cache_names_index(use_library_dir=False) -> PlaylistNamesIndex:
+    import pickle
+
+    file_name = library_cache_names_index_file_name if use_library_dir else cache_names_index_file_name
+    catalog_file_name = library_cache_catalog_file_name if use_library_dir else cache_catalog_file_name
+
+    catalog = get_cache_catalog(use_library_dir)
+    if file_name in names_indexes and names_indexes[file_name][0] is catalog:
+        return names_indexes[file_name][1]
+
+    # the index saved for the same catalog file is used as is, otherwise it is updated with the changed playlists
+    catalog_key = None
+    if os.path.isfile(catalog_file_name):
+        stat = os.stat(catalog_file_name)
+        catalog_key = (stat.st_mtime_ns, stat.st_size)
+
+    index = names_indexes[file_name][1] if file_name in names_indexes else None
+    saved_key = None
+    if index is None and os.path.isfile(file_name) and os.path.getsize(file_name) > 0:
+        try:
+            with open(file_name, 'rb') as f:
+                saved_key, index = pickle.load(f)
+        except Exception:
+            index = None
+    if index is None:
+        index = PlaylistNamesIndex()
+
+    if saved_key is None or saved_key != catalog_key:
+        names = {}
+        for id, data in catalog.items():
+            names[id] = get_catalog_playlist_name(data[1]).upper()
+        index.update(names)
+        # the file is rewritten in place, so that the cache folder modification time does not change
+        try:
+            if write_cache_state:
+                with open(file_name, 'wb') as f:
+                    pickle.dump((catalog_key, index), f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            click.echo(f'\nCant write playlist names index: "{file_name}"')
+
+    names_indexes[file_name] = [catalog, index]
+    return index
+
+
+# features caches loaded by this process: [features_file_name] = features
+features_caches = {}
+
+
+def get_cache_features(use_library_dir=False) -> PlaylistFeaturesCache:
+    import pickle
+
+    file_name = library_cache_features_file_name if use_library_dir else cache_features_file_name
+    if file_name in features_caches:
+        return features_caches[file_name]
+
+    features = None
+    if os.path.isfile(file_name) and os.path.getsize(file_name) > 0:
+        try:
+            with open(file_name, 'rb') as f:
+                features = pickle.load(f)
+            if features.version != FEATURES_VERSION:
+                features = None
+        except Exception:
+            features = None
+    if features is None:
+        features = PlaylistFeaturesCache()
+    else:
+        features.changed = False
+
+    features_caches[file_name] = features
+    return features
+
+
+def write_cache_features(features: PlaylistFeaturesCache, use_library_dir=False):
+    import pickle
+
+    if not features.changed or not write_cache_state:
+        return
+
+    file_name = library_cache_features_file_name if use_library_dir else cache_features_file_name
+    # the file is rewritten in place, so that the cache folder modification time does not change
+    try:
+        with open(file_name, 'wb') as f:
+            pickle.dump(features, f, protocol=pickle.HIGHEST_PROTOCOL)
+        features.changed = False
+    except OSError:
+        click.echo(f'\nCant write playlist features cache: "{file_name}"')
+
+
+def get_similarity_index_version(data: list) -> str:
+    return f'{data[0]},{data[1]}'
+
+
+def append_cache_minhashes(minhashes: List[list], use_library_dir=False):
+    # minhashes - [file_date, rel_basename, signature], they are added to the similarity index when it is used
+    # the file is created when the cache is scanned, so that appending does not change the folder modification time
+    file_name = library_cache_minhash_file_name if use_library_dir else cache_minhash_file_name
+    if len(minhashes) == 0 or not os.path.isfile(file_name):
+        return
+    with open(file_name, "a", encoding='utf-8-sig') as f:
+        for file_date, rel_basename, signature in minhashes:
+            value = base64.b64encode(signature).decode('ascii') if signature is not None else ""
+            f.write(f"{file_date},{value},{rel_basename}\n")
+
+
+# similarity indexes loaded by this process: [similarity_index_file_name] = index
+similarity_indexes = {}
+
+
+# index_new_playlists - signatures of new playlists without saved signatures are computed from their files
+def get_cache_similarity_index(use_library_dir=False, index_new_playlists=True) -> PlaylistSimilarityIndex:
+    import pickle
+
+    file_name = library_cache_similarity_index_file_name if use_library_dir else cache_similarity_index_file_name
+    minhash_file_name = library_cache_minhash_file_name if use_library_dir else cache_minhash_file_name
+    read_dir = library_cache_dir if use_library_dir else cache_dir
+    catalog = get_cache_catalog(use_library_dir)
+
+    index = similarity_indexes.get(file_name)
+    if index is None and os.path.isfile(file_name) and os.path.getsize(file_name) > 0:
+        try:
+            with open(file_name, 'rb') as f:
+                index = pickle.load(f)
+            if getattr(index, 'version', None) != SIMILARITY_INDEX_VERSION:
+                index = None
+        except Exception:
+            index = None
+    if index is None:
+        index = PlaylistSimilarityIndex()
+    changed = False
+
+    count = len(index.rows)
+    index.retain(catalog)
+    changed = changed or count != len(index.rows)
+
+    # signatures computed when the playlists were cached
+    absorbed = False
+    if os.path.isfile(minhash_file_name) and os.path.getsize(minhash_file_name) > 0:
+        with open(minhash_file_name, encoding='utf-8-sig') as f:
+            for line in f:
+                if len(line) < 2:
+                    continue
+                s = line.rstrip("\n").split(',', 2)  # file_date,signature,relative_file_name
+                try:
+                    id = os.path.basename(s[2])[:22]
+                    signature = base64.b64decode(s[1]) if s[1] != "" else None
+                except (IndexError, ValueError):
+                    continue  # damaged line, the signature will be computed from the file
+                if id in catalog and str(catalog[id][0]) == s[0] and catalog[id][1] == s[2]:
+                    index.put(id, get_similarity_index_version(catalog[id]), signature)
+                    changed = True
+        absorbed = True
+
+    # signatures of other new and changed playlists are computed from their files
+    ids_by_file_names = {}
+    for id, data in catalog.items():
+        if index.get_version(id) != get_similarity_index_version(data):
+            ids_by_file_names[os.path.join(read_dir, data[1] + '.csv')] = id
+    if len(ids_by_file_names) > 0 and index_new_playlists:
+        for file_name_in_cache, signature in read_cache_minhashes(list(ids_by_file_names.keys())):
+            id = ids_by_file_names[file_name_in_cache]
+            index.put(id, get_similarity_index_version(catalog[id]), signature)
+        changed = True
+
+    if changed and write_cache_similarity_index(index, use_library_dir) and absorbed:
+        open(minhash_file_name, "w", encoding='utf-8-sig').close()
+
+    similarity_indexes[file_name] = index
+    return index
+
+
+def write_cache_similarity_index(index: PlaylistSimilarityIndex, use_library_dir=False) -> bool:
+    import pickle
+
+    if not write_cache_state:
+        return False
+
+    file_name = library_cache_similarity_index_file_name if use_library_dir else cache_similarity_index_file_name
+    # the file is rewritten in place, so that the cache folder modification time does not change
+    try:
+        with open(file_name, 'wb') as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return True
+    except OSError:
+        click.echo(f'\nCant write playlists similarity index: "{file_name}"')
+        return False
+
+
+# clusters of exact and near duplicate playlists, the playlist with more tracks (newer if equal) is the first,
+# all other playlists of a cluster are similar to the first one
+# found_only - None is returned if the clusters were not found since the cache changed
+def get_cache_clusters(use_library_dir=False, min_similarity=None, index_new_playlists=True,
+                       found_only=False) -> List[List[str]]:
+    if min_similarity is None:
+        min_similarity = DUPLICATE_SIMILARITY
+
+    index = get_cache_similarity_index(use_library_dir, index_new_playlists)
+    if index.clusters is not None and index.clusters_similarity == min_similarity:
+        return index.clusters
+    if found_only:
+        return None
+
+    catalog = get_cache_catalog(use_library_dir)
+    clusters = index.get_clusters(min_similarity, lambda id: (catalog[id][2] or 0, int(catalog[id][0])))
+    write_cache_similarity_index(index, use_library_dir)
+    write_cache_clusters(clusters, use_library_dir)
+    return clusters
+
+
+def write_cache_clusters(clusters: List[List[str]], use_library_dir=False):
+    if not write_cache_state:
+        return
+
+    file_name = library_cache_clusters_file_name if use_library_dir else cache_clusters_file_name
+    # the file is rewritten in place, so that the cache folder modification time does not change
+    with open(file_name, "w", encoding='utf-8-sig') as f:
+        for cluster in clusters:
+            f.write(",".join(cluster) + "\n")  # representative_id,duplicate_id,...
+
+
+# [duplicate_id] = representative_id
+# found_only - None is returned if the clusters were not found since the cache changed
+def get_cache_duplicates(use_library_dir=False, min_similarity=None, index_new_playlists=True,
+                         found_only=False) -> dict[str, str]:
+    clusters = get_cache_clusters(use_library_dir, min_similarity, index_new_playlists, found_only)
+    if clusters is None:
+        return None
+    duplicates = {}
+    for cluster in clusters:
+        for id in cluster[1:]:
+            duplicates[id] = cluster[0]
+    return duplicates
+
+
+def cache_dedupe(min_similarity=None, confirm=False):
+    catalog = get_cache_catalog()
+    duplicates = get_cache_duplicates(False, min_similarity)
+    if len(duplicates) == 0:
+        click.echo('No duplicate playlists found in the cache.')
+        return
+
+    file_names = [os.path.join(cache_dir, catalog[id][1] + '.csv') for id in duplicates]
+    size = sum(os.path.getsize(file_name) for file_name in file_names if os.path.isfile(file_name))
+    click.echo(f'{len(duplicates)} duplicate playlists found in {len(set(duplicates.values()))} clusters '
+               f'({size / 1024 / 1024:.1f} MB).')
+    if not confirm:
+        click.confirm(f'Are you sure you want to delete {len(duplicates)} duplicate cached playlists?', abort=True)
+
+    with click.progressbar(file_names, label=f'Deleting duplicate playlists') as bar:
         for file_name in bar:
-            add_to_cache_catalog(catalog, file_name, True)
-    write_cache_catalog(catalog, True)
+            try:
+                os.remove(file_name)
+            except OSError:
+                click.echo(f'\nCant delete file: "{file_name}"')
+
+    rescan_cache_dir_catalog(False)
+
+
+# [id] = [last_top_time, best_points]
+def read_cache_stats() -> dict[str, list]:
+    stats = {}
+
+    if not os.path.isfile(cache_stats_file_name):
+        return stats
+
+    with open(cache_stats_file_name, encoding='utf-8-sig') as f:
+        for line in f:
+            if len(line) < 2:
+                continue
+            s = line.rstrip("\n").split(',')  # id,last_top_time,best_points
+            stats[s[0]] = [int(s[1]), float(s[2])]
+    return stats
+
+
+def write_cache_stats(stats: dict[str, list]):
+    if not write_cache_state:
+        return
+
+    with open(cache_stats_file_name, "w", encoding='utf-8-sig') as f:
+        for id, data in stats.items():
+            f.write(f"{id},{data[0]},{data[1]:.2f}\n")
+
+
+# results - sorted results of cache-find-best, the best playlists are at the end
+def update_cache_stats(results: List[List[PlaylistInfo]]):
+    if all(len(infos) == 0 for infos in results):
+        return
+
+    catalog = get_cache_catalog()
+    stats = read_cache_stats()
+    now = int(time.time())
+    for infos in results:
+        for i, info in enumerate(infos):
+            if info.playlist_id not in catalog:
+                continue
+            data = stats.setdefault(info.playlist_id, [0, info.points])
+            data[1] = max(data[1], info.points)
+            if len(infos) - i <= EVICTION_TOP_COUNT:
+                data[0] = now
+    write_cache_stats({id: data for id, data in stats.items() if id in catalog})
+
+
+# playlists are evicted in this order:
+# never were in the top results, with the lowest best points,
+# never were scored, the least recently refreshed,
+# were in the top results, the least recently
+def get_eviction_order(catalog: dict, stats: dict) -> List[str]:
+    def get_key(id):
+        data = stats.get(id)
+        if data is None:
+            return 0, 1, 0, int(catalog[id][0])
+        return data[0], 0, data[1], int(catalog[id][0])
+
+    return sorted(catalog.keys(), key=get_key)
+
+
+def get_playlists_to_evict(max_playlists=None, max_size_mb=None, max_age_days=None) -> (List[str], int):
+    if max_playlists is None:
+        max_playlists = CACHE_MAX_PLAYLISTS
+    if max_size_mb is None:
+        max_size_mb = CACHE_MAX_SIZE_MB
+    if max_age_days is None:
+        max_age_days = CACHE_MAX_AGE_DAYS
+
+    catalog = get_cache_catalog()
+    evicted = []
+    evicted_size = 0
+
+    if max_playlists <= 0 and max_size_mb <= 0 and max_age_days <= 0:
+        return evicted, evicted_size
+
+    # sizes are read only if the size is limited
+    sizes = {}
+    if max_size_mb > 0:
+        for id, data in catalog.items():
+            try:
+                sizes[id] = os.path.getsize(os.path.join(cache_dir, data[1] + '.csv'))
+            except OSError:
+                sizes[id] = 0
+
+    stats = read_cache_stats()
+    order = get_eviction_order(catalog, stats)
+
+    # playlists not refreshed and not in the top results for a long time are evicted first
+    if max_age_days > 0:
+        expired_date = time.time() - max_age_days * 24 * 60 * 60
+        expired = set(id for id in order if int(catalog[id][0]) < expired_date
+                      and (id not in stats or stats[id][0] < expired_date))
+        order = [id for id in order if id in expired] + [id for id in order if id not in expired]
+    else:
+        expired = set()
+
+    count = len(catalog)
+    size = sum(sizes.values())
+    for id in order:
+        if id not in expired and (max_playlists <= 0 or count <= max_playlists) \
+                and (max_size_mb <= 0 or size <= max_size_mb * 1024 * 1024):
+            break
+        evicted.append(id)
+        count -= 1
+        size -= sizes.get(id, 0)
+        evicted_size += sizes.get(id, 0)
+    return evicted, evicted_size
+
+
+def cache_evict(max_playlists=None, max_size_mb=None, max_age_days=None, confirm=False) -> int:
+    ids, size = get_playlists_to_evict(max_playlists, max_size_mb, max_age_days)
+    if len(ids) == 0:
+        return 0
+
+    size_info = f' ({size / 1024 / 1024:.1f} MB)' if size > 0 else ''
+    if not confirm:
+        click.confirm(f'Are you sure you want to evict {len(ids)} cached playlists{size_info}?', abort=True)
+
+    removed = remove_cached_playlists(ids)
+    click.echo(f'{removed} cached playlists evicted{size_info}.')
+    return removed
+
+
+# deletes playlists from the cache folder and updates the catalog without rescanning
+def remove_cached_playlists(ids: List[str]) -> int:
+    catalog = dict(get_cache_catalog())
+    files_count_changes = {}
+    tracks_count_changes = {}
+    removed = 0
+
+    for id in ids:
+        data = catalog.get(id)
+        if data is None:
+            continue
+        file_name = os.path.join(cache_dir, data[1] + '.csv')
+        try:
+            os.remove(file_name)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            click.echo(f'\nCant delete file: "{file_name}"')
+            continue
+        del catalog[id]
+        removed += 1
+
+        rel_dir = __get_rel_dir(data[1])
+        files_count_changes[rel_dir] = files_count_changes.get(rel_dir, 0) - 1
+        if data[2] is None or tracks_count_changes.get(rel_dir, 0) is None:
+            tracks_count_changes[rel_dir] = None
+        else:
+            tracks_count_changes[rel_dir] = tracks_count_changes.get(rel_dir, 0) - data[2]
+
+    if removed > 0:
+        # indexes and features of removed playlists are dropped when they are read next time
+        write_cache_catalog(catalog)
+        update_cache_dirs_state(files_count_changes, False, tracks_count_changes)
+        remove_cache_sketches(files_count_changes.keys())
+        stats = read_cache_stats()
+        if any(id not in catalog for id in stats):
+            write_cache_stats({id: data for id, data in stats.items() if id in catalog})
+    return removed
+
+
+# [csv_file_name, minhash signature]
+def read_cache_minhashes(csvs_in_path: List[str]) -> List[list]:
+    import numpy as np
+    from multiprocessing import Process, Queue, Value
+
+    res = []
+
+    # multi thread
+    try:
+        parts = np.array_split(csvs_in_path, THREADS_COUNT)
+        threads = []
+        counters = []
+        results = Queue()
+
+        with click.progressbar(length=len(csvs_in_path),
+                               label=f'Indexing {len(csvs_in_path)} cached playlists') as bar:
+            # start threads
+            for i, part in enumerate(parts):
+                counter = Value('i', 0)
+                counters.append(counter)
+                playlists_part = list(part)
+                thread = Process(target=__read_minhashes_thread, args=(playlists_part, counter, results))
+                threads.append(thread)
+                thread.daemon = True  # This thread dies when main thread exits
+                thread.start()
+
+                # update bar
+                total = sum([x.value for x in counters])
+                added = total - bar.pos
+                if added > 0:
+                    bar.update(added)
+
+            # waiting for complete
+            while not bar.finished:
+                time.sleep(0.1)
+                total = sum([x.value for x in counters])
+                added = total - bar.pos
+                if added > 0:
+                    bar.update(added)
+
+            # combine results
+            for i in range(len(parts)):
+                res.extend(results.get())
+
+    except (KeyboardInterrupt, SystemExit):  # aborted by user
+        click.echo()
+        click.echo('Aborted.')
+        sys.exit()
+
+    return res
+
+
+def __read_minhashes_thread(csv_filenames, counter, result):
+    res = []
+
+    for i, file_name in enumerate(csv_filenames):
+        tags = csv_playlist.read_tags_from_csv_fast(file_name, ['ISRC'], True)
+        res.append([str(file_name), get_minhash(tag['ISRC'] for tag in tags if 'ISRC' in tag)])
+
+        if (i + 1) % 100 == 0:
+            counter.value += 100
+        if i + 1 == len(csv_filenames):
+            counter.value += (i % 100) + 1
+    result.put(res)
+
+
+# [id] = csv_file_name of cached playlists modified less than fresh_min minutes ago
+def get_fresh_cached_playlists(playlist_ids: List[str], fresh_min=None) -> dict[str, str]:
+    if fresh_min is None:
+        fresh_min = CACHE_FRESH_MIN
+
+    res = {}
+    if fresh_min <= 0 or len(playlist_ids) == 0:
+        return res
+
+    now = time.time()
+    for use_library_dir in [True, False]:
+        dir = library_cache_dir if use_library_dir else cache_dir
+        catalog = get_cache_catalog(use_library_dir)
+        for id in playlist_ids:
+            if id in res or id not in catalog:
+                continue
+            if now - int(catalog[id][0]) < fresh_min * 60:
+                res[id] = os.path.join(dir, catalog[id][1] + '.csv')
+    return res
+
+
+# catalogs read from disk: [catalog_file_name] = [file_mtime, file_size, catalog]
+read_catalogs = {}
 
 
 def read_cache_catalog(use_library_dir=False) -> {}:
-    click.echo("Reading cache catalog...")
     if use_library_dir:
         file_name = library_cache_catalog_file_name
     else:
@@ -664,15 +2093,26 @@ def read_cache_catalog(use_library_dir=False) -> {}:
     if not os.path.isfile(file_name):
         return catalog
 
+    stat = os.stat(file_name)
+    if file_name in read_catalogs:
+        file_date, file_size, catalog = read_catalogs[file_name]
+        if file_date == stat.st_mtime and file_size == stat.st_size:
+            return catalog
+        catalog = {}
+
+    click.echo("Reading cache catalog...")
     with open(file_name, encoding='utf-8-sig') as f:
         for line in f:
             if len(line) < 2:
                 continue
-            s = line.split(',', 1)  # creation_time,relative_file_name
-            s[1] = s[1].rstrip()
-            base_name = s[1].split("\\")[-1]
+            s = line.split(',', 1)  # creation_time[:tracks_count],relative_file_name
+            rel_basename = s[1].rstrip()
+            base_name = rel_basename.replace("\\", "/").split("/")[-1]
             id = base_name[:22]  # get id from first 22 characters of file name
-            catalog[id] = s
+            file_date, sep, tracks_count = s[0].partition(':')
+            catalog[id] = [file_date, rel_basename, int(tracks_count) if sep != "" else None]
+
+    read_catalogs[file_name] = [stat.st_mtime, stat.st_size, catalog]
     return catalog
 
 
@@ -683,9 +2123,14 @@ def write_cache_catalog(catalog, use_library_dir=False):
         file_name = cache_catalog_file_name
     with open(file_name, "w", encoding='utf-8-sig') as cache_catalog_file:
         for id, data in catalog.items():
-            file_date = data[0]
-            base_name = data[1]
-            cache_catalog_file.write(f"{file_date},{base_name}\n")
+            cache_catalog_file.write(format_cache_catalog_line(data[0], data[1], data[2]))
+
+
+def format_cache_catalog_line(file_date, rel_basename: str, tracks_count: int = None):
+    # tracks count is omitted if it is unknown (catalogs written by previous versions have no tracks counts)
+    if tracks_count is None:
+        return f"{file_date},{rel_basename}\n"
+    return f"{file_date}:{tracks_count},{rel_basename}\n"
 
 
 def add_to_cache_catalog(catalog, cache_file_name, use_library_dir=False):
@@ -698,7 +2143,7 @@ def add_to_cache_catalog(catalog, cache_file_name, use_library_dir=False):
     base_name = os.path.splitext(os.path.basename(cache_file_name))[0]
     id = os.path.basename(base_name)[:22]
     file_date = int(os.path.getmtime(cache_file_name))
-    catalog[id] = [file_date, rel_basename]
+    catalog[id] = [file_date, rel_basename, None]
 
 
 def append_cache_catalog(cache_file_names: List[str], use_library_dir=False):
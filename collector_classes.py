@@ -141,6 +141,33 @@ class Mirror:
         self.name = None
 
 
+class Subscription:
+    playlist_id: str
+    mirror_name: str
+    group: str
+    from_cache: bool
+    generate_unique_name: bool
+
+    def __init__(self, playlist_id: str, mirror_name: str = None, group: str = "MIRROR", from_cache=False,
+                 generate_unique_name=False):
+        self.playlist_id = playlist_id
+        self.mirror_name = mirror_name
+        self.group = group
+        self.from_cache = from_cache
+        self.generate_unique_name = generate_unique_name
+
+
+class MirrorState:
+    mirror_snapshot_id: str
+    listened_version: str
+    sub_snapshot_ids: dict
+
+    def __init__(self):
+        self.mirror_snapshot_id = ""
+        self.listened_version = ""
+        self.sub_snapshot_ids = {}
+
+
 class FindBestTracksParams:
     lib: UserLibrary
     ref_tracks: TracksCollection
@@ -149,6 +176,7 @@ class FindBestTracksParams:
     min_ref_percentage: int
     min_ref_tracks: int
     sorting: str
+    reverse_sorting: bool
     filter_names: str
     listened_accuracy: int
     fav_weight: float
@@ -163,6 +191,7 @@ class FindBestTracksParams:
         self.min_ref_percentage = 0
         self.min_ref_tracks = 0
         self.sorting = "none"
+        self.reverse_sorting = False
         self.listened_accuracy = 100
         self.fav_weight = 1
         self.ref_weight = 1
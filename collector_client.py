@@ -0,0 +1,259 @@
+import json
+import os.path
+import random
+import threading
+import time
+import urllib.parse
+from typing import List
+
+SPOTIFY_API_PREFIX = "https://api.spotify.com/v1/"
+
+BASE62 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+
+def create_client(internal_call):
+    import spotipy
+
+    # high level spotipy methods build requests and parse responses as usual, only the http call is replaced
+    sp = spotipy.Spotify(auth='offline')
+    sp._internal_call = internal_call
+    return sp
+
+
+def get_request_key(method: str, url: str, payload, params: dict):
+    if not url.startswith("http"):
+        url = SPOTIFY_API_PREFIX + url
+    parsed = urllib.parse.urlsplit(url)
+    query = dict(urllib.parse.parse_qsl(parsed.query))
+    for key, value in (params or {}).items():
+        if value is not None:
+            query[key] = str(value)
+    path = parsed.path.rstrip('/')
+    return json.dumps([method, path, sorted(query.items()), payload], sort_keys=True)
+
+
+def raise_spotify_error(status: int, msg: str = None, headers: dict = None):
+    from spotipy import SpotifyException
+    raise SpotifyException(status, -1, msg or str(status), headers=headers or {})
+
+
+class SessionRecorder:
+    file_name: str
+
+    def __init__(self, internal_call, file_name: str):
+        self.internal_call = internal_call
+        self.file_name = file_name
+        self.lock = threading.Lock()
+
+    def __call__(self, method: str, url: str, payload, params: dict):
+        record = {'request': get_request_key(method, url, payload, params)}
+        try:
+            result = self.internal_call(method, url, payload, params)
+            record['response'] = result
+            return result
+        except Exception as e:
+            status = getattr(e, 'http_status', None)
+            if status is None:
+                raise
+            record['error'] = status
+            record['msg'] = getattr(e, 'msg', None)
+            record['headers'] = dict(getattr(e, 'headers', None) or {})
+            raise
+        finally:
+            with self.lock:
+                with open(self.file_name, 'a', encoding='utf-8') as file:
+                    file.write(json.dumps(record) + '\n')
+
+
+class SessionReplayer:
+    file_name: str
+    responses: dict[str, List[dict]]
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.responses = {}
+        self.lock = threading.Lock()
+
+        if os.path.isfile(file_name):
+            with open(file_name, 'r', encoding='utf-8') as file:
+                for line in file:
+                    if line.strip() == "":
+                        continue
+                    record = json.loads(line)
+                    self.responses.setdefault(record['request'], []).append(record)
+
+    def __call__(self, method: str, url: str, payload, params: dict):
+        key = get_request_key(method, url, payload, params)
+
+        # repeated requests get the recorded responses in the same order, the last one is repeated
+        with self.lock:
+            records = self.responses.get(key)
+            if records is None:
+                raise_spotify_error(404, f'Request is not recorded: {key}')
+            record = records.pop(0) if len(records) > 1 else records[0]
+
+        if 'error' in record:
+            raise_spotify_error(record['error'], record.get('msg'), record.get('headers'))
+        return record.get('response')
+
+
+class FakeSpotify:
+    user_id: str
+    latency: float
+    page_size: int
+    rate_limit_every: int
+    retry_after: float
+    playlists: dict[str, dict]
+    tracks: dict[str, dict]
+    liked_track_ids: set
+    requests_count: int
+
+    def __init__(self, latency_ms: float = 0, page_size: int = 100, rate_limit_every: int = 0,
+                 retry_after: float = 1, user_id: str = 'fake_user', seed: int = 1):
+        self.user_id = user_id
+        self.latency = latency_ms / 1000
+        self.page_size = page_size
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.playlists = {}
+        self.tracks = {}
+        self.liked_track_ids = set()
+        self.requests_count = 0
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def new_id(self):
+        return ''.join(self.random.choice(BASE62) for i in range(22))
+
+    def add_tracks(self, count: int) -> List[str]:
+        ids = []
+        for i in range(count):
+            id = self.new_id()
+            n = len(self.tracks) + 1
+            self.tracks[id] = {
+                'id': id,
+                'uri': f'spotify:track:{id}',
+                'name': f'Track {n}',
+                'artists': [{'name': f'Artist {n % 997}'}],
+                'album': {'id': self.new_id(), 'name': f'Album {n % 4999}', 'release_date': '2020-01-01'},
+                'duration_ms': 120000 + n % 180000,
+                'explicit': False,
+                'track_number': 1,
+                'external_ids': {'isrc': f'FAKE{n:08d}'},
+            }
+            ids.append(id)
+        return ids
+
+    def add_playlist(self, name: str, track_ids: List[str], owner_id: str = None) -> str:
+        id = self.new_id()
+        self.playlists[id] = {
+            'id': id,
+            'name': name,
+            'owner': {'id': owner_id or self.user_id},
+            'track_ids': list(track_ids),
+            'version': 1,
+        }
+        return id
+
+    def __call__(self, method: str, url: str, payload, params: dict):
+        with self.lock:
+            self.requests_count += 1
+            rate_limited = self.rate_limit_every > 0 and self.requests_count % self.rate_limit_every == 0
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if rate_limited:
+            raise_spotify_error(429, 'Too many requests', {'Retry-After': str(self.retry_after)})
+
+        if not url.startswith("http"):
+            url = SPOTIFY_API_PREFIX + url
+        parsed = urllib.parse.urlsplit(url)
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+        for key, value in (params or {}).items():
+            if value is not None:
+                query[key] = str(value)
+        path = parsed.path.split('/v1/', 1)[-1].strip('/').split('/')
+
+        with self.lock:
+            return self.__handle(method, path, query, payload)
+
+    def __handle(self, method: str, path: List[str], query: dict, payload):
+        offset = int(query.get('offset', 0))
+        limit = min(int(query.get('limit', self.page_size)), self.page_size)
+
+        if path == ['me']:
+            return {'id': self.user_id}
+
+        if path == ['me', 'playlists'] and method == 'GET':
+            playlists = [p for p in self.playlists.values() if p['owner']['id'] == self.user_id]
+            items = [self.__simple_playlist(p) for p in playlists[offset:offset + limit]]
+            return self.__page(items, len(playlists), offset, limit, 'me/playlists')
+
+        if method == 'POST' and (path == ['me', 'playlists'] or (path[0] == 'users' and path[-1] == 'playlists')):
+            id = self.add_playlist(payload['name'], [])
+            return self.__simple_playlist(self.playlists[id])
+
+        if path[:2] in (['me', 'tracks'], ['me', 'library']) and path[-1] == 'contains':
+            ids = query.get('ids') or query.get('uris') or ''
+            ids = [id.split(':')[-1] for id in ids.split(',') if id != '']
+            return [id in self.liked_track_ids for id in ids]
+
+        if path == ['search']:
+            q = query.get('q', '').lower()
+            found = [p for p in self.playlists.values() if q in p['name'].lower()]
+            items = [self.__simple_playlist(p) for p in found[offset:offset + limit]]
+            return {'playlists': self.__page(items, len(found), offset, limit, 'search')}
+
+        if path[0] == 'playlists' and len(path) >= 2:
+            playlist = self.playlists.get(path[1])
+            if playlist is None:
+                raise_spotify_error(404, 'Not found')
+
+            if len(path) == 2 and method == 'GET':
+                result = self.__simple_playlist(playlist)
+                result['tracks'] = self.__tracks_page(playlist, 0, limit)
+                return result
+
+            if path[2] in ['tracks', 'items'] and method == 'GET':
+                return self.__tracks_page(playlist, offset, limit)
+
+            if path[2] in ['tracks', 'items'] and method == 'POST':
+                playlist['track_ids'].extend(uri.split(':')[-1] for uri in payload)
+                playlist['version'] += 1
+                return {'snapshot_id': self.__snapshot_id(playlist)}
+
+            if path[2] in ['tracks', 'items'] and method == 'DELETE':
+                items = payload.get('items', payload.get('tracks', []))
+                ids = set(item['uri'].split(':')[-1] for item in items)
+                playlist['track_ids'] = [id for id in playlist['track_ids'] if id not in ids]
+                playlist['version'] += 1
+                return {'snapshot_id': self.__snapshot_id(playlist)}
+
+            if path[2] == 'followers' and method == 'DELETE':
+                del self.playlists[playlist['id']]
+                return None
+
+        raise_spotify_error(400, f'Request is not supported by fake client: {method} {"/".join(path)}')
+
+    def __snapshot_id(self, playlist: dict):
+        return f'{playlist["id"]}-{playlist["version"]}'
+
+    def __simple_playlist(self, playlist: dict):
+        return {
+            'id': playlist['id'],
+            'name': playlist['name'],
+            'owner': {'id': playlist['owner']['id']},
+            'snapshot_id': self.__snapshot_id(playlist),
+            'tracks': {'total': len(playlist['track_ids'])},
+        }
+
+    def __tracks_page(self, playlist: dict, offset: int, limit: int):
+        ids = playlist['track_ids']
+        items = [{'added_at': '2021-12-19T19:35:17Z', 'track': dict(self.tracks[id])}
+                 for id in ids[offset:offset + limit] if id in self.tracks]
+        return self.__page(items, len(ids), offset, limit, f'playlists/{playlist["id"]}/tracks')
+
+    def __page(self, items: list, total: int, offset: int, limit: int, path: str):
+        next_url = None
+        if offset + limit < total:
+            next_url = f'{SPOTIFY_API_PREFIX}{path}?offset={offset + limit}&limit={limit}'
+        return {'items': items, 'total': total, 'offset': offset, 'limit': limit, 'next': next_url}
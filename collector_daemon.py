@@ -0,0 +1,131 @@
+from spoty.plugins.collector.collector_settings import daemon_socket_file_name as socket_file_name
+
+import os.path
+import click
+import contextlib
+import io
+import json
+import socket
+import sys
+
+DAEMON_COMMANDS = ["cache-find-best", "info", "stats", "list", "update"]
+
+
+def serve(command_group: click.Group, file_name: str = None):
+    if file_name is None:
+        file_name = socket_file_name
+
+    if os.path.exists(file_name):
+        if is_running(file_name):
+            click.echo(f'Collector daemon is already running ({file_name}).')
+            return
+        os.remove(file_name)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(file_name)
+    server.listen()
+    click.echo(f'Collector daemon is listening on {file_name}')
+
+    try:
+        # commands share the loaded library, listened list and cache catalog, so they are executed one by one
+        while True:
+            conn, address = server.accept()
+            with conn:
+                try:
+                    __handle_connection(command_group, conn)
+                except OSError:
+                    pass  # client disconnected
+    except KeyboardInterrupt:
+        click.echo('Stopped.')
+    finally:
+        server.close()
+        if os.path.exists(file_name):
+            os.remove(file_name)
+
+
+def run_command(command_group: click.Group, args: list):
+    out = io.StringIO()
+    exit_code = 0
+
+    # there is nobody to answer questions, so confirmations are aborted unless -y is passed
+    stdin = sys.stdin
+    sys.stdin = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+            try:
+                command_group.main(args, prog_name=command_group.name, standalone_mode=False)
+            except click.ClickException as e:
+                e.show(out)
+                exit_code = e.exit_code
+            except click.Abort:
+                click.echo('Aborted!')
+                exit_code = 1
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else 0
+            except Exception as e:
+                click.echo(f'Command failed: {e}')
+                exit_code = 1
+    finally:
+        sys.stdin = stdin
+
+    return out.getvalue(), exit_code
+
+
+def send_command(args: list, file_name: str = None):
+    if file_name is None:
+        file_name = socket_file_name
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with client:
+        client.connect(file_name)
+        client.sendall(json.dumps({'args': args}).encode('utf-8'))
+        client.shutdown(socket.SHUT_WR)
+        response = json.loads(__read_all(client).decode('utf-8'))
+    return response['output'], response['exit_code']
+
+
+def is_running(file_name: str = None):
+    if file_name is None:
+        file_name = socket_file_name
+
+    if not os.path.exists(file_name):
+        return False
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with client:
+        try:
+            client.connect(file_name)
+            return True
+        except OSError:
+            return False
+
+
+def __handle_connection(command_group: click.Group, conn):
+    try:
+        request = json.loads(__read_all(conn).decode('utf-8'))
+        args = list(request['args'])
+    except (ValueError, KeyError, TypeError):
+        __send_response(conn, "Invalid request.\n", 2)
+        return
+
+    if len(args) == 0 or args[0] not in DAEMON_COMMANDS:
+        __send_response(conn, f'Only these commands can be executed by the daemon: '
+                              f'{", ".join(DAEMON_COMMANDS)}\n', 2)
+        return
+
+    output, exit_code = run_command(command_group, args)
+    __send_response(conn, output, exit_code)
+
+
+def __read_all(conn):
+    chunks = []
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def __send_response(conn, output: str, exit_code: int):
+    conn.sendall(json.dumps({'output': output, 'exit_code': exit_code}).encode('utf-8'))
@@ -0,0 +1,241 @@
+from spoty.plugins.collector.collector_classes import *
+from spoty.plugins.collector.collector_settings import settings
+from spoty.plugins.collector.collector_sketch import hash64
+
+import click
+import hashlib
+import hmac
+import pickle
+import socket
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+SCAN_WORKER_PORT = settings.COLLECTOR.SCAN_WORKER_PORT
+SCAN_WORKER_KEY = settings.COLLECTOR.SCAN_WORKER_KEY
+
+# messages are pickled, so they are signed with the shared key and unpickled only if the signature is valid
+MESSAGE_HEADER = struct.Struct('>Q')
+MESSAGE_SIGNATURE_SIZE = hashlib.sha256().digest_size
+
+
+class ScanPartition:
+    index: int
+    count: int
+
+    def __init__(self, index: int = 0, count: int = 1):
+        self.index = index
+        self.count = count
+
+    # the same playlist belongs to the same partition on all hosts
+    def contains(self, playlist_id: str) -> bool:
+        return self.count <= 1 or hash64(playlist_id) % self.count == self.index
+
+    def __str__(self):
+        return f'{self.index + 1}/{self.count}'
+
+
+# partition - "index/count", index is 1-based
+def parse_partition(value: str) -> ScanPartition:
+    try:
+        index, count = [int(x) for x in value.split('/')]
+    except ValueError:
+        raise click.BadParameter('partition must be "index/count", for example "1/4"')
+    if count < 1 or index < 1 or index > count:
+        raise click.BadParameter(f'partition index must be from 1 to {count}')
+    return ScanPartition(index - 1, count)
+
+
+def parse_address(value: str) -> (str, int):
+    host, sep, port = value.rpartition(':')
+    if sep == "":
+        return value, SCAN_WORKER_PORT
+    return host, int(port)
+
+
+# shared key of the coordinator and the workers, None if it is not set in the settings
+def get_worker_key() -> bytes:
+    if SCAN_WORKER_KEY == "":
+        return None
+    return SCAN_WORKER_KEY.encode('utf-8')
+
+
+def send_message(conn, message, key: bytes):
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    signature = hmac.new(key, data, hashlib.sha256).digest()
+    conn.sendall(MESSAGE_HEADER.pack(len(data)) + signature + data)
+
+
+def receive_message(conn, key: bytes):
+    size = MESSAGE_HEADER.unpack(__receive(conn, MESSAGE_HEADER.size))[0]
+    signature = __receive(conn, MESSAGE_SIGNATURE_SIZE)
+    data = __receive(conn, size)
+    if not hmac.compare_digest(signature, hmac.new(key, data, hashlib.sha256).digest()):
+        raise ConnectionError('Invalid message signature')
+    return pickle.loads(data)
+
+
+def __receive(conn, size: int) -> bytes:
+    chunks = []
+    while size > 0:
+        chunk = conn.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError('Connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+# key - only the requests signed with this key are executed
+# shared_cache - the cache folder is shared with other workers, so they do not write the cache indexes and stats
+def serve(host: str, port: int, partition: ScanPartition, key: bytes, ports_queue=None, shared_cache=False):
+    if shared_cache:
+        import spoty.plugins.collector.collector_cache as cache
+        cache.write_cache_state = False
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen()
+    port = server.getsockname()[1]
+    if ports_queue is not None:
+        ports_queue.put(port)
+    click.echo(f'Cache scan worker is listening on {host}:{port} (partition {partition})')
+
+    try:
+        # the worker uses all its local processes for one scan, so requests are executed one by one
+        while True:
+            conn, address = server.accept()
+            with conn:
+                try:
+                    __handle_connection(conn, partition, key)
+                except ConnectionError as e:
+                    click.echo(f'Request from {address[0]} rejected: {e}')
+                except (OSError, EOFError, pickle.UnpicklingError):
+                    pass  # coordinator disconnected
+    except KeyboardInterrupt:
+        click.echo('Stopped.')
+    finally:
+        server.close()
+
+
+def __handle_connection(conn, partition: ScanPartition, key: bytes):
+    request = receive_message(conn, key)
+    try:
+        response = scan_partition(request['params_list'], partition, request.get('limit'),
+                                  request.get('time_budget'), request.get('memory_limit_mb'))
+    except SystemExit:
+        # nothing to scan (for example, no playlists matched the name filter)
+        response = {'results': [[] for params in request['params_list']], 'playlists_count': 0,
+                    'tracks_count': 0}
+    except Exception as e:
+        response = {'error': str(e)}
+    send_message(conn, response, key)
+
+
+# the best playlists of the partition for each params, the best at the end as in cache-find-best
+# memory_limit_mb - None to use the limit from the settings of the worker host
+def scan_partition(params_list: List[FindBestTracksParams], partition: ScanPartition, limit: int = None,
+                   time_budget: float = None, memory_limit_mb: float = None) -> dict:
+    import spoty.plugins.collector.collector_cache as cache
+
+    catalog = cache.get_cache_catalog()
+    # duplicates are in the partition of their representative, so that they are skipped by the same worker,
+    # with the time budget only already found duplicates are used as in the scan
+    duplicates = {}
+    if cache.SKIP_DUPLICATE_PLAYLISTS:
+        duplicates = cache.get_cache_duplicates(False, None, time_budget is None, time_budget is not None) or {}
+    ids = [id for id in catalog if partition.contains(duplicates.get(id, id))]
+    click.echo(f'Scanning {len(ids)}/{len(catalog)} cached playlists of partition {partition}')
+
+    results, tracks_count, unique_tracks = cache.cache_find_best_batch(params_list, time_budget, ids,
+                                                                       memory_limit_mb, limit)
+    if limit is not None:
+        results = [infos[-limit:] if limit > 0 else [] for infos in results]
+    return {'results': results, 'playlists_count': len(ids), 'tracks_count': tracks_count}
+
+
+# workers - "host:port" addresses, each worker scans its partition of the cache
+# limit - the number of the best playlists of each params returned by the workers and in the merged result
+# key - shared key of the workers, SCAN_WORKER_KEY from the settings if not specified
+def find_best_distributed(params_list: List[FindBestTracksParams], workers: List[str], limit: int = None,
+                          time_budget: float = None, memory_limit_mb: float = None,
+                          key: bytes = None) -> (List[List[PlaylistInfo]], int, int):
+    import spoty.plugins.collector.collector_cache as cache
+
+    if key is None:
+        key = get_worker_key()
+    if key is None:
+        click.echo('Set SCAN_WORKER_KEY in the settings of the coordinator and the workers.')
+        exit()
+
+    request = {'params_list': params_list, 'limit': limit, 'time_budget': time_budget,
+               'memory_limit_mb': memory_limit_mb}
+
+    def scan(worker):
+        client = socket.create_connection(parse_address(worker))
+        with client:
+            send_message(client, request, key)
+            return receive_message(client, key)
+
+    click.echo(f'Scanning the cache by {len(workers)} workers')
+    with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+        responses = list(executor.map(scan, workers))
+
+    results = [[] for params in params_list]
+    playlists_count = 0
+    tracks_count = 0
+    for worker, response in zip(workers, responses):
+        if 'error' in response:
+            click.echo(f'Worker {worker} failed: {response["error"]}')
+            exit()
+        for infos, worker_infos in zip(results, response['results']):
+            infos.extend(worker_infos)
+        playlists_count += response['playlists_count']
+        tracks_count += response['tracks_count']
+
+    # partial top lists of the workers are merged into the top list of the whole cache
+    for i, params in enumerate(params_list):
+        results[i] = cache.sort_playlist_infos(results[i], params.sorting, params.reverse_sorting)
+        if limit is not None:
+            results[i] = results[i][-limit:] if limit > 0 else []
+    click.echo(f'{playlists_count} cached playlists with {tracks_count} tracks scanned by {len(workers)} workers')
+    return results, tracks_count, playlists_count
+
+
+# runs workers for all partitions of the cache on this host, for testing
+# memory_limit_mb - limit of each worker
+def find_best_with_local_workers(params_list: List[FindBestTracksParams], workers_count: int, limit: int = None,
+                                 time_budget: float = None,
+                                 memory_limit_mb: float = None) -> (List[List[PlaylistInfo]], int, int):
+    import spoty.plugins.collector.collector_cache as cache
+    from multiprocessing import Process, Queue
+    import secrets
+
+    # the catalog and the indexes are updated once before the workers read them
+    cache.get_cache_catalog()
+    if cache.SKIP_DUPLICATE_PLAYLISTS:
+        cache.get_cache_duplicates()
+    if any(params.filter_names is not None for params in params_list):
+        cache.get_cache_names_index()
+
+    # the workers are started for this search only, so they get a new key
+    key = secrets.token_bytes(32)
+    ports_queue = Queue()
+    processes = []
+    try:
+        for i in range(workers_count):
+            # workers start their own processes to scan the partition, so they can not be daemons
+            process = Process(target=serve,
+                              args=('127.0.0.1', 0, ScanPartition(i, workers_count), key, ports_queue, True))
+            process.start()
+            processes.append(process)
+        workers = [f'127.0.0.1:{ports_queue.get(timeout=60)}' for i in range(workers_count)]
+        results, tracks_count, playlists_count = find_best_distributed(params_list, workers, limit, time_budget,
+                                                                       memory_limit_mb, key)
+        cache.update_cache_stats(results)
+        return results, tracks_count, playlists_count
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
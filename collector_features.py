@@ -0,0 +1,198 @@
+from spoty.plugins.collector.collector_classes import PlaylistInfo, TracksCollection, UserLibrary
+
+from array import array
+from typing import List
+import hashlib
+
+# increase when the features or the way they are counted change
+FEATURES_VERSION = 1
+
+# counts are kept for this number of the last used reference collections
+MAX_REF_SETS = 8
+
+
+class LibraryState:
+    listened_isrcs: set
+    listened_titles: dict[str, set]
+    fav_isrcs: dict
+    fav_titles: dict
+    artists_rating: dict
+
+    def __init__(self, lib: UserLibrary):
+        self.listened_isrcs = set(lib.listened_tracks.track_isrcs)
+        self.listened_titles = {artist: set(titles) for artist, titles in lib.listened_tracks.track_artists.items()}
+        # fav tracks are compared with the names of fav playlists they are in
+        self.fav_isrcs = lib.fav_tracks.track_isrcs
+        self.fav_titles = lib.fav_tracks.track_artists
+        self.artists_rating = lib.artists_rating
+
+    # isrcs and artists of tracks which are counted differently with the other library state
+    def get_changes(self, other: 'LibraryState') -> (set, set):
+        isrcs = self.listened_isrcs ^ other.listened_isrcs
+        for isrc in self.fav_isrcs.keys() | other.fav_isrcs.keys():
+            if self.fav_isrcs.get(isrc) != other.fav_isrcs.get(isrc):
+                isrcs.add(isrc)
+
+        artists = set()
+        for a, b in [(self.listened_titles, other.listened_titles), (self.fav_titles, other.fav_titles),
+                     (self.artists_rating, other.artists_rating)]:
+            for artist in a.keys() | b.keys():
+                if a.get(artist) != b.get(artist):
+                    artists.add(artist)
+        return isrcs, artists
+
+
+class PlaylistFeaturesCache:
+    version: int
+    library_state: LibraryState
+    ref_keys: List[str]
+    # [id] = [file_date, rel_basename, tags_count, counts, ref_counts]
+    # counts - PlaylistInfo without reference tracks and points, ref_counts - [ref_key] = [count, by_playlists]
+    features: dict[str, list]
+    ids: List[str]
+    rows: dict[str, int]
+    isrc_rows: dict[str, array]
+    artist_rows: dict[str, array]
+    removed_count: int
+    changed: bool
+
+    def __init__(self):
+        self.version = FEATURES_VERSION
+        self.library_state = None
+        self.ref_keys = []
+        self.features = {}
+        self.ids = []
+        self.rows = {}
+        self.isrc_rows = {}
+        self.artist_rows = {}
+        self.removed_count = 0
+        self.changed = True
+
+    # features of the playlist if its file is the same and they are counted for all the ref keys
+    def get(self, id: str, file_date: str, rel_basename: str, ref_keys: List[str]) -> list:
+        data = self.features.get(id)
+        if data is None or data[0] != file_date or data[1] != rel_basename:
+            return None
+        for ref_key in ref_keys:
+            if ref_key is not None and ref_key not in data[4]:
+                return None
+        return data
+
+    def put(self, id: str, file_date: str, rel_basename: str, tags_count: int, counts: PlaylistInfo,
+            ref_counts: dict, isrcs: List[str], artists: List[str]):
+        self.changed = True
+        data = self.features.get(id)
+        if data is not None and data[0] == file_date and data[1] == rel_basename:
+            data[2] = tags_count
+            data[3] = counts
+            data[4].update(ref_counts)
+            return
+
+        if data is not None:
+            self.remove(id)
+
+        row = len(self.ids)
+        self.ids.append(id)
+        self.rows[id] = row
+        self.features[id] = [file_date, rel_basename, tags_count, counts, dict(ref_counts)]
+        for isrc in set(isrcs):
+            if isrc not in self.isrc_rows:
+                self.isrc_rows[isrc] = array('I')
+            self.isrc_rows[isrc].append(row)
+        for artist in set(artists):
+            if artist not in self.artist_rows:
+                self.artist_rows[artist] = array('I')
+            self.artist_rows[artist].append(row)
+
+    def remove(self, id: str):
+        # the row stays in the isrcs and artists lists until the cache is compacted
+        row = self.rows.pop(id, None)
+        if row is None:
+            return
+        del self.features[id]
+        self.ids[row] = None
+        self.removed_count += 1
+        self.changed = True
+
+    def retain(self, ids):
+        for id in [id for id in self.rows if id not in ids]:
+            self.remove(id)
+        if self.removed_count > len(self.rows):
+            self.__compact()
+
+    # removes features of playlists with tracks counted differently in the new library
+    def update_library(self, state: LibraryState) -> int:
+        if self.library_state is None:
+            removed = list(self.rows.keys())
+            self.changed = True
+        else:
+            isrcs, artists = state.get_changes(self.library_state)
+            rows = set()
+            for isrc in isrcs:
+                rows.update(self.isrc_rows.get(isrc, ()))
+            for artist in artists:
+                rows.update(self.artist_rows.get(artist, ()))
+            removed = [self.ids[row] for row in rows if self.ids[row] is not None]
+            if len(isrcs) > 0 or len(artists) > 0:
+                self.changed = True
+
+        for id in removed:
+            self.remove(id)
+        self.library_state = state
+        return len(removed)
+
+    # counts of the least recently used reference collections are removed
+    def use_ref_keys(self, ref_keys: List[str]):
+        ref_keys = [key for key in ref_keys if key is not None]
+        keys = list(dict.fromkeys(ref_keys + [key for key in self.ref_keys if key not in ref_keys]))
+        removed = set(keys[MAX_REF_SETS:])
+        if keys != self.ref_keys:
+            self.ref_keys = keys[:MAX_REF_SETS]
+            self.changed = True
+        if len(removed) > 0:
+            for data in self.features.values():
+                for key in removed:
+                    data[4].pop(key, None)
+
+    def __compact(self):
+        new_rows = {}
+        ids = []
+        for row, id in enumerate(self.ids):
+            if id is not None:
+                new_rows[row] = len(ids)
+                ids.append(id)
+
+        for index in [self.isrc_rows, self.artist_rows]:
+            for key in list(index.keys()):
+                rows = array('I', (new_rows[row] for row in index[key] if row in new_rows))
+                if len(rows) > 0:
+                    index[key] = rows
+                else:
+                    del index[key]
+
+        self.ids = ids
+        self.rows = {id: row for row, id in enumerate(ids)}
+        self.removed_count = 0
+        self.changed = True
+
+
+# the same key for the collections of the same tracks in the same playlists, None for empty collection
+def get_collection_key(col: TracksCollection) -> str:
+    if len(col.track_isrcs) == 0 and len(col.track_artists) == 0:
+        return None
+
+    h = hashlib.blake2b(digest_size=16)
+    for tracks in [col.track_isrcs, col.track_artists]:
+        for key in sorted(tracks):
+            h.update(f'{key}\n'.encode('utf-8'))
+            __update_hash(h, tracks[key])
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def __update_hash(h, value: dict):
+    for key in sorted(value):
+        h.update(f'\t{key}\n'.encode('utf-8'))
+        if isinstance(value[key], dict):
+            __update_hash(h, value[key])
+    h.update(b'\r')
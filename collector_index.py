@@ -0,0 +1,377 @@
+from spoty.plugins.collector.collector_sketch import MINHASH_BANDS, MINHASH_ROWS, MINHASH_SIZE
+
+from array import array
+from typing import List
+import re
+
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:  # python < 3.11
+    import sre_parse
+    import sre_constants
+
+MAX_ALTERNATIVES = 64
+
+# increase when the similarity index fields change
+SIMILARITY_INDEX_VERSION = 3
+
+# signature of playlists without tracks, it is not similar to any playlist with tracks
+EMPTY_SIGNATURE = b'\xff' * (MINHASH_SIZE * 4)
+
+# number of pairs of playlists compared at once when looking for duplicates
+CLUSTERS_CHUNK_SIZE = 50000
+# playlists with the same band key are compared only with this number of the most prior playlists with this key
+CLUSTERS_BUCKET_LEADERS = 16
+# duplicates are found with the longest bands that find pairs with the threshold similarity with this probability
+CLUSTERS_RECALL = 0.95
+
+
+def get_trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class PlaylistNamesIndex:
+    ids: List[str]
+    names: List[str]
+    rows: dict[str, int]
+    trigrams: dict[str, array]
+    removed_count: int
+
+    def __init__(self):
+        self.ids = []
+        self.names = []
+        self.rows = {}
+        self.trigrams = {}
+        self.removed_count = 0
+
+    # names - [id] = upper case playlist name
+    def update(self, names: dict[str, str]) -> bool:
+        changed = False
+
+        # renamed and removed playlists are marked as removed, their rows stay in the trigrams lists
+        for id, row in list(self.rows.items()):
+            if names.get(id) != self.names[row]:
+                del self.rows[id]
+                self.ids[row] = None
+                self.names[row] = None
+                self.removed_count += 1
+                changed = True
+
+        if self.removed_count > len(self.rows):
+            self.__init__()
+            changed = True
+
+        for id, name in names.items():
+            if id not in self.rows:
+                self.__add(id, name)
+                changed = True
+
+        return changed
+
+    def __add(self, id: str, name: str):
+        row = len(self.ids)
+        self.ids.append(id)
+        self.names.append(name)
+        self.rows[id] = row
+        for trigram in get_trigrams(name):
+            if trigram not in self.trigrams:
+                self.trigrams[trigram] = array('I')
+            self.trigrams[trigram].append(row)
+
+    # pattern is matched with upper case names
+    def search(self, pattern: str) -> List[str]:
+        regex = re.compile(pattern)
+        rows = self.get_candidate_rows(pattern)
+        if rows is None:
+            rows = range(len(self.ids))
+
+        res = []
+        for row in rows:
+            name = self.names[row]
+            if name is not None and regex.search(name):
+                res.append(self.ids[row])
+        return res
+
+    # rows of names that contain all the literal parts of the pattern, None if the pattern has no such parts
+    def get_candidate_rows(self, pattern: str):
+        try:
+            alternatives = get_required_literals(sre_parse.parse(pattern))
+        except (re.error, RecursionError):
+            return None
+        if alternatives is None:
+            return None
+
+        rows = set()
+        for literals in alternatives:
+            trigrams = set()
+            for literal in literals:
+                trigrams |= get_trigrams(literal)
+            if len(trigrams) == 0:
+                return None  # this alternative can match any name
+
+            lists = sorted((self.trigrams.get(t, array('I')) for t in trigrams), key=len)
+            candidates = set(lists[0])
+            for other in lists[1:]:
+                if len(candidates) == 0:
+                    break
+                candidates.intersection_update(other)
+            rows |= candidates
+        return sorted(rows)
+
+
+class PlaylistSimilarityIndex:
+    version: int
+    ids: List[str]
+    versions: List[str]
+    rows: dict[str, int]
+    signatures: bytearray
+    removed_count: int
+    sorted_keys: object
+    sorted_rows: object
+    clusters: List[List[str]]
+    clusters_similarity: float
+
+    def __init__(self):
+        self.version = SIMILARITY_INDEX_VERSION
+        self.ids = []
+        self.versions = []
+        self.rows = {}
+        self.signatures = bytearray()  # minhash signature of each row, MINHASH_SIZE 32-bit values
+        self.removed_count = 0
+        # band keys of all rows sorted for each band, None if rows were changed since sorting
+        self.sorted_keys = None
+        self.sorted_rows = None
+        # duplicates found with the similarity, None if rows were changed since
+        self.clusters = None
+        self.clusters_similarity = None
+
+    def get_version(self, id: str) -> str:
+        row = self.rows.get(id)
+        return self.versions[row] if row is not None else None
+
+    # signature is None for playlists without tracks
+    def put(self, id: str, version: str, signature: bytes):
+        self.remove(id)
+        row = len(self.ids)
+        self.ids.append(id)
+        self.versions.append(version)
+        self.rows[id] = row
+        self.signatures.extend(signature if signature is not None else EMPTY_SIGNATURE)
+        self.sorted_keys = None
+        self.clusters = None
+
+    def remove(self, id: str):
+        row = self.rows.pop(id, None)
+        if row is None:
+            return
+        self.ids[row] = None
+        self.versions[row] = None
+        self.removed_count += 1
+        self.sorted_keys = None
+        self.clusters = None
+
+    def retain(self, ids):
+        for id in [id for id in self.rows if id not in ids]:
+            self.remove(id)
+        if self.removed_count > len(self.rows):
+            self.__compact()
+
+    # ids of playlists similar to any of the signatures with estimated similarity, the most similar first
+    def search(self, signatures: List[bytes], limit: int = None) -> List[tuple]:
+        import numpy as np
+
+        if len(self.rows) == 0 or len(signatures) == 0:
+            return []
+        if self.sorted_keys is None:
+            self.__sort()
+
+        candidates = set()
+        for signature in signatures:
+            keys = np.frombuffer(signature, dtype='<u8')
+            for band in range(MINHASH_BANDS):
+                start = np.searchsorted(self.sorted_keys[band], keys[band], 'left')
+                end = np.searchsorted(self.sorted_keys[band], keys[band], 'right')
+                candidates.update(self.sorted_rows[band][start:end].tolist())
+        if len(candidates) == 0:
+            return []
+
+        rows = np.array(sorted(candidates), dtype=np.int64)
+        values = np.frombuffer(bytes(self.signatures), dtype='<u4').reshape(-1, MINHASH_SIZE)[rows]
+        similarity = np.zeros(len(rows))
+        for signature in signatures:
+            query = np.frombuffer(signature, dtype='<u4')
+            similarity = np.maximum(similarity, (values == query).mean(axis=1))
+
+        order = np.argsort(-similarity, kind='stable')
+        if limit is not None:
+            order = order[:limit]
+        return [(self.ids[rows[i]], float(similarity[i])) for i in order]
+
+    # groups of ids of playlists with estimated similarity to the first id of the group not less than min_similarity,
+    # at least 2 ids in a group. priority - key of ids, the ids with a greater key become the first ids of groups
+    def get_clusters(self, min_similarity: float, priority=None) -> List[List[str]]:
+        import numpy as np
+
+        if self.clusters is not None and self.clusters_similarity == min_similarity:
+            return self.clusters
+        if len(self.rows) < 2:
+            return []
+
+        # rows in the order of priority, playlists without tracks are not duplicates of anything
+        rows = [row for row, id in enumerate(self.ids) if id is not None]
+        if priority is not None:
+            rows.sort(key=lambda row: priority(self.ids[row]), reverse=True)
+        rows = np.array(rows, dtype=np.int64)
+        values = np.frombuffer(bytes(self.signatures), dtype='<u4').reshape(-1, MINHASH_SIZE)
+        empty = np.frombuffer(EMPTY_SIGNATURE, dtype='<u4')
+        rows = rows[(values[rows] != empty).any(axis=1)]
+
+        # longer bands than in the search index, so that only near duplicates get the same band key
+        band_rows = get_clusters_band_rows(min_similarity)
+        a, b = get_band_coefficients(band_rows)
+        similar_rows = {}
+        pairs = []
+        pairs_count = 0
+
+        def compare_pairs():
+            chunk = np.concatenate(pairs)
+            pairs.clear()
+            similar = (values[chunk[:, 0]] == values[chunk[:, 1]]).mean(axis=1) >= min_similarity
+            for x, y in chunk[similar].tolist():
+                similar_rows.setdefault(x, set()).add(y)
+                similar_rows.setdefault(y, set()).add(x)
+
+        for band in range(0, MINHASH_SIZE, band_rows):
+            with np.errstate(over='ignore'):
+                keys = (values[rows, band:band + band_rows].astype(np.uint64) * a + b).sum(axis=1, dtype=np.uint64)
+            # stable sort keeps the priority order inside the buckets
+            order = np.argsort(keys, kind='stable')
+            keys = keys[order]
+            starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+            ends = np.append(starts[1:], len(keys))
+            multiple = ends - starts > 1
+            for start, end in zip(starts[multiple].tolist(), ends[multiple].tolist()):
+                bucket = rows[order[start:end]]
+                # members of large buckets are compared only with the most prior playlists of the bucket
+                for x in range(min(len(bucket) - 1, CLUSTERS_BUCKET_LEADERS)):
+                    pairs.append(np.stack([np.full(len(bucket) - x - 1, bucket[x]), bucket[x + 1:]], axis=1))
+                    pairs_count += len(bucket) - x - 1
+                if pairs_count >= CLUSTERS_CHUNK_SIZE:
+                    compare_pairs()
+                    pairs_count = 0
+        if len(pairs) > 0:
+            compare_pairs()
+
+        # a playlist is added to the group of the most prior playlist it is similar to,
+        # so that it is similar to the first playlist of the group, not only to another member
+        assigned = set()
+        self.clusters = []
+        for row in rows.tolist():
+            if row in assigned or row not in similar_rows:
+                continue
+            members = [other for other in similar_rows[row] if other not in assigned]
+            if len(members) == 0:
+                continue
+            assigned.add(row)
+            assigned.update(members)
+            if priority is not None:
+                members.sort(key=lambda other: priority(self.ids[other]), reverse=True)
+            self.clusters.append([self.ids[row]] + [self.ids[other] for other in members])
+        self.clusters_similarity = min_similarity
+        return self.clusters
+
+    def __sort(self):
+        import numpy as np
+
+        keys = np.frombuffer(bytes(self.signatures), dtype='<u8').reshape(-1, MINHASH_BANDS)
+        rows = np.array([row for row, id in enumerate(self.ids) if id is not None], dtype=np.int64)
+        keys = keys[rows].T
+        order = np.argsort(keys, axis=1, kind='stable')
+        self.sorted_keys = np.take_along_axis(keys, order, axis=1)
+        self.sorted_rows = rows[order].astype(np.uint32)
+
+    def __compact(self):
+        size = MINHASH_SIZE * 4
+        ids = []
+        versions = []
+        signatures = bytearray()
+        for row, id in enumerate(self.ids):
+            if id is not None:
+                ids.append(id)
+                versions.append(self.versions[row])
+                signatures.extend(self.signatures[row * size:(row + 1) * size])
+        self.ids = ids
+        self.versions = versions
+        self.signatures = signatures
+        self.rows = {id: row for row, id in enumerate(ids)}
+        self.removed_count = 0
+        self.sorted_keys = None
+        self.clusters = None
+
+
+# number of hashes in a band for looking for duplicates with the similarity threshold
+def get_clusters_band_rows(min_similarity: float) -> int:
+    for rows in [8, 4]:
+        if 1 - (1 - min_similarity ** rows) ** (MINHASH_SIZE // rows) >= CLUSTERS_RECALL:
+            return rows
+    return MINHASH_ROWS
+
+
+band_coefficients = {}
+
+
+# coefficients combining the hashes of a band into one key
+def get_band_coefficients(rows: int):
+    import numpy as np
+    import random
+
+    if rows not in band_coefficients:
+        rnd = random.Random(rows)
+        band_coefficients[rows] = (np.array([rnd.getrandbits(64) | 1 for i in range(rows)], dtype=np.uint64),
+                                   np.array([rnd.getrandbits(64) for i in range(rows)], dtype=np.uint64))
+    return band_coefficients[rows]
+
+
+# literals that must be present in any match: list of alternatives, each one is a list of literals,
+# None if there are too many alternatives
+def get_required_literals(parsed) -> List[List[str]]:
+    alternatives = [[]]
+    run = []
+
+    def flush():
+        if len(run) > 0:
+            literal = ''.join(run)
+            for alternative in alternatives:
+                alternative.append(literal)
+            run.clear()
+
+    for op, av in parsed:
+        if op == sre_constants.LITERAL:
+            run.append(chr(av))
+        elif op == sre_constants.AT:
+            continue  # anchors do not consume characters
+        elif op == sre_constants.BRANCH:
+            flush()
+            branches = []
+            for branch in av[1]:
+                sub = get_required_literals(branch)
+                if sub is None:
+                    return None
+                branches.extend(sub)
+            alternatives = [a + b for a in alternatives for b in branches]
+        elif op == sre_constants.SUBPATTERN or (op in [sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT]
+                                                and av[0] >= 1):
+            flush()
+            sub = get_required_literals(av[-1])
+            if sub is None:
+                return None
+            alternatives = [a + b for a in alternatives for b in sub]
+        else:
+            flush()
+
+        if len(alternatives) > MAX_ALTERNATIVES:
+            return None
+
+    flush()
+    return alternatives
@@ -1,24 +1,9 @@
+from spoty.plugins.collector.collector_settings import listened_file_name
+
 from spoty import spotify_api
 from spoty import csv_playlist
 from spoty import utils
 import os.path
-from dynaconf import Dynaconf
-
-
-current_directory = os.path.dirname(os.path.realpath(__file__))
-settings_file_name = os.path.join(current_directory, 'settings.toml')
-
-settings = Dynaconf(
-    envvar_prefix="COLLECTOR",
-    settings_files=[settings_file_name],
-)
-
-listened_file_name = settings.COLLECTOR.LISTENED_FILE_NAME
-
-if listened_file_name.startswith("./") or listened_file_name.startswith(".\\"):
-    listened_file_name = os.path.join(current_directory, listened_file_name)
-
-listened_file_name = os.path.abspath(listened_file_name)
 
 
 LISTENED_LIST_TAGS = [
@@ -32,17 +17,36 @@ LISTENED_LIST_TAGS = [
 ]
 
 
+# listened tracks read from disk: [cells] = [listened_version, tags_list]
+read_listened = {}
+
+
 def read_listened_tracks(cells=None):
     if not os.path.isfile(listened_file_name):
         return []
 
+    version = get_listened_version()
+    key = None if cells is None else tuple(cells)
+    if key in read_listened and read_listened[key][0] == version:
+        return read_listened[key][1]
+
     if cells is None:
         tags_list = csv_playlist.read_tags_from_csv(listened_file_name, False, False)
     else:
         tags_list = csv_playlist.read_tags_from_csv_fast(listened_file_name, cells)
+
+    read_listened[key] = [version, tags_list]
     return tags_list
 
 
+def get_listened_version():
+    if not os.path.isfile(listened_file_name):
+        return "0"
+
+    stat = os.stat(listened_file_name)
+    return f'{stat.st_mtime_ns}-{stat.st_size}'
+
+
 def read_listened_tracks_only_one_param(param):
     if not os.path.isfile(listened_file_name):
         return []
@@ -0,0 +1,145 @@
+import click
+import os
+import sys
+import threading
+from typing import List
+
+SAMPLE_INTERVAL_SEC = 0.05
+
+
+# resident memory of the process in MB, None if it can not be read on this platform
+def get_rss_mb(pid: int = None) -> float:
+    try:
+        with open(f'/proc/{pid or "self"}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+
+    if pid is not None:
+        return None
+    try:
+        import resource
+    except ImportError:
+        return None
+    # the peak is used instead of the current memory if /proc is not available
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+class MemoryMonitor:
+    limit_mb: float
+    # [stage_name, peak_mb, workers_count]
+    stages: List[list]
+    pids: List[int]
+
+    def __init__(self, limit_mb: float = None):
+        self.limit_mb = limit_mb if limit_mb is not None and limit_mb > 0 else None
+        self.stages = []
+        self.pids = []
+        self.peak_mb = 0
+        self.stage_name = None
+        self.lock = threading.Lock()
+
+    def is_limited(self) -> bool:
+        return self.limit_mb is not None
+
+    # memory of the main process and the watched worker processes (shared pages are counted for each of them)
+    def get_used_mb(self) -> float:
+        used = get_rss_mb() or 0
+        with self.lock:
+            pids = list(self.pids)
+        for pid in pids:
+            used += get_rss_mb(pid) or 0
+        return used
+
+    def is_over_limit(self, fraction: float = 1) -> bool:
+        return self.limit_mb is not None and self.get_used_mb() > self.limit_mb * fraction
+
+    # number of processes with the given memory each that fit in the limit
+    def get_processes_count(self, max_count: int, process_mb: float) -> int:
+        if self.limit_mb is None:
+            return max_count
+        available = self.limit_mb - (get_rss_mb() or 0)
+        return max(1, min(max_count, int(available // process_mb)))
+
+    def watch(self, pid: int):
+        with self.lock:
+            self.pids.append(pid)
+
+    # the previous stage is ended when the next one begins, stages are not sampled without the limit
+    def begin_stage(self, name: str):
+        self.end_stage()
+        if self.limit_mb is None:
+            return
+        self.stage_name = name
+        self.peak_mb = self.get_used_mb()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.__sample, args=(self.stopped,), daemon=True)
+        self.sampler.start()
+
+    def end_stage(self):
+        if self.stage_name is None:
+            return
+        self.stopped.set()
+        self.sampler.join()
+        self.peak_mb = max(self.peak_mb, self.get_used_mb())
+        with self.lock:
+            self.stages.append([self.stage_name, self.peak_mb, len(self.pids)])
+            self.pids = []
+        self.stage_name = None
+
+    def __sample(self, stopped: threading.Event):
+        while not stopped.wait(SAMPLE_INTERVAL_SEC):
+            self.peak_mb = max(self.peak_mb, self.get_used_mb())
+
+    def print_stages(self):
+        self.end_stage()
+        if len(self.stages) == 0:
+            return
+        limit = f' (limit {self.limit_mb:.0f} MB)' if self.limit_mb is not None else ''
+        click.echo(f'---------- Peak memory{limit} ----------')
+        for name, peak_mb, workers_count in self.stages:
+            workers = f' ({workers_count} worker processes included)' if workers_count > 0 else ''
+            click.echo(f'{name:<16}: {peak_mb:.0f} MB{workers}')
+
+
+# list of items written to a temporary file, the items are read from the file when the list is iterated
+class SpilledList:
+    file_name: str
+    count: int
+
+    def __init__(self):
+        import tempfile
+
+        f, self.file_name = tempfile.mkstemp(prefix='collector_', suffix='.spill')
+        os.close(f)
+        self.count = 0
+
+    def extend(self, items: list):
+        import pickle
+
+        if len(items) == 0:
+            return
+        with open(self.file_name, 'ab') as f:
+            pickle.dump(items, f, pickle.HIGHEST_PROTOCOL)
+        self.count += len(items)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        import pickle
+
+        with open(self.file_name, 'rb') as f:
+            while True:
+                try:
+                    items = pickle.load(f)
+                except EOFError:
+                    return
+                yield from items
+
+    def __del__(self):
+        try:
+            os.remove(self.file_name)
+        except (OSError, TypeError):
+            pass
@@ -0,0 +1,121 @@
+from spoty.plugins.collector.collector_classes import *
+
+import os.path
+from typing import List
+
+
+class MirrorsStore:
+    file_name: str
+    mirrors: dict[str, Mirror]
+    mirrors_by_sub_playlist_ids: dict[str, Mirror]
+    mirrors_by_playlist_ids: dict[str, Mirror]
+    mirrors_by_group: dict[str, List[Mirror]]
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.mirrors = {}
+        self.mirrors_by_sub_playlist_ids = {}
+        self.mirrors_by_playlist_ids = {}
+        self.mirrors_by_group = {}
+
+    def read(self, group_name: str = None):
+        if group_name is not None:
+            group_name = group_name.upper()
+
+        if not os.path.isfile(self.file_name):
+            return self
+
+        with open(self.file_name, 'r', encoding='utf-8-sig') as file:
+            for line in file:
+                line = line.rstrip("\n").strip()
+                if line == "":
+                    continue
+
+                # sub_playlist_id,from_cache,group,name
+                s = line.split(',', 3)
+                if len(s) < 4:
+                    continue
+
+                if group_name is None or group_name == s[2]:
+                    self.add_subscription(s[0], s[1] == "+", s[2], s[3])
+
+        return self
+
+    def add_subscription(self, playlist_id: str, from_cache: bool, group: str, name: str) -> Mirror:
+        if name not in self.mirrors:
+            m = Mirror()
+            m.group = group.upper()
+            m.name = name
+            self.mirrors[name] = m
+            if m.group not in self.mirrors_by_group:
+                self.mirrors_by_group[m.group] = []
+            self.mirrors_by_group[m.group].append(m)
+
+        m = self.mirrors[name]
+        m.subscribed_playlist_ids.append(playlist_id)
+        m.subscribed_playlist_from_cache.append(from_cache)
+        self.mirrors_by_sub_playlist_ids[playlist_id] = m
+        return m
+
+    def remove_subscription(self, playlist_id: str):
+        if playlist_id not in self.mirrors_by_sub_playlist_ids:
+            return
+        m = self.mirrors_by_sub_playlist_ids.pop(playlist_id)
+        if playlist_id in m.subscribed_playlist_ids:
+            index = m.subscribed_playlist_ids.index(playlist_id)
+            del m.subscribed_playlist_ids[index]
+            del m.subscribed_playlist_from_cache[index]
+
+    def remove_mirror(self, m: Mirror):
+        if m.name not in self.mirrors:
+            return
+        del self.mirrors[m.name]
+        for id in m.subscribed_playlist_ids:
+            self.mirrors_by_sub_playlist_ids.pop(id, None)
+        if m.playlist_id is not None:
+            self.mirrors_by_playlist_ids.pop(m.playlist_id, None)
+        if m.group in self.mirrors_by_group and m in self.mirrors_by_group[m.group]:
+            self.mirrors_by_group[m.group].remove(m)
+
+    def set_library_playlists(self, user_playlists: List):
+        for playlist in user_playlists:
+            name = playlist['name']
+            if name in self.mirrors:
+                m = self.mirrors[name]
+                m.playlist_id = playlist['id']
+                self.mirrors_by_playlist_ids[m.playlist_id] = m
+
+    # id - subscribed playlist id or mirror playlist id
+    def find(self, playlist_id: str) -> Mirror:
+        if playlist_id in self.mirrors_by_sub_playlist_ids:
+            return self.mirrors_by_sub_playlist_ids[playlist_id]
+        if playlist_id in self.mirrors_by_playlist_ids:
+            return self.mirrors_by_playlist_ids[playlist_id]
+        return None
+
+    def write(self, mirrors: dict[str, Mirror] = None):
+        if mirrors is None:
+            mirrors = self.mirrors
+
+        # write to temporary file first to never leave the mirrors file half-written
+        temp_file_name = self.file_name + ".tmp"
+        with open(temp_file_name, 'w', encoding='utf-8-sig') as file:
+            for m in mirrors.values():
+                for i, playlist_id in enumerate(m.subscribed_playlist_ids):
+                    file.write(format_mirror_line(playlist_id, m.subscribed_playlist_from_cache[i], m.group, m.name))
+        os.replace(temp_file_name, self.file_name)
+
+    def append(self, subscriptions: List[Mirror]):
+        if len(subscriptions) == 0:
+            return
+        encoding = 'utf-8' if os.path.isfile(self.file_name) else 'utf-8-sig'
+        with open(self.file_name, 'a', encoding=encoding) as file:
+            for m in subscriptions:
+                for i, playlist_id in enumerate(m.subscribed_playlist_ids):
+                    file.write(format_mirror_line(playlist_id, m.subscribed_playlist_from_cache[i], m.group, m.name))
+
+
+def format_mirror_line(playlist_id: str, from_cache: bool, group: str, name: str):
+    group = group.replace(",", " ").upper()
+    name = name.replace(",", " ")
+    return f'{playlist_id},{"+" if from_cache else "-"},{group},{name}\n'
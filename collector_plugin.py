@@ -1,75 +1,112 @@
-from datetime import datetime
 import spoty.plugins.collector.collector_cache as cache
 import spoty.plugins.collector.collector_listened as lis
 from spoty.plugins.collector.collector_classes import *
+from spoty.plugins.collector.collector_mirrors import MirrorsStore
+import spoty.plugins.collector.collector_spotify as spotify
+from spoty.plugins.collector.collector_settings import settings, mirrors_file_name, mirrors_state_file_name, \
+    library_snapshot_file_name
 
-from spoty import plugins_path
 from spoty import spotify_api
-from spoty import csv_playlist
 from spoty import utils
-from dynaconf import Dynaconf
 import os.path
 import click
 import re
-from datetime import datetime, timedelta
 from typing import List
-from multiprocessing import Process, Lock, Queue, Value, Array
-import numpy as np
-import time
-import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import pickle
+import copy
+import threading
 
-current_directory = os.path.dirname(os.path.realpath(__file__))
-# config_path = os.path.abspath(os.path.join(current_directory, '..', 'config'))
-settings_file_name = os.path.join(current_directory, 'settings.toml')
+# increase when UserLibrary or TracksCollection fields change
+LIBRARY_SNAPSHOT_VERSION = 1
 
-settings = Dynaconf(
-    envvar_prefix="COLLECTOR",
-    settings_files=[settings_file_name],
-)
+mirror_playlist_prefix = settings.COLLECTOR.MIRROR_PLAYLISTS_PREFIX
+default_mirror_group = settings.COLLECTOR.DEFAULT_MIRROR_GROUP
 
-mirrors_file_name = settings.COLLECTOR.MIRRORS_FILE_NAME
+PLAYLISTS_WITH_FAVORITES = settings.COLLECTOR.PLAYLISTS_WITH_FAVORITES
+REQUESTS_CONCURRENCY = settings.COLLECTOR.REQUESTS_CONCURRENCY
 
-if mirrors_file_name.startswith("./") or mirrors_file_name.startswith(".\\"):
-    mirrors_file_name = os.path.join(current_directory, mirrors_file_name)
+# all spotify requests of the collector go through the shared rate limiter
+spotify.install()
 
-mirrors_file_name = os.path.abspath(mirrors_file_name)
 
-mirror_playlist_prefix = settings.COLLECTOR.MIRROR_PLAYLISTS_PREFIX
-default_mirror_group = settings.COLLECTOR.DEFAULT_MIRROR_GROUP
+# playlists downloaded from spotify: [playlist_id] = playlist, the least recently used are removed
+fetched_playlists = OrderedDict()
+# max number of playlists kept in fetched_playlists
+FETCHED_PLAYLISTS_LIMIT = 1000
+# ids of playlists downloaded during the current command
+fetched_playlists_in_scope = {}
+# playlists are downloaded concurrently, the lock is held only while the dicts are used
+fetched_playlists_lock = threading.Lock()
 
-PLAYLISTS_WITH_FAVORITES = settings.COLLECTOR.PLAYLISTS_WITH_FAVORITES
 
+def begin_fetch_scope():
+    with fetched_playlists_lock:
+        fetched_playlists_in_scope.clear()
 
-def read_mirrors(group_name: str = None) -> dict[str, Mirror]:
-    if group_name is not None:
-        group_name = group_name.upper()
 
-    mirrors: dict[str, Mirror] = {}
+def get_playlist_with_full_list_of_tracks(playlist_id: str, snapshot_id: str = None):
+    # a playlist downloaded during the current command is reused as is,
+    # a playlist downloaded by previous commands is reused only if its snapshot id has not changed
+    with fetched_playlists_lock:
+        if playlist_id in fetched_playlists:
+            playlist = fetched_playlists[playlist_id]
+            if snapshot_id is not None:
+                if playlist is not None and playlist.get('snapshot_id') == snapshot_id:
+                    fetched_playlists.move_to_end(playlist_id)
+                    return playlist
+            elif playlist_id in fetched_playlists_in_scope:
+                fetched_playlists.move_to_end(playlist_id)
+                return playlist
 
-    if os.path.isfile(mirrors_file_name):
-        with open(mirrors_file_name, 'r', encoding='utf-8-sig') as file:
+    playlist = spotify_api.get_playlist_with_full_list_of_tracks(playlist_id)
+    with fetched_playlists_lock:
+        fetched_playlists[playlist_id] = playlist
+        fetched_playlists.move_to_end(playlist_id)
+        fetched_playlists_in_scope[playlist_id] = None
+        while len(fetched_playlists) > FETCHED_PLAYLISTS_LIMIT:
+            fetched_playlists_in_scope.pop(fetched_playlists.popitem(last=False)[0], None)
+    return playlist
 
-            lines = file.readlines()
-            for line in lines:
-                line = line.rstrip("\n").strip()
-                if line == "":
-                    continue
 
-                sub_playlist_id = line.split(',')[0]
-                sub_from_cache = line.split(',')[1] == "+"
-                group = line.split(',')[2]
-                name = line.split(',', 3)[3]
+def forget_fetched_playlist(playlist_id: str):
+    with fetched_playlists_lock:
+        fetched_playlists.pop(playlist_id, None)
+        fetched_playlists_in_scope.pop(playlist_id, None)
+
+
+def run_concurrently(func, items: list, label: str = None, concurrency: int = None) -> list:
+    # results are returned in the same order as items
+    if concurrency is None:
+        concurrency = REQUESTS_CONCURRENCY
+    if len(items) == 0:
+        return []
+
+    # worker threads make requests with the same priority as the caller
+    priority = spotify.get_priority()
+
+    def run(item):
+        with spotify.priority(priority):
+            return func(item)
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(items)))) as executor:
+        if label is None:
+            return list(executor.map(run, items))
+        with click.progressbar(length=len(items), label=label) as bar:
+            for result in executor.map(run, items):
+                results.append(result)
+                bar.update(1)
+    return results
 
-                if group_name is None or group_name == group:
-                    if name not in mirrors:
-                        mirror = Mirror()
-                        mirror.group = group.upper()
-                        mirror.name = name
-                        mirrors[name] = mirror
-                    mirrors[name].subscribed_playlist_ids.append(sub_playlist_id)
-                    mirrors[name].subscribed_playlist_from_cache.append(sub_from_cache)
 
-    return mirrors
+def read_mirrors_store(group_name: str = None) -> MirrorsStore:
+    return MirrorsStore(mirrors_file_name).read(group_name)
+
+
+def read_mirrors(group_name: str = None) -> dict[str, Mirror]:
+    return read_mirrors_store(group_name).mirrors
 
 
 def find_mirror_playlists_in_library(mirrors: dict[str, Mirror], user_playlists: List):
@@ -110,13 +147,63 @@ def get_mirrors_playlist_ids(mirrors: dict[str, Mirror], mirror_names: List[str]
 
 
 def write_mirrors(mirrors: dict[str, Mirror]):
-    with open(mirrors_file_name, 'w', encoding='utf-8-sig') as file:
-        for m in mirrors.values():
-            for i, playlist_id in enumerate(m.subscribed_playlist_ids):
-                m.group = m.group.replace(",", " ")
-                m.group = m.group.upper()
-                m.name = m.name.replace(",", " ")
-                file.write(f'{playlist_id},{"+" if m.subscribed_playlist_from_cache[i] else "-"},{m.group},{m.name}\n')
+    MirrorsStore(mirrors_file_name).write(mirrors)
+
+
+# line format: listened_version,mirror_snapshot_id,sub_id:snapshot_id;sub_id:snapshot_id,mirror_name
+def read_mirrors_state() -> dict[str, MirrorState]:
+    states: dict[str, MirrorState] = {}
+
+    if not os.path.isfile(mirrors_state_file_name):
+        return states
+
+    with open(mirrors_state_file_name, 'r', encoding='utf-8-sig') as file:
+        for line in file:
+            line = line.rstrip("\n").strip()
+            if line == "":
+                continue
+
+            s = line.split(',', 3)
+            if len(s) < 4:
+                continue
+
+            state = MirrorState()
+            state.listened_version = s[0]
+            state.mirror_snapshot_id = s[1]
+            for sub in s[2].split(';'):
+                if sub != "":
+                    sub_id, snapshot_id = sub.split(':', 1)
+                    state.sub_snapshot_ids[sub_id] = snapshot_id
+            states[s[3]] = state
+
+    return states
+
+
+# states of mirrors which are no longer in the mirrors list are removed
+def write_mirrors_state(states: dict[str, MirrorState]):
+    mirrors = read_mirrors()
+    with open(mirrors_state_file_name, 'w', encoding='utf-8-sig') as file:
+        for name, state in states.items():
+            if name not in mirrors:
+                continue
+            subs = ";".join([f'{id}:{snapshot_id}' for id, snapshot_id in state.sub_snapshot_ids.items()])
+            file.write(f'{state.listened_version},{state.mirror_snapshot_id},{subs},{name}\n')
+
+
+def get_sub_snapshot_id(playlist_id: str, from_cache: bool, cached_playlists: dict = None):
+    # cached playlists have no snapshot id, file modification time is used instead
+    if from_cache:
+        if cached_playlists is None or playlist_id not in cached_playlists:
+            return ""
+        try:
+            return str(int(os.path.getmtime(cached_playlists[playlist_id][1])))
+        except OSError:
+            return ""
+
+    playlist = spotify_api.get_playlist(playlist_id)
+    if playlist is None or 'snapshot_id' not in playlist:
+        return ""
+    return playlist['snapshot_id']
 
 
 def generate_mirror_name(mirrors, playlist_name, mirror_name=None, group_name="MIRROR", generate_unique_name=False):
@@ -140,57 +227,99 @@ def generate_mirror_name(mirrors, playlist_name, mirror_name=None, group_name="M
 
 
 def subscribe(playlist_ids: list, mirror_name=None, group_name="MIRROR", from_cache=False, generate_unique_name=False):
-    if group_name is not None:
-        group_name = group_name.upper()
+    subscriptions = []
+    for playlist_id in playlist_ids:
+        subscriptions.append(Subscription(playlist_id, mirror_name, group_name, from_cache, generate_unique_name))
+    return subscribe_batch(subscriptions)
 
-    mirrors = read_mirrors()
-    all_subs = mirrors_dict_by_sub_playlist_ids(mirrors)
+
+def subscribe_batch(subscriptions: List[Subscription]):
+    store = read_mirrors_store()
+    mirrors = store.mirrors
     all_sub_playlist_ids = []
     all_new_mirror_names = []
-
-    if from_cache and mirror_name is None:
-        cached_playlists = cache.get_cached_playlists_dict()
-
-    for playlist_id in playlist_ids:
+    new_subscriptions = []
+
+    # resolve names of cached playlists in one pass over the cache catalog
+    cached_playlist_names = None
+    for sub in subscriptions:
+        if sub.from_cache and sub.mirror_name is None:
+            cached_playlist_names = cache.get_cached_playlists_names()
+            break
+
+    # resolve names of spotify playlists concurrently
+    spotify_ids = []
+    for sub in subscriptions:
+        if not sub.from_cache:
+            sub.playlist_id = spotify_api.parse_playlist_id(sub.playlist_id)
+            if sub.mirror_name is None:
+                spotify_ids.append(sub.playlist_id)
+    spotify_playlist_names = get_playlists_names(spotify_ids)
+
+    for sub in subscriptions:
+        playlist_id = sub.playlist_id
+        group_name = sub.group.upper() if sub.group is not None else default_mirror_group.upper()
         playlist_name = None
 
-        if mirror_name is None:
-            if from_cache:
-                if playlist_id in cached_playlists:
-                    playlist_name = cached_playlists[playlist_id][0]
+        if sub.mirror_name is None:
+            if sub.from_cache:
+                if playlist_id in cached_playlist_names:
+                    playlist_name = cached_playlist_names[playlist_id]
             else:
-                playlist_id = spotify_api.parse_playlist_id(playlist_id)
-                playlist = spotify_api.get_playlist(playlist_id)
-                if playlist is None:
+                playlist_name = spotify_playlist_names[playlist_id]
+                if playlist_name is None:
                     click.echo(f'Playlist "{playlist_id}" not found. Skipped.')
                     continue
-                playlist_name = playlist["name"]
 
-        if playlist_id in all_subs:
+        if store.find(playlist_id) is not None:
             click.echo(f'"{playlist_name}" ({playlist_id}) playlist skipped. Already subscribed.')
             continue
 
-        new_mirror_name = generate_mirror_name(mirrors, playlist_name, mirror_name, group_name, generate_unique_name)
+        new_mirror_name = generate_mirror_name(mirrors, playlist_name, sub.mirror_name, group_name,
+                                               sub.generate_unique_name)
+        new_mirror_name = new_mirror_name.replace(",", " ")
 
         all_sub_playlist_ids.append(playlist_id)
         all_new_mirror_names.append(new_mirror_name)
 
-        m = mirrors[new_mirror_name] if new_mirror_name in mirrors else Mirror()
+        store.add_subscription(playlist_id, sub.from_cache, group_name, new_mirror_name)
+
+        m = Mirror()
         m.name = new_mirror_name
-        m.group = group_name.upper()
+        m.group = group_name
         m.subscribed_playlist_ids.append(playlist_id)
-        m.subscribed_playlist_from_cache.append(from_cache)
-
-        mirrors[new_mirror_name] = m
-        all_subs[playlist_id] = m
+        m.subscribed_playlist_from_cache.append(sub.from_cache)
+        new_subscriptions.append(m)
 
         click.echo(f'Subscribed to playlist "{new_mirror_name}" ({playlist_id}).')
 
-    write_mirrors(mirrors)
+    store.append(new_subscriptions)
 
     return all_sub_playlist_ids, all_new_mirror_names
 
 
+# [id] = playlist_name (None if not found)
+# names are requested from spotify, names of cached playlists are changed to be valid file names
+def get_playlists_names(playlist_ids: List[str]) -> dict[str, str]:
+    res = {}
+    if len(playlist_ids) == 0:
+        return res
+
+    ids = list(dict.fromkeys(playlist_ids))
+    names = run_concurrently(get_playlist_name, ids, f'Requesting {len(ids)} playlists' if len(ids) > 1 else None)
+    for id, name in zip(ids, names):
+        res[id] = name
+    return res
+
+
+# only the name is requested, without tracks
+def get_playlist_name(playlist_id: str) -> str:
+    try:
+        return spotify_api.get_sp().playlist(playlist_id, fields='name')['name']
+    except:
+        return None
+
+
 def get_playlist_id_by_name(playlist_name: str, user_playlists: list = None):
     if user_playlists is None:
         user_playlists = spotify_api.get_list_of_playlists()
@@ -201,26 +330,15 @@ def get_playlist_id_by_name(playlist_name: str, user_playlists: list = None):
     return None
 
 
-# id - subscribed playlist id or mirror playlist id
-def find_mirror_by_id(playlist_id: str, mirrors: dict[str, Mirror], user_playlists: List) -> Mirror:
-    # search playlist id mirrors list
-    for m in mirrors.values():
-        for id in m.subscribed_playlist_ids:
-            if id == playlist_id:
-                return m
-
-    # search playlist id user library
+def get_playlist_snapshot_id(playlist_id: str, user_playlists: list):
     for playlist in user_playlists:
         if playlist['id'] == playlist_id:
-            mirror_name = playlist['name']
-            if mirror_name in mirrors:
-                return mirrors[mirror_name]
-
+            return playlist.get('snapshot_id')
     return None
 
 
 def unsubscribe(playlist_ids: List[str], remove_mirrors=True, confirm=False, user_playlists: list = None):
-    mirrors = read_mirrors()
+    store = read_mirrors_store()
 
     unsubscribed = []
     removed = []
@@ -229,35 +347,36 @@ def unsubscribe(playlist_ids: List[str], remove_mirrors=True, confirm=False, use
 
     if user_playlists is None:
         user_playlists = spotify_api.get_list_of_playlists()
-    find_mirror_playlists_in_library(mirrors, user_playlists)
+    store.set_library_playlists(user_playlists)
 
     for playlist_id in playlist_ids:
         playlist_id = spotify_api.parse_playlist_id(playlist_id)
 
-        m = find_mirror_by_id(playlist_id, mirrors, user_playlists)
+        m = store.find(playlist_id)
         if m is None:
             click.echo(f'Mirror {playlist_id} not found. Skipped.')
             continue
 
         if m.playlist_id is not None and m.playlist_id not in processed:
-            process_listened_playlist(m.playlist_id, False, False, False, False, confirm)
+            process_listened_playlist(m.playlist_id, False, False, False, False, confirm,
+                                      get_playlist_snapshot_id(m.playlist_id, user_playlists))
             processed[m.playlist_id] = m
 
-        if playlist_id in m.subscribed_playlist_ids:
-            m.subscribed_playlist_ids.remove(playlist_id)
+        store.remove_subscription(playlist_id)
 
         if remove_mirrors:
             if m.playlist_id is not None:
                 if playlist_id == m.playlist_id or len(m.subscribed_playlist_ids) == 0:
-                    del mirrors[m.name]
+                    store.remove_mirror(m)
                     deleted = spotify_api.delete_playlist(m.playlist_id, confirm)
                     if deleted:
+                        forget_fetched_playlist(m.playlist_id)
                         removed.append(m)
 
         unsubscribed.append(playlist_id)
         click.echo(f'Mirror unsubscribed "{m.name}" ({playlist_id}).')
 
-    write_mirrors(mirrors)
+    store.write()
 
     return unsubscribed
 
@@ -267,8 +386,9 @@ def unsubscribe_all(remove_mirrors=True, confirm=False, group:str=None,filter_na
 
     if filter_names is not None:
         filtered = {}
+        pattern = re.compile(filter_names.upper())
         for name, m in mirrors.items():
-            if re.search(filter_names.upper(), name.upper()):
+            if pattern.search(name.upper()):
                 filtered[m.name] = m
         mirrors = filtered
 
@@ -285,24 +405,26 @@ def unsubscribe_mirrors_by_name(mirror_names, remove_mirrors, confirm):
 
 
 def list_mirrors(playlist_ids: List[str], filter_names: str = None):
-    mirrors = read_mirrors()
+    store = read_mirrors_store()
+    mirrors = store.mirrors
 
     if filter_names is not None:
         filtered = {}
+        pattern = re.compile(filter_names.upper())
         for name, m in mirrors.items():
-            if re.search(filter_names.upper(), name.upper()):
+            if pattern.search(name.upper()):
                 filtered[m.name] = m
         mirrors = filtered
 
     user_playlists = spotify_api.get_list_of_playlists()
-    find_mirror_playlists_in_library(mirrors, user_playlists)
+    store.set_library_playlists(user_playlists)
 
     if playlist_ids is not None and len(playlist_ids) > 0:
         filtered = {}
         for playlist_id in playlist_ids:
             playlist_id = spotify_api.parse_playlist_id(playlist_id)
-            m = find_mirror_by_id(playlist_id, mirrors, user_playlists)
-            if m is None:
+            m = store.find(playlist_id)
+            if m is None or m.name not in mirrors:
                 click.echo(f'Mirror {playlist_id} not found. Skipped.')
                 continue
             filtered[m.name] = m
@@ -330,19 +452,19 @@ def list_mirrors(playlist_ids: List[str], filter_names: str = None):
 
 
 def update(remove_empty_mirrors=False, confirm=False, playlist_ids: List[str] = None, group_name: str = None,
-           update_cached_playlists=True):
-    mirrors = read_mirrors(group_name)
+           update_cached_playlists=True, full_update=False):
+    store = read_mirrors_store(group_name)
+    mirrors = store.mirrors
     if len(mirrors) == 0:
         click.echo('No mirror playlists found. Use "sub" command for subscribe to playlists.')
         exit()
 
-    mirror_playlist_ids = mirrors_dict_by_sub_playlist_ids(mirrors)
-    mirrors_by_group = mirrors_dict_by_group(mirrors)
+    mirrors_by_group = store.mirrors_by_group
 
     mirrors_to_update = {}
 
     user_playlists = spotify_api.get_list_of_playlists()
-    find_mirror_playlists_in_library(mirrors, user_playlists)
+    store.set_library_playlists(user_playlists)
 
     if group_name is not None:
         group_name = group_name.upper()
@@ -355,7 +477,7 @@ def update(remove_empty_mirrors=False, confirm=False, playlist_ids: List[str] =
     if playlist_ids is not None:
         for id in playlist_ids:
             id = spotify_api.parse_playlist_id(id)
-            m = find_mirror_by_id(id, mirrors, user_playlists)
+            m = store.find(id)
             if m:
                 mirrors_to_update[m.name] = m
             else:
@@ -376,64 +498,105 @@ def update(remove_empty_mirrors=False, confirm=False, playlist_ids: List[str] =
 
     cached_playlists = None
 
-    requested_playlists = {}
+    # mirrors whose sources, mirror playlist and listened list did not change since the last update are skipped
+    states = read_mirrors_state()
+    user_playlists_by_ids = {}
+    for playlist in user_playlists:
+        user_playlists_by_ids[playlist['id']] = playlist
+    sub_snapshot_ids = {}
+    skipped_mirrors = []
 
     with click.progressbar(mirrors_to_update.values(),
                            label=f'Updating {len(mirrors_to_update.values())} mirrors') as bar:
         for m in bar:
+            listened_version = lis.get_listened_version()
+
+            mirror_snapshot_id = ""
+            if m.playlist_id is not None and m.playlist_id in user_playlists_by_ids:
+                mirror_snapshot_id = user_playlists_by_ids[m.playlist_id].get('snapshot_id', "")
+
+            # collect snapshot ids of subscribed playlists (cheap metadata requests)
+            mirror_sub_snapshot_ids = {}
+            for i, id in enumerate(m.subscribed_playlist_ids):
+                from_cache = m.subscribed_playlist_from_cache[i]
+                if from_cache and not update_cached_playlists:
+                    if m.name in states and id in states[m.name].sub_snapshot_ids:
+                        mirror_sub_snapshot_ids[id] = states[m.name].sub_snapshot_ids[id]
+                    continue
+                if from_cache and cached_playlists is None:
+                    cached_playlists = cache.get_cached_playlists_dict()
+                if id not in sub_snapshot_ids:
+                    sub_snapshot_ids[id] = get_sub_snapshot_id(id, from_cache, cached_playlists)
+                mirror_sub_snapshot_ids[id] = sub_snapshot_ids[id]
+
+            # subscribed playlists are not read again if nothing changed, but liked and listened tracks
+            # of the mirror are always processed
+            sources_changed = True
+            if not full_update and m.name in states:
+                state = states[m.name]
+                if state.listened_version == listened_version \
+                        and state.mirror_snapshot_id == mirror_snapshot_id \
+                        and state.sub_snapshot_ids == mirror_sub_snapshot_ids \
+                        and "" not in mirror_sub_snapshot_ids.values():
+                    skipped_mirrors.append(m)
+                    sources_changed = False
+
+            mirror_changed = False
+
             # get all tracks from subscribed playlists
             all_mirror_tracks = []
 
-            # collect all tracks from subscribed playlists
-            for i, id in enumerate(m.subscribed_playlist_ids):
-                sub_playlists_count += 1
-
-                # read playlist from cache
-                if m.subscribed_playlist_from_cache[i]:
-                    if update_cached_playlists:
-                        if cached_playlists is None:
-                            cached_playlists = cache.get_cached_playlists_dict()
-                        if id not in cached_playlists:
+            if sources_changed:
+                # collect all tracks from subscribed playlists
+                for i, id in enumerate(m.subscribed_playlist_ids):
+                    sub_playlists_count += 1
+
+                    # read playlist from cache
+                    if m.subscribed_playlist_from_cache[i]:
+                        if update_cached_playlists:
+                            if cached_playlists is None:
+                                cached_playlists = cache.get_cached_playlists_dict()
+                            if id not in cached_playlists:
+                                click.echo(
+                                    f"\nCant update mirror playlist {id}. CSV file not found in cache directory.")
+                                continue
+                            csv_file_name = cached_playlists[id][1]
+                            playlist = cache.read_cached_playlist(csv_file_name)
+                            all_mirror_tracks.extend(playlist['tracks'])
+                            all_tracks.extend(playlist['tracks'])
+                    # read playlist from spotify
+                    else:
+                        playlist = get_playlist_with_full_list_of_tracks(id, sub_snapshot_ids.get(id) or None)
+                        if playlist is None:
                             click.echo(
-                                f"\nCant update mirror playlist {id}. CSV file not found in cache directory.")
+                                f"\nCant update mirror playlist {id}. Playlist not found in spotify.")
                             continue
-                        csv_file_name = cached_playlists[id][1]
-                        playlist = cache.read_cached_playlist(csv_file_name)
-                        all_mirror_tracks.extend(playlist['tracks'])
-                        all_tracks.extend(playlist['tracks'])
-                # read playlist from spotify
-                else:
-                    # prevent request twice
-                    if id not in requested_playlists:
-                        requested_playlists[id] = spotify_api.get_playlist_with_full_list_of_tracks(id)
-                    playlist = requested_playlists[id]
-                    if playlist is None:
-                        click.echo(
-                            f"\nCant update mirror playlist {id}. Playlist not found in spotify.")
-                        continue
-                    tracks = playlist["tracks"]["items"]
-                    tags_list = spotify_api.read_tags_from_spotify_tracks(tracks)
-                    all_mirror_tracks.extend(tags_list)
-                    all_tracks.extend(tags_list)
-
-            # remove duplicates
-            all_mirror_tracks, duplicates = utils.remove_duplicated_tags(all_mirror_tracks, ['SPOTIFY_TRACK_ID'])
-            all_duplicates.extend(duplicates)
-
-            # remove already listened tracks
-            all_mirror_tracks, listened_tracks = lis.get_not_listened_tracks(all_mirror_tracks)
-            all_listened.extend(listened_tracks)
-
-            # remove liked tracks
-            liked, not_liked = spotify_api.get_liked_tags_list(all_mirror_tracks)
-            all_liked.extend(liked)
-            all_mirror_tracks = not_liked
+                        tracks = playlist["tracks"]["items"]
+                        tags_list = spotify_api.read_tags_from_spotify_tracks(tracks)
+                        all_mirror_tracks.extend(tags_list)
+                        all_tracks.extend(tags_list)
+
+                # remove duplicates
+                all_mirror_tracks, duplicates = utils.remove_duplicated_tags(all_mirror_tracks, ['SPOTIFY_TRACK_ID'])
+                all_duplicates.extend(duplicates)
+
+                # remove already listened tracks
+                all_mirror_tracks, listened_tracks = lis.get_not_listened_tracks(all_mirror_tracks)
+                all_listened.extend(listened_tracks)
+
+                # remove liked tracks
+                liked, not_liked = spotify_api.get_liked_tags_list(all_mirror_tracks)
+                all_liked.extend(liked)
+                all_mirror_tracks = not_liked
 
             if m.playlist_id is not None:
                 mirror_tags_list, added_to_listened, removed_liked, removed_listened, removed_duplicates = \
-                    process_listened_playlist(m.playlist_id, remove_empty_mirrors, True, True, True, confirm)
+                    process_listened_playlist(m.playlist_id, remove_empty_mirrors, True, True, True, confirm,
+                                              mirror_snapshot_id or None)
 
                 all_liked_added_to_listened.extend(added_to_listened)
+                if len(removed_liked) > 0 or len(removed_listened) > 0 or len(removed_duplicates) > 0:
+                    mirror_changed = True
 
                 # remove tracks already exist in mirror
                 all_mirror_tracks, already_exist = utils.remove_exist_tags(mirror_tags_list, all_mirror_tracks,
@@ -449,11 +612,29 @@ def update(remove_empty_mirrors=False, confirm=False, playlist_ids: List[str] =
                 new_tracks_ids = spotify_api.get_track_ids_from_tags_list(all_mirror_tracks)
                 tracks_added, import_duplicates, already_exist, invalid_ids = \
                     spotify_api.add_tracks_to_playlist_by_ids(m.playlist_id, new_tracks_ids, True)
+                forget_fetched_playlist(m.playlist_id)
                 all_added_to_mirrors.extend(tracks_added)
                 if len(tracks_added) > 0:
+                    mirror_changed = True
                     summery.append(
                         f'{len(tracks_added)} tracks added to mirror playlist "{m.name}"')
 
+            # remember the state of the mirror to skip it next time if nothing changes
+            if mirror_changed and m.playlist_id is not None:
+                playlist = spotify_api.get_playlist(m.playlist_id)
+                mirror_snapshot_id = playlist.get('snapshot_id', "") if playlist is not None else ""
+            state = MirrorState()
+            state.mirror_snapshot_id = mirror_snapshot_id
+            state.sub_snapshot_ids = mirror_sub_snapshot_ids
+            states[m.name] = state
+
+    # liked tracks moved to listened by this update are already removed from the processed mirrors,
+    # so the states are saved with the listened version after processing all of them
+    listened_version = lis.get_listened_version()
+    for m in mirrors_to_update.values():
+        states[m.name].listened_version = listened_version
+    write_mirrors_state(states)
+
     click.echo()
     for line in summery:
         click.echo(line)
@@ -461,7 +642,10 @@ def update(remove_empty_mirrors=False, confirm=False, playlist_ids: List[str] =
     click.echo("------------------------------------------")
     if group_name is not None:
         mirrors = read_mirrors()
-    click.echo(f'{len(mirrors_to_update)}/{len(mirrors)} mirrors updated.')
+    click.echo(f'{len(mirrors_to_update) - len(skipped_mirrors)}/{len(mirrors)} mirrors updated.')
+    if len(skipped_mirrors) > 0:
+        click.echo(f'{len(skipped_mirrors)} mirrors not refilled '
+                   f'(no changes in subscribed playlists since the last update).')
     click.echo(f'{len(all_tracks)} tracks total in {sub_playlists_count} subscribed playlists.')
     if len(all_listened) > 0:
         click.echo(f'{len(all_listened)} tracks already listened (not added to mirrors).')
@@ -475,11 +659,11 @@ def update(remove_empty_mirrors=False, confirm=False, playlist_ids: List[str] =
 
 
 def process_listened_playlist(playlist_id, remove_if_empty=True, remove_liked=True, remove_listened=True,
-                              remove_duplicates=True, confirm=False):
+                              remove_duplicates=True, confirm=False, snapshot_id: str = None):
     # get tracks
-    playlist = spotify_api.get_playlist_with_full_list_of_tracks(playlist_id)
+    playlist = get_playlist_with_full_list_of_tracks(playlist_id, snapshot_id)
     if playlist is None:
-        return [], [], []
+        return [], [], [], [], []
     playlist_name = playlist['name']
     tracks = playlist["tracks"]["items"]
     tags_list = spotify_api.read_tags_from_spotify_tracks(tracks)
@@ -496,6 +680,7 @@ def process_listened_playlist(playlist_id, remove_if_empty=True, remove_liked=Tr
         if len(tags_list) > 0:
             liked_ids = spotify_api.get_track_ids_from_tags_list(liked_tags_list)
             spotify_api.remove_tracks_from_playlist(playlist_id, liked_ids)
+            forget_fetched_playlist(playlist_id)
             tags_list, removed_liked = utils.remove_exist_tags(liked_tags_list, tags_list, ['SPOTIFY_TRACK_ID'])
             if len(removed_liked) > 0:
                 click.echo(
@@ -510,6 +695,7 @@ def process_listened_playlist(playlist_id, remove_if_empty=True, remove_liked=Tr
             ids = spotify_api.get_track_ids_from_tags_list(listened)
             if len(ids) > 0:
                 spotify_api.remove_tracks_from_playlist(playlist_id, ids)
+                forget_fetched_playlist(playlist_id)
                 removed_listened.extend(listened)
                 tags_list = not_listened
 
@@ -521,6 +707,7 @@ def process_listened_playlist(playlist_id, remove_if_empty=True, remove_liked=Tr
             ids = spotify_api.get_track_ids_from_tags_list(duplicates)
             if len(ids) > 0:
                 spotify_api.remove_tracks_from_playlist(playlist_id, ids)
+                forget_fetched_playlist(playlist_id)
                 removed_duplicates.extend(duplicates)
                 tags_list = not_duplicated
 
@@ -529,6 +716,7 @@ def process_listened_playlist(playlist_id, remove_if_empty=True, remove_liked=Tr
         if len(tags_list) == 0:
             res = spotify_api.delete_playlist(playlist_id, confirm)
             if res:
+                forget_fetched_playlist(playlist_id)
                 click.echo(
                     f'\nMirror playlist "{playlist_name}" ({playlist_id}) is empty and has been removed from library.')
 
@@ -576,6 +764,7 @@ def delete(playlist_ids, confirm):
 
         res = spotify_api.delete_playlist(playlist_id, confirm)
         if res:
+            forget_fetched_playlist(playlist_id)
             deleted.append(playlist_id)
 
     return deleted
@@ -610,15 +799,7 @@ def get_user_library(group_name: str = None, filter_names=None, add_fav_to_liste
     if group_name is not None:
         group_name = group_name.upper()
 
-    lib = UserLibrary()
-
-    lib.mirrors = read_mirrors(group_name)
-    lib.subscribed_playlist_ids = mirrors_dict_by_sub_playlist_ids(lib.mirrors)
-
-    listened_tracks = lis.read_listened_tracks()
-    lib.listened_tracks.add_tracks(listened_tracks)
-
-    lib.all_playlists = spotify_api.get_list_of_playlists()
+    all_playlists = spotify_api.get_list_of_playlists()
 
     # find fav playlists from spotify
     fav_playlist_ids = []
@@ -629,15 +810,33 @@ def get_user_library(group_name: str = None, filter_names=None, add_fav_to_liste
             exit()
 
         for rule in PLAYLISTS_WITH_FAVORITES:
-            for playlist in lib.all_playlists:
+            for playlist in all_playlists:
                 if re.findall(rule, playlist['name']):
                     fav_playlist_ids.append(playlist['id'])
     else:
-        playlists = list(filter(lambda pl: re.findall(filter_names, pl['name']), lib.all_playlists))
-        click.echo(f'{len(playlists)}/{len(lib.all_playlists)} playlists matches the regex filter')
+        playlists = list(filter(lambda pl: re.findall(filter_names, pl['name']), all_playlists))
+        click.echo(f'{len(playlists)}/{len(all_playlists)} playlists matches the regex filter')
         for playlist in playlists:
             fav_playlist_ids.append(playlist['id'])
 
+    # the library is rebuilt only if listened list, mirrors, fav playlists or settings changed
+    snapshot_key = get_library_snapshot_key(group_name, filter_names, add_fav_to_listened, all_playlists,
+                                            fav_playlist_ids)
+    lib = read_library_snapshot(snapshot_key)
+    if lib is not None:
+        lib.all_playlists = all_playlists
+        return lib
+
+    lib = UserLibrary()
+
+    lib.mirrors = read_mirrors(group_name)
+    lib.subscribed_playlist_ids = mirrors_dict_by_sub_playlist_ids(lib.mirrors)
+
+    listened_tracks = lis.read_listened_tracks()
+    lib.listened_tracks.add_tracks(listened_tracks)
+
+    lib.all_playlists = all_playlists
+
     # read fav playlists from spotify
     fav_tags, lib.fav_playlist_ids = cache.get_tracks_from_playlists(fav_playlist_ids)
     lib.fav_tracks.add_tracks(fav_tags)
@@ -647,9 +846,73 @@ def get_user_library(group_name: str = None, filter_names=None, add_fav_to_liste
 
     __calculate_artists_rating(lib)
 
+    write_library_snapshot(snapshot_key, lib)
+
     return lib
 
 
+def get_library_snapshot_key(group_name, filter_names, add_fav_to_listened, all_playlists, fav_playlist_ids):
+    snapshot_ids = {}
+    for playlist in all_playlists:
+        snapshot_ids[playlist['id']] = playlist.get('snapshot_id')
+
+    # fav playlists can be read from the library cache instead of spotify
+    library_catalog = cache.read_cache_catalog(True)
+
+    fav_playlists = []
+    for id in fav_playlist_ids:
+        cached_date = library_catalog[id][0] if id in library_catalog else None
+        fav_playlists.append((id, snapshot_ids.get(id), cached_date))
+
+    mirrors_version = None
+    if os.path.isfile(mirrors_file_name):
+        stat = os.stat(mirrors_file_name)
+        mirrors_version = (stat.st_mtime, stat.st_size)
+
+    return (LIBRARY_SNAPSHOT_VERSION, group_name, filter_names, add_fav_to_listened, tuple(PLAYLISTS_WITH_FAVORITES),
+            lis.get_listened_version(), mirrors_version, tuple(fav_playlists))
+
+
+# the last library loaded by this process: [snapshot_key, lib]
+loaded_library = [None, None]
+
+
+def read_library_snapshot(snapshot_key) -> UserLibrary:
+    if loaded_library[0] == snapshot_key:
+        return loaded_library[1]
+
+    if not os.path.isfile(library_snapshot_file_name):
+        return None
+
+    try:
+        with open(library_snapshot_file_name, 'rb') as file:
+            key = pickle.load(file)
+            if key != snapshot_key:
+                return None
+            lib = pickle.load(file)
+    except Exception:
+        return None
+
+    loaded_library[0] = snapshot_key
+    loaded_library[1] = lib
+    return lib
+
+
+def write_library_snapshot(snapshot_key, lib: UserLibrary):
+    loaded_library[0] = snapshot_key
+    loaded_library[1] = lib
+
+    # the key is written before the library, so an outdated snapshot can be detected without loading it
+    temp_file_name = library_snapshot_file_name + ".tmp"
+    try:
+        with open(temp_file_name, 'wb') as file:
+            pickle.dump(snapshot_key, file, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(lib, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file_name, library_snapshot_file_name)
+    except OSError:
+        click.echo(f'\nCant write library snapshot: "{library_snapshot_file_name}"')
+
+
 def playlist_info(lib, playlist_ids):
     ids = []
     for playlist_ids in playlist_ids:
@@ -657,18 +920,32 @@ def playlist_info(lib, playlist_ids):
         ids.append(playlist_id)
     playlist_ids = ids
 
+    # read playlists from cache if a fresh copy exists, download others concurrently
+    fresh_cached_playlists = cache.get_fresh_cached_playlists(playlist_ids)
+
+    def read_playlist(playlist_id):
+        if playlist_id in fresh_cached_playlists:
+            pl = cache.read_cached_playlist(fresh_cached_playlists[playlist_id])
+            # the name of the cached file is changed to be a valid file name
+            name = get_playlist_name(playlist_id) or pl['name']
+            return {'id': playlist_id, 'name': name}, pl['tracks']
+        playlist = get_playlist_with_full_list_of_tracks(playlist_id)
+        if playlist is None:
+            return None, []
+        tracks = playlist["tracks"]["items"]
+        return playlist, spotify_api.read_tags_from_spotify_tracks(tracks)
+
+    results = run_concurrently(read_playlist, playlist_ids,
+                               f'Reading {len(playlist_ids)} playlists' if len(playlist_ids) > 1 else None)
+
     infos = []
 
-    for playlist_id in playlist_ids:
-        playlist = spotify_api.get_playlist_with_full_list_of_tracks(playlist_id)
+    for playlist_id, (playlist, tags_list) in zip(playlist_ids, results):
         if playlist is None:
             click.echo(f'  Playlist "{playlist_id}" not found.')
             continue
 
-        tracks = playlist["tracks"]["items"]
-        tags_list = spotify_api.read_tags_from_spotify_tracks(tracks)
-
-        playlist['isrcs'] = {}
+        playlist = {'id': playlist['id'], 'name': playlist['name'], 'isrcs': {}}
         for tag in tags_list:
             if 'ISRC' in tag and 'ARTIST' in tag and 'TITLE' in tag:
                 artists = str.split(tag['ARTIST'], ';')
@@ -684,12 +961,44 @@ def playlist_info(lib, playlist_ids):
 
 
 def __get_playlist_info(params: FindBestTracksParams, playlist) -> PlaylistInfo:
-    info = PlaylistInfo()
-    info.playlist_name = playlist['name']
-    info.playlist_id = playlist['id']
+    return get_playlist_infos([params], playlist)[0]
+
+
+# one info for each params, tracks are checked with the library and with each distinct reference collection only once
+def get_playlist_infos(params_list: List[FindBestTracksParams], playlist) -> List[PlaylistInfo]:
+    libs = get_libraries(params_list)
+    ref_collections = get_ref_collections(params_list)
+    counts_list, ref_counts = get_playlist_counts_by_libraries(libs, ref_collections, playlist)
+    return get_playlist_infos_by_libraries(params_list, libs, counts_list, ref_collections, ref_counts)
+
+
+def get_libraries(params_list: List[FindBestTracksParams]) -> List[UserLibrary]:
+    libs = []
+    for params in params_list:
+        if not any(params.lib is lib for lib in libs):
+            libs.append(params.lib)
+    return libs
+
+
+def get_ref_collections(params_list: List[FindBestTracksParams]) -> List[TracksCollection]:
+    ref_collections = []
+    for params in params_list:
+        if not any(params.ref_tracks is ref_tracks for ref_tracks in ref_collections):
+            ref_collections.append(params.ref_tracks)
+    return ref_collections
+
+
+# counts - PlaylistInfo without reference tracks and points,
+# ref_counts - [ref_tracks_count, ref_tracks_by_playlists] for each reference collection
+def get_playlist_counts(lib: UserLibrary, ref_collections: List[TracksCollection], playlist) -> (
+        PlaylistInfo, List[list]):
+    counts = PlaylistInfo()
+    counts.playlist_name = playlist['name']
+    counts.playlist_id = playlist['id']
     playlist_isrcs = playlist['isrcs']
     # playlist_artists = playlist['artists']
-    info.tracks_count = len(playlist_isrcs)
+    counts.tracks_count = len(playlist_isrcs)
+    ref_counts = [[0, {}] for ref_tracks in ref_collections]
 
     for isrc in playlist_isrcs:
         artists = []
@@ -699,59 +1008,103 @@ def __get_playlist_info(params: FindBestTracksParams, playlist) -> PlaylistInfo:
             title = playlist_isrcs[isrc][artist]
 
         # check if listened
-        is_listened = __is_track_exist_in_collection(params.lib.listened_tracks, None, isrc, artists, title)
+        is_listened = __is_track_exist_in_collection(lib.listened_tracks, None, isrc, artists, title)
         if is_listened:
-            info.listened_tracks_count += 1
+            counts.listened_tracks_count += 1
 
         # check if favorite
-        is_fav = __is_track_exist_in_collection(params.lib.fav_tracks, None, isrc, artists, title)
+        is_fav = __is_track_exist_in_collection(lib.fav_tracks, None, isrc, artists, title)
         if is_fav:
-            info.fav_tracks_count += 1
-            playlist_names = __get_playlist_names(params.lib.fav_tracks, None, isrc, artists, title)
+            counts.fav_tracks_count += 1
+            playlist_names = __get_playlist_names(lib.fav_tracks, None, isrc, artists, title)
             for playlist_name in playlist_names:
-                if playlist_name in info.fav_tracks_by_playlists:
-                    info.fav_tracks_by_playlists[playlist_name] += 1
+                if playlist_name in counts.fav_tracks_by_playlists:
+                    counts.fav_tracks_by_playlists[playlist_name] += 1
                 else:
-                    info.fav_tracks_by_playlists[playlist_name] = 1
+                    counts.fav_tracks_by_playlists[playlist_name] = 1
 
         # check if reference
-        is_ref = __is_track_exist_in_collection(params.ref_tracks, None, isrc, artists, title)
-        if is_ref:
-            info.ref_tracks_count += 1
-            playlist_names = __get_playlist_names(params.ref_tracks, None, isrc, artists, title)
-            for playlist_name in playlist_names:
-                if playlist_name in info.ref_tracks_by_playlists:
-                    info.ref_tracks_by_playlists[playlist_name] += 1
-                else:
-                    info.ref_tracks_by_playlists[playlist_name] = 1
+        for ref_tracks, ref_count in zip(ref_collections, ref_counts):
+            is_ref = __is_track_exist_in_collection(ref_tracks, None, isrc, artists, title)
+            if is_ref:
+                ref_count[0] += 1
+                playlist_names = __get_playlist_names(ref_tracks, None, isrc, artists, title)
+                for playlist_name in playlist_names:
+                    if playlist_name in ref_count[1]:
+                        ref_count[1][playlist_name] += 1
+                    else:
+                        ref_count[1][playlist_name] = 1
 
         # is probably good or bad
-        prob_good_or_bad = 0
         if not is_listened:
-            info.prob_good_tracks_percentage += __get_prob_good_track_percentage(params, artists)
-            pass
+            counts.prob_good_tracks_percentage += __get_prob_good_track_percentage(lib, artists)
 
-    not_listened_count = info.tracks_count - info.listened_tracks_count
+    not_listened_count = counts.tracks_count - counts.listened_tracks_count
     if not_listened_count > 0:
-        info.prob_good_tracks_percentage /= not_listened_count
-        info.prob_good_tracks_percentage *= 100
+        counts.prob_good_tracks_percentage /= not_listened_count
+        counts.prob_good_tracks_percentage *= 100
     else:
-        info.prob_good_tracks_percentage = 50
+        counts.prob_good_tracks_percentage = 50
+
+    if counts.listened_tracks_count != 0:
+        counts.fav_percentage = counts.fav_tracks_count / counts.listened_tracks_count * 100
+        counts.listened_percentage = counts.listened_tracks_count / counts.tracks_count * 100
+
+    return counts, ref_counts
+
+
+# counts for each library, reference tracks do not depend on the library and are counted once
+def get_playlist_counts_by_libraries(libs: List[UserLibrary], ref_collections: List[TracksCollection], playlist) -> (
+        List[PlaylistInfo], List[list]):
+    counts, ref_counts = get_playlist_counts(libs[0], ref_collections, playlist)
+    counts_list = [counts]
+    for lib in libs[1:]:
+        counts_list.append(get_playlist_counts(lib, [], playlist)[0])
+    return counts_list, ref_counts
+
+
+def get_playlist_infos_by_libraries(params_list: List[FindBestTracksParams], libs: List[UserLibrary],
+                                    counts_list: List[PlaylistInfo], ref_collections: List[TracksCollection],
+                                    ref_counts: List[list]) -> List[PlaylistInfo]:
+    if len(libs) == 1:
+        return get_playlist_infos_by_counts(params_list, counts_list[0], ref_collections, ref_counts)
+
+    infos = [None] * len(params_list)
+    for lib, counts in zip(libs, counts_list):
+        indexes = [i for i, params in enumerate(params_list) if params.lib is lib]
+        lib_infos = get_playlist_infos_by_counts([params_list[i] for i in indexes], counts, ref_collections,
+                                                 ref_counts)
+        for i, info in zip(indexes, lib_infos):
+            infos[i] = info
+    return infos
 
-    if info.listened_tracks_count != 0:
-        info.fav_percentage = info.fav_tracks_count / info.listened_tracks_count * 100
-        info.ref_percentage = info.ref_tracks_count / info.listened_tracks_count * 100
-        info.listened_percentage = info.listened_tracks_count / info.tracks_count * 100
 
-    __calculate_playlist_points(params, info)
-    info.fav_points = round(info.fav_points, 2)
-    info.ref_points = round(info.ref_points, 2)
+def get_playlist_infos_by_counts(params_list: List[FindBestTracksParams], counts: PlaylistInfo,
+                                 ref_collections: List[TracksCollection], ref_counts: List[list]) -> List[PlaylistInfo]:
+    # scoring of each params is applied to the same counts
+    infos = []
+    for params in params_list:
+        info = copy.copy(counts)
+        ref_count = next(c for r, c in zip(ref_collections, ref_counts) if r is params.ref_tracks)
+        info.ref_tracks_count = ref_count[0]
+        info.ref_tracks_by_playlists = ref_count[1]
+        if info.listened_tracks_count != 0:
+            info.ref_percentage = info.ref_tracks_count / info.listened_tracks_count * 100
+
+        __calculate_playlist_points(params, info)
+        info.fav_points = round(info.fav_points, 2)
+        info.ref_points = round(info.ref_points, 2)
+        infos.append(info)
 
-    return info
+    return infos
 
 
 def __calculate_playlist_points(params: FindBestTracksParams, info: PlaylistInfo):
-    accuracy = np.interp(info.listened_tracks_count, [0, params.listened_accuracy], [0, 1])
+    # linear interpolation from 0 (no listened tracks) to 1 (listened_accuracy tracks listened)
+    if params.listened_accuracy > 0:
+        accuracy = min(max(info.listened_tracks_count / params.listened_accuracy, 0), 1)
+    else:
+        accuracy = 1 if info.listened_tracks_count >= 0 else 0
     info.fav_points = info.fav_percentage * accuracy
     info.ref_points = info.ref_percentage * accuracy
     info.prob_points = info.prob_good_tracks_percentage * accuracy
@@ -796,15 +1149,15 @@ def __get_playlist_names(col: TracksCollection, id=None, isrc=None, artists=None
     return result
 
 
-def __get_prob_good_track_percentage(params: FindBestTracksParams, artists):
+def __get_prob_good_track_percentage(lib: UserLibrary, artists):
     best = None
     for artist in artists:
-        if artist in params.lib.artists_rating:
+        if artist in lib.artists_rating:
             # artist rating:
             # 0 = all tracks are bad
             # 0.5 - 50% tracks is good
             # 1 = all tracks are good
-            rating = params.lib.artists_rating[artist]
+            rating = lib.artists_rating[artist]
             if best is None:
                 best = rating
             elif rating > best:
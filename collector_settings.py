@@ -0,0 +1,30 @@
+from dynaconf import Dynaconf
+import os.path
+
+current_directory = os.path.dirname(os.path.realpath(__file__))
+settings_file_name = os.path.join(current_directory, 'settings.toml')
+
+settings = Dynaconf(
+    envvar_prefix="COLLECTOR",
+    settings_files=[settings_file_name],
+)
+
+
+def get_file_name(file_name: str):
+    # relative paths in settings are relative to the plugin folder
+    if file_name.startswith("./") or file_name.startswith(".\\"):
+        file_name = os.path.join(current_directory, file_name)
+
+    return os.path.abspath(file_name)
+
+
+mirrors_file_name = get_file_name(settings.COLLECTOR.MIRRORS_FILE_NAME)
+mirrors_state_file_name = get_file_name(settings.COLLECTOR.MIRRORS_STATE_FILE_NAME)
+listened_file_name = get_file_name(settings.COLLECTOR.LISTENED_FILE_NAME)
+library_snapshot_file_name = get_file_name(settings.COLLECTOR.LIBRARY_SNAPSHOT_FILE_NAME)
+daemon_socket_file_name = get_file_name(settings.COLLECTOR.DAEMON_SOCKET_FILE_NAME)
+spotify_session_file_name = get_file_name(settings.COLLECTOR.SPOTIFY_SESSION_FILE_NAME)
+profiles_dir = get_file_name(settings.COLLECTOR.PROFILES_DIR_NAME)
+
+cache_dir = os.path.abspath(os.path.join(current_directory, 'cache'))
+library_cache_dir = os.path.abspath(os.path.join(current_directory, 'library_cache'))
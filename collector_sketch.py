@@ -0,0 +1,89 @@
+import base64
+import hashlib
+import math
+import random
+
+HLL_PRECISION = 14  # 16384 registers, about 0.8% standard error
+
+
+def hash64(value: str) -> int:
+    # stable between processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    precision: int
+    registers: bytearray
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value: str):
+        x = hash64(value)
+        bits = 64 - self.precision
+        index = x >> bits
+        rank = bits - (x & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def add_all(self, values):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: 'HyperLogLog'):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros > 0:
+            estimate = m * math.log(m / zeros)  # linear counting for small cardinalities
+        return int(round(estimate))
+
+    def to_string(self) -> str:
+        return base64.b64encode(bytes(self.registers)).decode('ascii')
+
+    @staticmethod
+    def from_string(value: str) -> 'HyperLogLog':
+        registers = base64.b64decode(value)
+        hll = HyperLogLog(len(registers).bit_length() - 1)
+        hll.registers = bytearray(registers)
+        return hll
+
+
+MINHASH_BANDS = 32
+MINHASH_ROWS = 2  # hashes in a band, playlists with the same hashes in any band are candidates
+MINHASH_SIZE = MINHASH_BANDS * MINHASH_ROWS
+
+minhash_coefficients = []
+
+
+def get_minhash(values) -> bytes:
+    import numpy as np
+
+    values = set(values)
+    if len(values) == 0:
+        return None
+
+    if len(minhash_coefficients) == 0:
+        # the same coefficients in all processes, so that saved signatures stay comparable
+        rnd = random.Random(MINHASH_SIZE)
+        minhash_coefficients.append(np.array([rnd.getrandbits(64) | 1 for i in range(MINHASH_SIZE)], dtype=np.uint64))
+        minhash_coefficients.append(np.array([rnd.getrandbits(64) for i in range(MINHASH_SIZE)], dtype=np.uint64))
+    a, b = minhash_coefficients
+
+    # multiply-shift hashing, products overflow modulo 2^64
+    hashes = np.fromiter((hash64(value) for value in values), dtype=np.uint64, count=len(values))
+    with np.errstate(over='ignore'):
+        permuted = (a[:, None] * hashes[None, :] + b[:, None]) >> np.uint64(32)
+    return permuted.min(axis=1).astype('<u4').tobytes()
+
+
+# estimated jaccard similarity of the sets
+def get_minhash_similarity(a: bytes, b: bytes) -> float:
+    import numpy as np
+
+    return float(np.mean(np.frombuffer(a, dtype='<u4') == np.frombuffer(b, dtype='<u4')))
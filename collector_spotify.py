@@ -0,0 +1,267 @@
+from spoty.plugins.collector.collector_settings import settings, spotify_session_file_name
+
+import click
+import contextlib
+import random
+import re
+import threading
+import time
+
+SPOTIFY_REQUESTS_PER_SEC = settings.COLLECTOR.SPOTIFY_REQUESTS_PER_SEC
+SPOTIFY_REQUESTS_BURST = settings.COLLECTOR.SPOTIFY_REQUESTS_BURST
+SPOTIFY_MAX_RETRIES = settings.COLLECTOR.SPOTIFY_MAX_RETRIES
+# spotify - real api, record - real api with saving all responses to the session file, replay - responses from the file
+SPOTIFY_CLIENT = settings.COLLECTOR.SPOTIFY_CLIENT
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+RETRY_BASE_DELAY_SEC = 1
+RETRY_MAX_DELAY_SEC = 60
+
+spotify_id_pattern = re.compile(r'/[0-9A-Za-z]{22}(?=/|$)')
+
+request_priority = threading.local()
+
+# client used instead of the real spotify api (replayed session or fake)
+offline_client = None
+
+
+class EndpointMetrics:
+    requests: int
+    errors: int
+    retries: int
+    rate_limited: int
+    time: float
+    wait_time: float
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.time = 0
+        self.wait_time = 0
+
+
+class RequestScheduler:
+    requests_per_sec: float
+    capacity: float
+    tokens: float
+    updated: float
+    paused_until: float
+    interactive_waiting: int
+    requests_count: int
+    metrics: dict[str, EndpointMetrics]
+
+    def __init__(self, requests_per_sec: float, burst: int, max_retries: int):
+        self.requests_per_sec = requests_per_sec
+        self.capacity = max(1, burst)
+        self.max_retries = max_retries
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.interactive_waiting = 0
+        self.requests_count = 0
+        self.metrics = {}
+        self.condition = threading.Condition()
+
+    # waits for a token, interactive requests go first
+    def acquire(self, priority: int):
+        with self.condition:
+            if priority == INTERACTIVE:
+                self.interactive_waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.requests_per_sec)
+                    self.updated = now
+
+                    can_take = priority == INTERACTIVE or self.interactive_waiting == 0
+                    if now >= self.paused_until and self.tokens >= 1 and can_take:
+                        self.tokens -= 1
+                        self.requests_count += 1
+                        return
+
+                    if now < self.paused_until:
+                        wait = self.paused_until - now
+                    elif self.tokens < 1:
+                        wait = (1 - self.tokens) / self.requests_per_sec
+                    else:
+                        wait = 0.1
+                    self.condition.wait(wait)
+            finally:
+                if priority == INTERACTIVE:
+                    self.interactive_waiting -= 1
+                    self.condition.notify_all()
+
+    # all requests wait when spotify asks to slow down
+    def pause(self, seconds: float):
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = min(self.tokens, 0)
+            self.condition.notify_all()
+
+    def get_metrics(self, endpoint: str) -> EndpointMetrics:
+        with self.condition:
+            if endpoint not in self.metrics:
+                self.metrics[endpoint] = EndpointMetrics()
+            return self.metrics[endpoint]
+
+    def call(self, endpoint: str, func, *args, **kwargs):
+        metrics = self.get_metrics(endpoint)
+        priority = get_priority()
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            self.acquire(priority)
+            started = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+                self.__record(metrics, started - start, time.monotonic() - started)
+                return result
+            except Exception as e:
+                self.__record(metrics, started - start, time.monotonic() - started)
+
+                status = getattr(e, 'http_status', None)
+                if not is_retryable_error(e) or attempt >= self.max_retries:
+                    with self.condition:
+                        metrics.errors += 1
+                    raise
+
+                delay = min(RETRY_MAX_DELAY_SEC, RETRY_BASE_DELAY_SEC * 2 ** attempt) * random.uniform(0.5, 1)
+                if status == 429:
+                    retry_after = get_retry_after(e)
+                    if retry_after is not None:
+                        delay = retry_after * random.uniform(1, 1.2)
+                    self.pause(delay)
+                else:
+                    time.sleep(delay)
+
+                with self.condition:
+                    metrics.retries += 1
+                    if status == 429:
+                        metrics.rate_limited += 1
+                attempt += 1
+
+    def __record(self, metrics: EndpointMetrics, wait_time: float, request_time: float):
+        with self.condition:
+            metrics.requests += 1
+            metrics.wait_time += wait_time
+            metrics.time += request_time
+
+
+# errors of the server and the network, urllib3 retries are disabled so they are retried by the scheduler
+def is_retryable_error(e: Exception) -> bool:
+    import requests
+
+    if getattr(e, 'http_status', None) in RETRY_STATUSES:
+        return True
+    return isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+scheduler = RequestScheduler(SPOTIFY_REQUESTS_PER_SEC, SPOTIFY_REQUESTS_BURST, SPOTIFY_MAX_RETRIES)
+
+
+def install():
+    from spoty import spotify_api
+
+    if getattr(spotify_api.get_sp, 'scheduled', False):
+        return
+
+    get_sp = spotify_api.get_sp
+
+    # spotify_api calls get_sp() for every request, so the client is patched once when it is created
+    def get_scheduled_sp():
+        if offline_client is None and SPOTIFY_CLIENT == 'replay':
+            import spoty.plugins.collector.collector_client as client
+            use_client(client.create_client(client.SessionReplayer(spotify_session_file_name)))
+        sp = offline_client if offline_client is not None else get_sp()
+        if not getattr(sp, 'scheduled', False):
+            schedule_client(sp)
+        return sp
+
+    get_scheduled_sp.scheduled = True
+    spotify_api.get_sp = get_scheduled_sp
+
+
+def schedule_client(sp):
+    # retries are made by the scheduler, so that Retry-After pauses all requests instead of one thread.
+    # urllib3 retries 429 with Retry-After even without status_forcelist, so its retries are disabled,
+    # connection errors and timeouts are retried by the scheduler too
+    sp.status_forcelist = []
+    sp.retries = 0
+    sp.status_retries = 0
+    sp._build_session()
+
+    internal_call = sp._internal_call
+    if SPOTIFY_CLIENT == 'record' and sp is not offline_client:
+        import spoty.plugins.collector.collector_client as client
+        internal_call = client.SessionRecorder(internal_call, spotify_session_file_name)
+
+    def scheduled_internal_call(method, url, payload, params):
+        return scheduler.call(get_endpoint_name(method, url), internal_call, method, url, payload, params)
+
+    sp._internal_call = scheduled_internal_call
+    sp.scheduled = True
+
+
+def get_priority() -> int:
+    return getattr(request_priority, 'value', INTERACTIVE)
+
+
+def use_client(sp):
+    global offline_client
+    offline_client = sp
+
+
+@contextlib.contextmanager
+def priority(value: int):
+    prev = get_priority()
+    request_priority.value = value
+    try:
+        yield
+    finally:
+        request_priority.value = prev
+
+
+def get_endpoint_name(method: str, url: str):
+    path = url.split('?')[0]
+    if path.startswith('http'):
+        path = path.split('/v1/', 1)[-1]
+    path = spotify_id_pattern.sub('/{id}', '/' + path.strip('/'))
+    return f'{method} {path}'
+
+
+def get_retry_after(e: Exception):
+    headers = getattr(e, 'headers', None) or {}
+    try:
+        return float(headers['Retry-After'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def get_requests_count():
+    return scheduler.requests_count
+
+
+def print_metrics():
+    if len(scheduler.metrics) == 0:
+        click.echo('No Spotify requests were made.')
+        return
+
+    click.echo('---------- Spotify requests ----------')
+    click.echo('requests : errors : retries : 429 : avg ms : avg wait ms : endpoint')
+    total = EndpointMetrics()
+    for endpoint, m in sorted(scheduler.metrics.items(), key=lambda item: item[1].requests, reverse=True):
+        click.echo(f'{m.requests} : {m.errors} : {m.retries} : {m.rate_limited} : '
+                   f'{m.time / max(1, m.requests) * 1000:.0f} : {m.wait_time / max(1, m.requests) * 1000:.0f} : '
+                   f'{endpoint}')
+        total.requests += m.requests
+        total.errors += m.errors
+        total.retries += m.retries
+        total.rate_limited += m.rate_limited
+        total.time += m.time
+    click.echo(f'Total: {total.requests} requests, {total.errors} errors, {total.retries} retries, '
+               f'{total.rate_limited} rate limited, {total.time:.1f} sec')
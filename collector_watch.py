@@ -0,0 +1,377 @@
+from spoty.plugins.collector.collector_settings import settings
+
+import click
+import datetime
+import random
+import time
+from typing import List
+
+WATCH_REQUESTS_PER_HOUR = settings.COLLECTOR.WATCH_REQUESTS_PER_HOUR
+WATCH_UPDATE_INTERVAL_MIN = settings.COLLECTOR.WATCH_UPDATE_INTERVAL_MIN
+WATCH_LIKED_INTERVAL_MIN = settings.COLLECTOR.WATCH_LIKED_INTERVAL_MIN
+WATCH_CACHE_INTERVAL_MIN = settings.COLLECTOR.WATCH_CACHE_INTERVAL_MIN
+WATCH_CACHE_EXPIRED_MIN = settings.COLLECTOR.WATCH_CACHE_EXPIRED_MIN
+WATCH_MAX_BACKOFF_MIN = settings.COLLECTOR.WATCH_MAX_BACKOFF_MIN
+
+# estimated number of requests, used to split the work into chunks that fit the budget
+LIBRARY_PLAYLISTS_REQUESTS = 5  # list of user playlists, fetched once per mirrors update
+MIRROR_UPDATE_REQUESTS = 3  # mirror playlist tracks, adding and removing tracks
+SUB_PLAYLIST_REQUESTS = 2  # snapshot id and tracks of subscribed playlist
+CACHED_PLAYLIST_REQUESTS = 2  # playlist with tracks
+
+# tokens are collected for this time at most, so the requests are spread instead of sent in bursts
+BUDGET_BURST_MIN = 5
+
+MIN_BACKOFF_SEC = 30
+
+
+class SystemClock:
+    def now(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class FakeClock:
+    time: float
+
+    def __init__(self, start: float = 0):
+        self.time = start
+
+    def now(self) -> float:
+        return self.time
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            self.time += seconds
+
+
+class RequestBudget:
+    requests_per_sec: float
+    capacity: float
+    tokens: float
+    updated: float
+    spent: int
+
+    def __init__(self, requests_per_hour: int, clock, burst_min: float = BUDGET_BURST_MIN):
+        self.clock = clock
+        self.requests_per_sec = requests_per_hour / 3600
+        self.capacity = max(1.0, self.requests_per_sec * burst_min * 60)
+        self.tokens = self.capacity
+        self.updated = clock.now()
+        self.spent = 0
+
+    def available(self) -> int:
+        now = self.clock.now()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.requests_per_sec)
+        self.updated = now
+        return int(self.tokens)
+
+    def spend(self, count: int):
+        self.available()
+        self.tokens -= count
+        self.spent += count
+
+    def clear(self):
+        self.available()
+        self.tokens = min(self.tokens, 0)
+
+    # seconds until the specified number of requests will be available
+    def wait_time(self, count: int) -> float:
+        missing = min(count, self.capacity) - self.available()
+        if missing <= 0 or self.requests_per_sec <= 0:
+            return 0
+        return missing / self.requests_per_sec
+
+
+class RateLimitedError(Exception):
+    retry_after: float
+
+    def __init__(self, retry_after: float = None):
+        super().__init__('Rate limited')
+        self.retry_after = retry_after
+
+
+class WatchTask:
+    name: str
+    interval: float
+    min_requests: int
+    next_run: float
+    round_started: float
+
+    def __init__(self, name: str, interval_min: float, min_requests: int = 1):
+        self.name = name
+        self.interval = interval_min * 60
+        self.min_requests = min_requests
+        self.next_run = 0
+        self.round_started = None
+
+    # returns the number of requests made and whether all the work of this round is done
+    def run(self, max_requests: int) -> (int, bool):
+        return 0, True
+
+
+class FuncWatchTask(WatchTask):
+    def __init__(self, name: str, interval_min: float, func, min_requests: int = 1):
+        super().__init__(name, interval_min, min_requests)
+        self.func = func
+
+    def run(self, max_requests: int) -> (int, bool):
+        return self.func(max_requests)
+
+
+class MirrorsUpdateTask(WatchTask):
+    cursor: int
+    remove_empty_mirrors: bool
+    group_name: str
+    full_update: bool
+
+    def __init__(self, name: str, interval_min: float, group_name: str = None, remove_empty_mirrors=True,
+                 full_update=False):
+        super().__init__(name, interval_min, LIBRARY_PLAYLISTS_REQUESTS + MIRROR_UPDATE_REQUESTS)
+        self.group_name = group_name
+        self.remove_empty_mirrors = remove_empty_mirrors
+        self.full_update = full_update
+        self.cursor = 0
+
+    def run(self, max_requests: int) -> (int, bool):
+        import spoty.plugins.collector.collector_plugin as col
+
+        store = col.read_mirrors_store(self.group_name)
+        mirrors = [m for m in store.mirrors.values() if len(m.subscribed_playlist_ids) > 0]
+        if self.cursor >= len(mirrors):
+            self.cursor = 0
+            return 0, True
+
+        # the next mirrors in the mirrors list that fit the budget, continued from the same place next time
+        requests = LIBRARY_PLAYLISTS_REQUESTS
+        chunk = []
+        for m in mirrors[self.cursor:]:
+            cost = MIRROR_UPDATE_REQUESTS + SUB_PLAYLIST_REQUESTS * len(m.subscribed_playlist_ids)
+            if len(chunk) > 0 and requests + cost > max_requests:
+                break
+            chunk.append(m)
+            requests += cost
+
+        self.cursor += len(chunk)
+        ids = [m.subscribed_playlist_ids[0] for m in chunk]
+        col.begin_fetch_scope()
+        col.update(self.remove_empty_mirrors, True, ids, None, True, self.full_update)
+
+        finished = self.cursor >= len(mirrors)
+        if finished:
+            self.cursor = 0
+        return requests, finished
+
+
+# only liked and listened tracks are removed from mirror playlists, subscribed playlists are not read
+class LikedTracksTask(WatchTask):
+    cursor: int
+    remove_empty_mirrors: bool
+    group_name: str
+
+    def __init__(self, name: str, interval_min: float, group_name: str = None, remove_empty_mirrors=True):
+        super().__init__(name, interval_min, LIBRARY_PLAYLISTS_REQUESTS + MIRROR_UPDATE_REQUESTS)
+        self.group_name = group_name
+        self.remove_empty_mirrors = remove_empty_mirrors
+        self.cursor = 0
+
+    def run(self, max_requests: int) -> (int, bool):
+        import spoty.plugins.collector.collector_plugin as col
+        from spoty import spotify_api
+
+        store = col.read_mirrors_store(self.group_name)
+        store.set_library_playlists(spotify_api.get_list_of_playlists())
+        ids = [m.playlist_id for m in store.mirrors.values() if m.playlist_id is not None]
+        if self.cursor >= len(ids):
+            self.cursor = 0
+            return LIBRARY_PLAYLISTS_REQUESTS, True
+
+        count = max(1, (max_requests - LIBRARY_PLAYLISTS_REQUESTS) // MIRROR_UPDATE_REQUESTS)
+        chunk = ids[self.cursor:self.cursor + count]
+        self.cursor += len(chunk)
+        col.begin_fetch_scope()
+        col.process_listened_playlists(chunk, self.remove_empty_mirrors, True, True, True, True)
+
+        finished = self.cursor >= len(ids)
+        if finished:
+            self.cursor = 0
+        return LIBRARY_PLAYLISTS_REQUESTS + len(chunk) * MIRROR_UPDATE_REQUESTS, finished
+
+
+class CacheRefreshTask(WatchTask):
+    expired_min: float
+    # [playlist_id] = time of the last failed refresh
+    failed: dict[str, float]
+
+    def __init__(self, name: str, interval_min: float, expired_min: float):
+        super().__init__(name, interval_min, CACHED_PLAYLIST_REQUESTS)
+        self.expired_min = expired_min
+        self.failed = {}
+
+    def run(self, max_requests: int) -> (int, bool):
+        import spoty.plugins.collector.collector_cache as cache
+
+        # the oldest cached playlists are refreshed first,
+        # playlists that can not be refreshed (deleted or private) are retried only when they expire again
+        now = time.time()
+        expired_date = now - self.expired_min * 60
+        self.failed = {id: date for id, date in self.failed.items() if date >= expired_date}
+        catalog = cache.get_cache_catalog()
+        expired = [(int(v[0]), id) for id, v in catalog.items()
+                   if int(v[0]) < expired_date and id not in self.failed]
+        if len(expired) == 0:
+            return 0, True
+        expired.sort()
+
+        count = max(1, max_requests // CACHED_PLAYLIST_REQUESTS)
+        ids = [id for date, id in expired[:count]]
+        cache.cache_add_by_ids(ids, False, True, False, self.expired_min)
+
+        catalog = cache.get_cache_catalog()
+        for id in ids:
+            if id not in catalog or int(catalog[id][0]) < expired_date:
+                self.failed[id] = now
+
+        return len(ids) * CACHED_PLAYLIST_REQUESTS, len(ids) == len(expired)
+
+
+class WatchScheduler:
+    tasks: List[WatchTask]
+    budget: RequestBudget
+    backoff: float
+    max_backoff: float
+    paused_until: float
+    requests_by_tasks: dict[str, int]
+
+    def __init__(self, tasks: List[WatchTask], requests_per_hour: int, clock=None,
+                 max_backoff_min: float = WATCH_MAX_BACKOFF_MIN, requests_counter=None):
+        self.clock = clock if clock is not None else SystemClock()
+        # when the counter of actually made requests is specified, it is used instead of the estimates of the tasks
+        self.requests_counter = requests_counter
+        self.tasks = tasks
+        self.budget = RequestBudget(requests_per_hour, self.clock)
+        self.backoff = 0
+        self.max_backoff = max_backoff_min * 60
+        self.paused_until = 0
+        self.requests_by_tasks = {}
+        for task in tasks:
+            task.next_run = self.clock.now()
+            self.requests_by_tasks[task.name] = 0
+
+    def run(self, cycles: int = None):
+        cycle = 0
+        while cycles is None or cycle < cycles:
+            self.run_pending()
+            self.clock.sleep(self.get_sleep_time())
+            cycle += 1
+
+    def run_pending(self):
+        now = self.clock.now()
+        if now < self.paused_until:
+            return
+
+        due_tasks = [t for t in self.tasks if t.next_run <= now]
+        due_tasks.sort(key=lambda t: t.next_run)
+
+        for task in due_tasks:
+            available = self.budget.available()
+            if available < task.min_requests:
+                break
+
+            if task.round_started is None:
+                task.round_started = now
+
+            counted = self.requests_counter() if self.requests_counter is not None else 0
+            try:
+                requests, finished = self.__run_task(task, available)
+            except Exception as e:
+                retry_after = get_retry_after(e)
+                if retry_after is None:
+                    echo(f'{task.name} failed: {e}')
+                    self.__finish_round(task)
+                    continue
+                self.__back_off(retry_after)
+                echo(f'Rate limited. Waiting for {int(self.paused_until - now)} sec.')
+                return
+            except SystemExit:
+                self.__finish_round(task)
+                continue
+
+            if self.requests_counter is not None:
+                requests = self.requests_counter() - counted
+
+            self.backoff = 0
+            self.budget.spend(requests)
+            self.requests_by_tasks[task.name] += requests
+
+            if finished:
+                self.__finish_round(task)
+            else:
+                task.next_run = self.clock.now()
+
+    def get_sleep_time(self) -> float:
+        now = self.clock.now()
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        wake = min(t.next_run for t in self.tasks)
+        if wake <= now:
+            # tasks are due but the budget is spent
+            min_requests = min(t.min_requests for t in self.tasks if t.next_run <= now)
+            return max(1.0, self.budget.wait_time(min_requests))
+        return wake - now
+
+    def __run_task(self, task: WatchTask, max_requests: int):
+        if self.requests_counter is None:
+            return task.run(max_requests)
+
+        import spoty.plugins.collector.collector_spotify as spotify
+        with spotify.priority(spotify.BACKGROUND):
+            return task.run(max_requests)
+
+    def __finish_round(self, task: WatchTask):
+        task.next_run = task.round_started + task.interval
+        task.round_started = None
+
+    def __back_off(self, retry_after: float):
+        # exponential backoff with jitter, but not less than the server asked
+        backoff = MIN_BACKOFF_SEC if self.backoff == 0 else self.backoff * 2
+        self.backoff = min(self.max_backoff, backoff)
+        delay = max(retry_after, self.backoff * random.uniform(0.5, 1))
+        self.paused_until = self.clock.now() + delay
+        self.budget.clear()
+
+
+def get_retry_after(e: Exception):
+    if isinstance(e, RateLimitedError):
+        return e.retry_after if e.retry_after is not None else 0
+
+    # spotipy.SpotifyException
+    if getattr(e, 'http_status', None) != 429:
+        return None
+    headers = getattr(e, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After', 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def create_watch_tasks(group_name: str = None, remove_empty_mirrors=True) -> List[WatchTask]:
+    # zero interval disables the task
+    tasks = []
+    if WATCH_UPDATE_INTERVAL_MIN > 0:
+        tasks.append(MirrorsUpdateTask('Mirrors update', WATCH_UPDATE_INTERVAL_MIN, group_name,
+                                       remove_empty_mirrors, False))
+    if WATCH_LIKED_INTERVAL_MIN > 0:
+        tasks.append(LikedTracksTask('Liked tracks processing', WATCH_LIKED_INTERVAL_MIN, group_name,
+                                     remove_empty_mirrors))
+    if WATCH_CACHE_INTERVAL_MIN > 0:
+        tasks.append(CacheRefreshTask('Cache refresh', WATCH_CACHE_INTERVAL_MIN, WATCH_CACHE_EXPIRED_MIN))
+    return tasks
+
+
+def echo(message: str):
+    click.echo(f'[{datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] {message}')